@@ -0,0 +1,72 @@
+"""Per-request cost of LLSIFClient.build_headers().
+
+Compares the old implementation (deepcopy of DEF_HEADERS/DEF_AUTHORIZE on
+every call) with the precompiled HeaderTemplate, including looking the
+template up by the current defaults. Signing is excluded so
+that only header construction is measured.
+
+    python benchmarks/bench_headers.py
+"""
+
+import copy
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llsifclient.client import LLSIFClient  # noqa: E402
+
+
+def legacy_build_headers(client, timestamp, xmessagecode, nonce,
+                         userid=None, token=None):
+    headers = copy.deepcopy(client.DEF_HEADERS)
+    authorize_header = copy.deepcopy(client.DEF_AUTHORIZE)
+
+    authorize_header['timeStamp'] = timestamp
+    authorize_header['nonce'] = nonce
+
+    if token is None:
+        del authorize_header['token']
+    else:
+        authorize_header['token'] = token
+
+    if userid is None:
+        del headers['User-ID']
+    else:
+        headers['User-ID'] = userid
+
+    headers['Authorize'] = '&'.join('{}={}'.format(*item) for
+                                    item in authorize_header.items())
+
+    if xmessagecode is None:
+        del headers['X-Message-Code']
+    else:
+        headers['X-Message-Code'] = xmessagecode
+
+    return headers
+
+
+def main(number=20000):
+    client = LLSIFClient()
+    args = ('1460000000', 'f' * 40, 12, 123456, 'token' * 8)
+
+    legacy = legacy_build_headers(client, *args)
+    compiled = client.header_template().build(args[0], args[2], args[3],
+                                              args[4], args[1])
+    assert list(legacy.items()) == list(compiled.items())
+
+    before = timeit.timeit(lambda: legacy_build_headers(client, *args),
+                           number=number)
+    after = timeit.timeit(
+        lambda: client.header_template().build(args[0], args[2], args[3],
+                                               args[4], args[1]),
+        number=number)
+
+    print('deepcopy:  {:7.2f} us/request'.format(before / number * 1e6))
+    print('template:  {:7.2f} us/request'.format(after / number * 1e6))
+    print('speedup:   {:7.1f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main()
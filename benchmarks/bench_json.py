@@ -0,0 +1,100 @@
+"""Parity check and timing of llsifclient.jsoncodec.
+
+Request bodies are signed over their exact bytes, so the fast backend must
+encode byte-for-byte like the stdlib. This script checks that on a set of
+request bodies (exits non-zero on any difference), checks that decoding
+gives equal objects, and times decoding of a large unitAll-like payload.
+The parity tests run by pytest are in tests/test_jsoncodec.py.
+
+    python benchmarks/bench_json.py
+"""
+
+import json
+import os
+import random
+import sys
+import timeit
+
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llsifclient import jsoncodec  # noqa: E402
+from llsifclient.client import LLSIFClient  # noqa: E402
+from llsifclient.consts import MAIN_ROUTER_MAP  # noqa: E402
+
+
+def request_samples():
+    samples = []
+    for api in MAIN_ROUTER_MAP.values():
+        kwargs = dict((key, random.randrange(10 ** 6)) for key in api.requires or ())
+        samples.append(api.parse(**kwargs))
+        samples.append(api.parse(is_single=False, **kwargs))
+    samples.extend([
+        OrderedDict([('module', 'user'), ('action', 'changeName'),
+                     ('timeStamp', '1460000000'), ('name', name),
+                     ('commandNum', 'key.1460000000.3')])
+        for name in LLSIFClient.DEF_NAMES + ['a"b\\c/d', '\x00\x1f\x7f\n\t',
+                                             '  ', '\U0001f3b5', '%s']])
+    samples.append(OrderedDict([('module', 'unit'), ('action', 'sale'),
+                                ('unit_owning_user_id', list(range(500))),
+                                ('commandNum', None)]))
+    samples.append({'ints': [0, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 64 - 1, 2 ** 64, -2 ** 70],
+                    'bools': [True, False, None], 'nested': [[[{}]], []]})
+    samples.append({'floats': [0.1, 1.0, 1e16, 1e-7, 123456789.125, float('inf')]})
+    samples.append({1: 'non-string key', 'tuple': (1, 2)})
+    samples.append([OrderedDict([('module', m), ('action', a), ('timeStamp', '1')])
+                    for m, a in LLSIFClient.STARTUP_REQUESTS])
+    return samples
+
+
+def unitall_payload(count):
+    units = [OrderedDict([('unit_owning_user_id', 100000000 + i),
+                          ('unit_id', random.randrange(1, 1500)),
+                          ('exp', random.randrange(10 ** 5)),
+                          ('next_exp', 0), ('level', random.randrange(1, 100)),
+                          ('max_level', 100), ('rank', 1), ('max_rank', 2),
+                          ('love', 0), ('max_love', 500),
+                          ('unit_skill_level', 1), ('max_hp', 4),
+                          ('favorite_flag', False), ('display_rank', 1),
+                          ('is_rank_max', False), ('is_love_max', False),
+                          ('is_level_max', False), ('is_skill_level_max', False),
+                          ('insert_date', '2016-04-08 12:00:00')])
+             for i in range(count)]
+    return jsoncodec.dumps_stdlib(
+        {'response_data': [{'result': units, 'status': 200,
+                            'commandNum': False, 'timeStamp': 1460000000}],
+         'status_code': 200})
+
+
+def main():
+    print('JSON backend: {}'.format(jsoncodec.backend))
+
+    failures = 0
+    samples = request_samples()
+    for sample in samples:
+        expected = json.dumps(sample, separators=(',', ':'),
+                              ensure_ascii=False).encode('utf-8')
+        if jsoncodec.dumps(sample) != expected:
+            failures += 1
+            print('ENCODE MISMATCH: {!r}'.format(sample))
+        if jsoncodec.loads(expected) != json.loads(expected.decode('utf-8')):
+            failures += 1
+            print('DECODE MISMATCH: {!r}'.format(sample))
+    print('{} samples, {} mismatches'.format(len(samples), failures))
+
+    for count in (100, 3000):
+        payload = unitall_payload(count)
+        number = max(1, 2000 // count)
+        before = timeit.timeit(lambda: json.loads(payload.decode('utf-8')),
+                               number=number) / number
+        after = timeit.timeit(lambda: jsoncodec.loads(payload),
+                              number=number) / number
+        print('decode {:5d} units ({:7d} bytes): json {:8.2f} ms  {} {:8.2f} ms'.format(
+            count, len(payload), before * 1e3, jsoncodec.backend, after * 1e3))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
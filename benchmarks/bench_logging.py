@@ -0,0 +1,45 @@
+"""CPU spent logging a large response when DEBUG logging is off.
+
+The old api_post_request passed str(respheaders) and str(respbody) to
+logger.debug(), which stringified the body on every call whatever the log
+level. check_http_status() now only does so when DEBUG is enabled.
+
+    python benchmarks/bench_logging.py
+"""
+
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llsifclient.client import LLSIFClient, logger  # noqa: E402
+
+
+def legacy_log_response(respheaders, respbody):
+    logger.debug('Server response headers:')
+    logger.debug(str(respheaders))
+    logger.debug('Server response body:')
+    logger.debug(str(respbody))
+
+
+def main(number=200):
+    logging.basicConfig(level=logging.INFO)
+    client = LLSIFClient()
+    respheaders = [('Content-Type', 'application/json; charset=utf-8'),
+                   ('Content-Encoding', 'gzip')]
+
+    for size in (10 * 1024, 100 * 1024, 500 * 1024):
+        respbody = b'{"response_data":[' + b'{"unit_id":1},' * (size // 14) + b']}'
+        before = timeit.timeit(
+            lambda: legacy_log_response(respheaders, respbody), number=number)
+        after = timeit.timeit(
+            lambda: client.check_http_status(200, respheaders, respbody),
+            number=number)
+        print('{:4d} KiB body: before {:9.2f} us  after {:6.2f} us  per call'.format(
+            size // 1024, before / number * 1e6, after / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
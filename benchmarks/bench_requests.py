@@ -0,0 +1,71 @@
+"""Cost of encoding request bodies for api_multiple_requests().
+
+Compares the old deepcopy/KeyError based encoding with the RequestTemplate
+based one on the 22-call startup bundle and on the three dictionary
+requests of rewardlist_all(), and checks both give the same bytes.
+
+    python benchmarks/bench_requests.py
+"""
+
+import copy
+import json
+import os
+import sys
+import timeit
+
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llsifclient.client import LLSIFClient  # noqa: E402
+
+
+def legacy_encode_multiple_requests(requests, timestamp):
+    requestdata = []
+
+    for request in requests:
+        try:
+            requestdata.append(OrderedDict([('module', request[0]),
+                                            ('action', request[1]),
+                                            ('timeStamp', timestamp)]))
+        except KeyError:
+            temprequest = copy.deepcopy(request)
+            if 'timeStamp' in temprequest:
+                temprequest['timeStamp'] = timestamp
+            requestdata.append(temprequest)
+
+    requestjson = json.dumps(requestdata, separators=(',', ':'),
+                             ensure_ascii=False)
+    return requestjson.encode('utf-8')
+
+
+def rewardlist_requests():
+    return [OrderedDict([('module', 'reward'),
+                         ('action', 'rewardList'),
+                         ('timeStamp', None),
+                         ('order', 0),
+                         ('filter', [0]),
+                         ('category', cat)]) for cat in range(0, 3)]
+
+
+def bench(name, client, requests, number):
+    new, timestamp = client.encode_multiple_requests(requests)
+    assert new == legacy_encode_multiple_requests(requests, timestamp)
+
+    before = timeit.timeit(
+        lambda: legacy_encode_multiple_requests(requests, timestamp),
+        number=number)
+    after = timeit.timeit(lambda: client.encode_multiple_requests(requests),
+                          number=number)
+    print('{:<16} before {:7.2f} us  after {:7.2f} us  ({:.1f}x)'.format(
+        name, before / number * 1e6, after / number * 1e6, before / after))
+
+
+def main(number=5000):
+    client = LLSIFClient()
+    bench('startup bundle', client, client.STARTUP_REQUESTS, number)
+    bench('rewardlist_all', client, rewardlist_requests(), number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Cost of X-Message-Code signing and verification per round-trip.
+
+"before" is the old way: hmac.new() with the key for every message, and
+the response verified after the whole body was read. "after" signs with
+the precomputed MessageSigner and feeds the response to a verifier in the
+64 KiB chunks the decoder produces. "sampled" verifies one response in ten
+(VERIFY_RATE = 0.1).
+
+    python benchmarks/bench_signing.py
+"""
+
+import hashlib
+import hmac
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llsifclient.decoding import READ_CHUNK_SIZE  # noqa: E402
+from llsifclient.settings import HMAC_SIGNITURE_KEY  # noqa: E402
+from llsifclient.signing import MessageSigner  # noqa: E402
+
+REQUEST = b'[{"module":"user","action":"userInfo","timeStamp":"1460000000"}]'
+
+
+def legacy_round_trip(response, code):
+    hmac.new(HMAC_SIGNITURE_KEY, REQUEST, hashlib.sha1).hexdigest()
+    return hmac.new(HMAC_SIGNITURE_KEY, response,
+                    hashlib.sha1).hexdigest() == code
+
+
+def signer_round_trip(signer, chunks, code, rate=1.0):
+    signer.sign(REQUEST)
+    if rate < 1 and random.random() >= rate:
+        return True
+    verifier = signer.verifier()
+    for chunk in chunks:
+        verifier.update(chunk)
+    return signer.matches(verifier.hexdigest(), code)
+
+
+def main():
+    signer = MessageSigner(HMAC_SIGNITURE_KEY)
+
+    for size in (0, 1024, 10 * 1024, 100 * 1024, 1024 * 1024):
+        response = os.urandom(size)
+        code = signer.sign(response)
+        chunks = [response[i:i + READ_CHUNK_SIZE]
+                  for i in range(0, size, READ_CHUNK_SIZE)]
+        assert legacy_round_trip(response, code)
+        assert signer_round_trip(signer, chunks, code)
+
+        number = max(20, 20000000 // (size + 1000))
+        before = timeit.timeit(lambda: legacy_round_trip(response, code),
+                               number=number) / number
+        after = timeit.timeit(lambda: signer_round_trip(signer, chunks, code),
+                              number=number) / number
+        sampled = timeit.timeit(
+            lambda: signer_round_trip(signer, chunks, code, 0.1),
+            number=number) / number
+        print('{:5d} KiB response: before {:8.2f} us  after {:8.2f} us  '
+              'sampled {:8.2f} us'.format(size // 1024, before * 1e6,
+                                          after * 1e6, sampled * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""End-to-end benchmarks of LLSIFClient workflows against the mock server.
+
+Workflows:
+    startapp          startapp() of a fresh account
+    register          register_new_account()
+    drain             rewardlist_all() and draining the present box
+                      with batched reward/open calls
+    unit_and_deck     unit_and_deck()
+    multirecruit      multirecruit() of 10 members
+
+The mock server runs in its own process, with 200 units and 200 presents
+per account (unitAll is about 80 KiB). Each workflow runs in a fresh
+process, with think time switched off. Only the workflow itself is
+measured; logging in first is not. For each workflow it reports:
+    requests_per_second   HTTP requests completed per second of wall time
+    cpu_ms_per_request    client CPU time per request
+    peak_rss_kib          peak RSS of the process running the workflow
+    alloc_kib_per_session peak of Python allocations during one run
+    alloc_kib_per_request the same, per request
+    response_kib_per_request  decoded response bytes per request
+
+--transport runs the workflows on another transport engine (see
+llsifclient.transport) to compare engines.
+
+Results are compared with benchmarks/baselines/workflows.json. The script
+exits with status 1 if a workflow is slower or uses more memory than its
+baseline by more than --tolerance. Baselines depend on the machine, so
+regenerate them with --save before comparing on a new one.
+
+    python benchmarks/bench_workflows.py
+    python benchmarks/bench_workflows.py --save
+    python benchmarks/bench_workflows.py --only startapp drain
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llsifclient.client import LLSIFClient  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baselines',
+                        'workflows.json')
+
+# metric -> True if higher is better
+METRICS = {'requests_per_second': True,
+           'cpu_ms_per_request': False,
+           'peak_rss_kib': False,
+           'alloc_kib_per_session': False}
+
+# mock server options giving the payload sizes of a mid-sized account
+SERVER_ARGS = ['--units', '200', '--presents', '200']
+
+
+class BenchClient(LLSIFClient):
+    '''LLSIFClient without think time, counting requests and bytes.'''
+
+    requests = 0
+    response_bytes = 0
+
+    def think(self, low, high):
+        pass
+
+    def record_exchange(self, url, headers, requestbody, status,
+                        respheaders, respbody):
+        BenchClient.requests += 1
+        BenchClient.response_bytes += len(respbody)
+
+
+def login(client):
+    client.start_session()
+    client.login(*client.gen_new_credentials())
+
+
+def run_startapp(client):
+    client.startapp(*client.gen_new_credentials())
+
+
+def run_register(client):
+    client.register_new_account(*client.gen_new_credentials())
+
+
+def run_drain(client):
+    client.rewardlist_all()
+    for _ in client.drain_present_box(open_all=False):
+        pass
+
+
+def run_unit_and_deck(client):
+    client.unit_and_deck()
+
+
+def run_multirecruit(client):
+    client.multirecruit(10, 1, 1)
+
+
+# name -> (setup, run, iterations)
+WORKFLOWS = {
+    'startapp': (None, run_startapp, 30),
+    'register': (None, run_register, 20),
+    'drain': (login, run_drain, 20),
+    'unit_and_deck': (login, run_unit_and_deck, 100),
+    'multirecruit': (login, run_multirecruit, 100),
+}
+
+
+def measure(name, host, engine='stdlib'):
+    '''Run a workflow in this process and return its results.'''
+
+    BenchClient.SERVER_HOST = host
+    BenchClient.TRANSPORT = engine
+    setup, run, iterations = WORKFLOWS[name]
+
+    def session():
+        client = BenchClient()
+        if setup is not None:
+            setup(client)
+        return client
+
+    # warm up connections, caches and imports
+    run(session())
+
+    requests = response_bytes = 0
+    wall = cpu = 0.0
+    for _ in range(iterations):
+        client = session()
+        before = (BenchClient.requests, BenchClient.response_bytes)
+        started, cpu_started = time.perf_counter(), time.process_time()
+        run(client)
+        wall += time.perf_counter() - started
+        cpu += time.process_time() - cpu_started
+        requests += BenchClient.requests - before[0]
+        response_bytes += BenchClient.response_bytes - before[1]
+
+    client = session()
+    before = BenchClient.requests
+    tracemalloc.start()
+    run(client)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    traced_requests = BenchClient.requests - before
+
+    return {'requests_per_second': round(requests / wall, 1),
+            'cpu_ms_per_request': round(cpu * 1000 / requests, 3),
+            'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'alloc_kib_per_session': round(peak / 1024, 1),
+            'alloc_kib_per_request': round(peak / 1024 / traced_requests, 1),
+            'response_kib_per_request': round(
+                response_bytes / 1024 / requests, 1),
+            'requests_per_session': round(requests / iterations, 1)}
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server():
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'llsifclient.mockserver', '--port', str(port)] +
+        SERVER_ARGS, cwd=os.path.join(os.path.dirname(__file__), '..'),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError('Mock server did not start')
+            time.sleep(0.05)
+    return server, '127.0.0.1:{}'.format(port)
+
+
+def compare(results, baseline, tolerance):
+    '''Return the regressions of results against baseline.'''
+
+    regressions = []
+    for name, result in sorted(results.items()):
+        for metric, higher_is_better in sorted(METRICS.items()):
+            if metric not in baseline.get(name, {}):
+                continue
+            old, new = baseline[name][metric], result[metric]
+            if higher_is_better:
+                regressed = new < old * (1 - tolerance)
+            else:
+                regressed = new > old * (1 + tolerance)
+            if regressed:
+                regressions.append('{} {}: {} -> {}'.format(name, metric,
+                                                            old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--only', nargs='+', choices=sorted(WORKFLOWS),
+                        help='workflows to run')
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression (default 0.25)')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--transport', default='stdlib',
+                        help='transport engine (default stdlib)')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--host', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.run:
+        print(json.dumps(measure(args.run, args.host, args.transport)))
+        return 0
+
+    server, host = start_server()
+    results = {}
+    try:
+        for name in args.only or sorted(WORKFLOWS):
+            output = subprocess.check_output(
+                [sys.executable, __file__, '--run', name, '--host', host,
+                 '--transport', args.transport])
+            results[name] = json.loads(output.decode('utf-8').splitlines()[-1])
+            print('{:<14} {:8.1f} req/s  {:6.3f} ms CPU/req  {:7d} KiB RSS  '
+                  '{:8.1f} KiB alloc/session  {:6.1f} KiB/resp'.format(
+                      name, results[name]['requests_per_second'],
+                      results[name]['cpu_ms_per_request'],
+                      results[name]['peak_rss_kib'],
+                      results[name]['alloc_kib_per_session'],
+                      results[name]['response_kib_per_request']))
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved baseline to {}'.format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline at {}; run with --save'.format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""asyncio version of LLSIFClient.
+
+AsyncLLSIFClient has the same methods as LLSIFClient, but every method that
+talks to the server is a coroutine. Header building, signing and response
+checks are inherited from LLSIFClient; only the I/O is replaced, so a single
+event loop can drive many sessions at once:
+
+    async def daily(loginkey, loginpasswd):
+        client = AsyncLLSIFClient()
+        await client.startapp(loginkey, loginpasswd)
+        await client.lbonus()
+
+    await asyncio.gather(*[daily(*cred) for cred in credentials])
+
+Methods that do nothing but forward to api_single_request() or
+api_multiple_requests() are not overridden: since those two are coroutines
+here, the inherited methods return an awaitable. save_session() is a
+coroutine as well, writing to SESSION_STORE in an executor.
+
+Calls awaited concurrently can be bundled into one multi-request, see
+batch() and COALESCE_WINDOW:
+
+    async with client.batch():
+        userinfo, tosstate = await asyncio.gather(client.userinfo(),
+                                                  client.toscheck())
+"""
+
+import asyncio
+import contextlib
+import logging
+import random
+import socket
+
+from . import aioconn
+from . import decoding
+from .batching import RequestBatch, is_batchable
+from .client import LLSIFClient
+from .inventory import UnitInventory
+from .planner import PlanResult, plan_units
+from .replay import AsyncRecordingPool
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLLSIFClient(LLSIFClient):
+    """Love Live School Idol Festival client class for asyncio."""
+
+    # Seconds to wait for more calls to bundle with a call that can go in a
+    # multi-request. None sends calls as they come, except inside batch().
+    COALESCE_WINDOW = None
+    # Transport engine; it must be an asyncio one
+    TRANSPORT = 'async'
+    recording_pool_class = AsyncRecordingPool
+    asynchronous = True
+
+    def __init__(self):
+        super().__init__()
+        self._coalescing = 0
+        self._flush_handle = None
+        self._flush_task = None
+
+    async def start_session(self):
+        logger.info('Start new session')
+
+        self.reset_session()
+
+        respobj = await self.api_single_request(None, '/main.php/login/authkey')
+
+        self.handle_authkey_response(respobj)
+
+        return respobj
+
+    async def login(self, login_key, login_passwd):
+        logger.info('Logging in')
+
+        requestdata = self.login_request_data(login_key, login_passwd)
+
+        respobj = await self.api_single_request(requestdata, '/main.php/login/login')
+
+        self.handle_login_response(respobj, login_key)
+
+        return respobj
+
+    async def register_new_account(self, newloginkey, newloginpasswd,
+                                   nickname=None, leader=None):
+        logger.info('Creating new account')
+
+        await self.start_session()
+        await self.register_new_login(newloginkey, newloginpasswd)
+        await self.start_without_invite(newloginkey, newloginpasswd)
+
+        await self.start_session()
+        await self.login(newloginkey, newloginpasswd)
+        await self.userinfo()
+        tosstate = await self.toscheck()
+
+        # Insert wait here: changing name and agreeing to TOS
+        self.think(1, 3)
+
+        if not tosstate['response_data']['is_agreed']:
+            await self.tosagree(tosstate['response_data']['tos_id'])
+        await self.changename(random.choice(self.DEF_NAMES))
+        await self.tutorialprogress(1)
+
+        await self.startup_api_calls()
+
+        await self.unit_and_deck()
+
+        unitlist = await self.login_unitlist()
+        available_units = [x['unit_initial_set_id'] for
+                           x in unitlist['response_data']['unit_initial_set']]
+
+        # Insert wait here: selecting leader
+        self.think(3, 5)
+
+        if leader not in available_units:
+            leader = random.choice(available_units)
+        await self.login_unitselect(leader)
+        await self.tutorialskip()
+
+        unitinfo = await self.unit_and_deck()
+        mergebase, mergepartners, rankuppartner = \
+            self.tutorial_practice_units(unitinfo)
+        await self.unitmerge(mergebase, mergepartners)
+
+        await self.tutorialskip()
+
+        await self.unitrankup(mergebase, rankuppartner)
+
+        await self.tutorialskip()
+
+        return (newloginkey, newloginpasswd)
+
+    async def account_from_transfer_code(self, newloginkey, newloginpasswd,
+                                         transfercode):
+        logger.info('Creating account from transfer code')
+        logger.debug('Transfer code: %s', transfercode)
+
+        await self.start_session()
+        await self.register_new_login(newloginkey, newloginpasswd)
+        await self.start_without_invite(newloginkey, newloginpasswd)
+
+        await self.start_session()
+        await self.login(newloginkey, newloginpasswd)
+        await self.userinfo()
+        await self.toscheck()
+
+        # Insert wait here: inputting transfer code
+        self.think(1, 3)
+
+        transferstate = await self.use_transfer_code(transfercode)
+        self.check_transfer_response(transferstate)
+
+        return (newloginkey, newloginpasswd)
+
+    async def resume(self, loginkey, loginpasswd):
+        if self.restore_session(loginkey):
+            try:
+                await self.userinfo()
+            except self.TokenRejected:
+                logger.info('Saved session rejected, starting over')
+                self.SESSION_STORE.delete(self.SERVER_HOST, loginkey)
+            else:
+                await self.save_session()
+                return True
+
+        await self.startapp(loginkey, loginpasswd)
+        await self.save_session()
+        return False
+
+    async def save_session(self):
+        await asyncio.get_running_loop().run_in_executor(
+            None, super().save_session)
+
+    async def startapp(self, loginkey, loginpasswd):
+        await self.start_session()
+        await self.login(loginkey, loginpasswd)
+
+        if self.BATCH_STARTAPP:
+            async with self.batch():
+                userinfo, _, tosstate = await asyncio.gather(
+                    self.userinfo(), self.personalnotice(), self.toscheck())
+        else:
+            userinfo = await self.userinfo()
+            await self.personalnotice()
+            tosstate = await self.toscheck()
+
+        if not tosstate['response_data']['is_agreed']:
+            # Insert wait here: agreeing to TOS
+            self.think(1, 3)
+            await self.tosagree(tosstate['response_data']['tos_id'])
+
+        if self.BATCH_STARTAPP:
+            async with self.batch():
+                connectstate, _ = await asyncio.gather(
+                    self.checkconnectedaccount(), self.lbonus())
+        else:
+            connectstate = await self.checkconnectedaccount()
+            await self.lbonus()
+
+        await self.handle_webview_get_request('/webview.php/announce/index?0=')
+        self.session['wv_header'] = None
+
+        allinfo = await self.startup_api_calls()
+
+        return (userinfo, allinfo, connectstate)
+
+    async def register_new_login(self, newloginkey, newloginpasswd):
+        logger.info('Registering new credentials on server')
+        logger.debug('New login_key: %s', newloginkey)
+        logger.debug('New login_passwd: %s', newloginpasswd)
+
+        requestdata = self.login_request_data(newloginkey, newloginpasswd)
+
+        respobj = await self.api_single_request(requestdata, '/main.php/login/startUp')
+
+        self.handle_register_response(respobj, newloginkey, newloginpasswd)
+
+        return respobj
+
+    async def userinfo(self):
+        logger.info('Acquiring user info')
+
+        respobj = await self.api_single_request(('user', 'userInfo'))
+
+        self.check_userinfo_response(respobj)
+
+        return respobj
+
+    async def personalnotice(self):
+        logger.info('Personal Notice')
+
+        respobj = await self.api_single_request(('personalnotice', 'get'))
+
+        self.check_personalnotice_response(respobj)
+
+        return respobj
+
+    async def sell_and_merge(self, policy, batch_size=10):
+        logger.info('Selling and merging units')
+
+        inventory = self.inventory
+        if inventory is None:
+            inventory = UnitInventory.from_response(await self.unit_and_deck())
+        elif not inventory or inventory.stale:
+            await self.unit_and_deck()
+
+        plan = plan_units(inventory, policy)
+        logger.info('Unit plan: %s', plan.summary())
+
+        result = PlanResult()
+        for requests in plan.batches(batch_size):
+            result.check(requests, await self.api_multiple_requests(requests))
+            if not result.ok:
+                logger.error('Unit plan stopped: %s', result.summary())
+                break
+
+        return result
+
+    async def api_single_request(self, request, url=None):
+        respobj = self.cached_response(request)
+        if respobj is not None:
+            return respobj
+
+        window = self.coalesce_window()
+        if window is not None:
+            if is_batchable(request, url):
+                return await self.coalesce(request, window)
+            await self.flush_batch()
+
+        url, requestdata, timestamp = self.encode_single_request(request, url)
+
+        respstatus, respheaders, respbody, respobj = await self.api_post_request(
+            url, requestdata=requestdata, timestamp=timestamp)
+
+        self.update_cache(request, respobj)
+
+        return respobj
+
+    @contextlib.asynccontextmanager
+    async def batch(self, enabled=True):
+        '''Bundle the calls awaited concurrently in the block.
+
+        Calls started together, e.g. with asyncio.gather(), are sent as one
+        multi-request. Calls awaited one after another are still sent one
+        by one. Calls that can not be bundled, like login, are sent on
+        their own, after the calls queued before them.'''
+
+        if not enabled:
+            yield
+            return
+        self._coalescing += 1
+        try:
+            yield
+        finally:
+            self._coalescing -= 1
+        await self.flush_batch()
+
+    def coalesce_window(self):
+        '''Seconds to wait for calls to bundle, or None to not bundle.'''
+
+        if self.COALESCE_WINDOW is not None:
+            return self.COALESCE_WINDOW
+        return 0 if self._coalescing else None
+
+    def coalesce(self, request, window):
+        '''Queue request for the next multi-request. Returns a future of
+        its response.'''
+
+        loop = asyncio.get_running_loop()
+        if self._batch is None:
+            self._batch = RequestBatch()
+            self._flush_handle = loop.call_later(window, self._start_flush)
+        return self._batch.add(request, loop.create_future())
+
+    def _start_flush(self):
+        self._flush_handle = None
+        # Keep a reference, the event loop only keeps a weak one
+        self._flush_task = asyncio.ensure_future(self._flush_queued())
+
+    async def _flush_queued(self):
+        try:
+            await self.flush_batch()
+        except Exception:
+            # Already passed on to the callers of the batched requests
+            pass
+
+    async def flush_batch(self):
+        batch, self._batch = self._batch, None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not batch:
+            return
+
+        logger.debug('Sending %d batched requests', len(batch))
+        try:
+            respobj = await self.api_multiple_requests(batch.requests)
+        except BaseException as exc:
+            batch.fail(exc)
+            raise
+        batch.fan_out(respobj)
+
+    async def api_multiple_requests(self, requests, url='/main.php/api'):
+        requests, cached = self.split_cached(requests)
+
+        respobj = None
+        if not requests or len(cached) < len(requests):
+            requestdata, timestamp = self.encode_multiple_requests(
+                [x for i, x in enumerate(requests) if i not in cached])
+
+            respstatus, respheaders, respbody, respobj = await self.api_post_request(
+                url, requestdata=requestdata, timestamp=timestamp)
+
+        return self.merge_cached(requests, cached, respobj)
+
+    async def api_post_request(self, url, requestdata=None, timestamp=None):
+        with self.request_timing(url) as timing:
+            headers, requestbody = self.begin_post_request(requestdata,
+                                                           timestamp, timing)
+            pool = self.connection_pool(self.READ_TIMEOUT)
+
+            attempt = 0
+            while True:
+                attempt += 1
+                await self.pace()
+                self.begin_attempt(attempt, timing)
+                try:
+                    httpconn, httpresp = await pool.urlopen('POST', url, headers,
+                                                            requestbody, timing)
+
+                    logger.debug('Receiving from server')
+
+                    verifier = self.response_verifier(httpresp)
+                    try:
+                        respbody = await decoding.read_body_async(
+                            httpresp, self.MAX_RESPONSE_SIZE, verifier, timing)
+                    except BaseException:
+                        httpconn.close()
+                        raise
+
+                    if self.end_attempt(url, headers, requestbody, pool,
+                                        httpconn, httpresp, respbody, timing):
+                        break
+                except self.retry_policy.RETRYABLE_ERRORS as exc:
+                    logger.info('HTTP request failed: %r', exc)
+                except BaseException:
+                    self.retry_policy.end(attempt, False)
+                    raise
+
+                self.schedule_retry(attempt)
+
+            response = self.end_post_request(attempt, httpresp, respbody,
+                                             verifier, timing)
+        if self.stage_session():
+            # SQLite writes block; keep them off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.SESSION_STORE.flush)
+        return response
+
+    def shared_objects(self):
+        '''Return the objects this client shares with other clients,
+        including the connection pools of every event loop.'''
+
+        shared = super().shared_objects()
+        for loop_pools in list(aioconn._pools.values()):
+            shared.extend(list(loop_pools.values()))
+        return shared
+
+    async def pace(self):
+        delay = self.scheduler.delay(self.SERVER_HOST)
+        while delay > 0:
+            logger.debug('Waiting %.2f seconds before next request', delay)
+            await asyncio.sleep(delay)
+            delay = self.scheduler.delay(self.SERVER_HOST)
+
+    async def handle_webview_get_request(self, url):
+        headers = self.build_webview_headers()
+
+        pool = self.connection_pool(self.WEBVIEW_TIMEOUT)
+
+        with self.request_timing(url) as timing:
+            await self.pace()
+            if timing is not None:
+                timing.mark('queue')
+            try:
+                httpconn, httpresp = await pool.urlopen('GET', url, headers,
+                                                        timing=timing)
+
+                try:
+                    respbody = await httpresp.read()
+                except BaseException:
+                    httpconn.close()
+                    raise
+
+                return self.end_webview_request(pool, httpconn, httpresp,
+                                                respbody, timing)
+            except socket.timeout:
+                return (504, [], b'')
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import socket
+import time
+import weakref
+
+from collections import deque
+
+from .connpool import AdaptiveTimeout
+
+logger = logging.getLogger(__name__)
+
+# Counterpart of connpool.STALE_CONNECTION_ERRORS for asyncio streams.
+STALE_CONNECTION_ERRORS = (
+    asyncio.IncompleteReadError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+async def _with_timeout(coro, timeout):
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        raise socket.timeout('timed out')
+
+
+class AsyncHTTPResponse(object):
+    '''Minimal HTTP/1.1 response read from an asyncio stream.
+
+    Mirrors the parts of http.client.HTTPResponse used by LLSIFClient:
+    status, getheader(), getheaders(), will_close, and read() (which is a
+    coroutine here).'''
+
+    def __init__(self, reader, timeout):
+        self._reader = reader
+        self._timeout = timeout
+        self.status = None
+        self.version = None
+        self._headers = []
+        self.will_close = False
+
+    async def begin(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                raise asyncio.IncompleteReadError(line, None)
+            version, status, _ = (line.decode('latin-1').rstrip('\r\n') + ' ').split(' ', 2)
+            self.version = version
+            self.status = int(status)
+            self._headers = await self._read_headers()
+            # Skip informational responses like 100 Continue
+            if self.status >= 200:
+                break
+
+        connection = (self.getheader('Connection') or '').lower()
+        if self.version == 'HTTP/1.0':
+            self.will_close = connection != 'keep-alive'
+        else:
+            self.will_close = connection == 'close'
+        if self.getheader('Content-Length') is None and \
+                not self._is_chunked() and not self._no_body():
+            self.will_close = True
+
+    async def _read_headers(self):
+        headers = []
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip(), value.strip()))
+
+    def _is_chunked(self):
+        return (self.getheader('Transfer-Encoding') or '').lower() == 'chunked'
+
+    def _no_body(self):
+        return self.status in (204, 304) or 100 <= self.status < 200
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        values = [v for k, v in self._headers if k.lower() == name]
+        if not values:
+            return default
+        return ', '.join(values)
+
+    def getheaders(self):
+        return list(self._headers)
+
+    async def read(self):
+        '''Read the complete response body.'''
+
+        return b''.join([chunk async for chunk in self.iter_chunks()])
+
+    async def iter_chunks(self, size=64 * 1024):
+        '''Yield the response body in chunks of at most size bytes.'''
+
+        if self._no_body():
+            return
+        if self._is_chunked():
+            while True:
+                line = await _with_timeout(self._reader.readline(), self._timeout)
+                remaining = int(line.split(b';', 1)[0].strip(), 16)
+                if remaining == 0:
+                    await _with_timeout(self._read_headers(), self._timeout)  # trailers
+                    return
+                while remaining:
+                    chunk = await self._read_exactly(min(size, remaining))
+                    remaining -= len(chunk)
+                    yield chunk
+                await self._read_exactly(2)
+        length = self.getheader('Content-Length')
+        if length is not None:
+            remaining = int(length)
+            while remaining:
+                chunk = await self._read_exactly(min(size, remaining))
+                remaining -= len(chunk)
+                yield chunk
+            return
+        while True:
+            chunk = await _with_timeout(self._reader.read(size), self._timeout)
+            if not chunk:
+                return
+            yield chunk
+
+    async def _read_exactly(self, n):
+        return await _with_timeout(self._reader.readexactly(n), self._timeout)
+
+
+class AsyncHTTPConnection(object):
+    '''A single HTTP/1.1 connection over asyncio streams.'''
+
+    def __init__(self, host, timeout=10, connect_timeout=None):
+        self.host = host
+        self.timeout = timeout
+        self.connect_timeout = timeout if connect_timeout is None \
+            else connect_timeout
+        hostname, _, port = host.rpartition(':')
+        if hostname and port.isdigit():
+            self._addr = (hostname, int(port))
+        else:
+            self._addr = (host, 80)
+        self.reader = None
+        self.writer = None
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        logger.debug('Opening new connection to %s', self.host)
+        self.reader, self.writer = await _with_timeout(
+            asyncio.open_connection(*self._addr), self.connect_timeout)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    def is_stale(self):
+        '''Return True if an idle connection can not be reused.'''
+
+        return self.writer is None or self.writer.is_closing() or \
+            self.reader.at_eof()
+
+    async def request(self, method, url, headers, body=None, timing=None):
+        '''Send a request and return the response with the body unread.
+
+        body is bytes or a list of buffers, as for
+        connpool.HTTPConnectionPool.urlopen().'''
+
+        if self.writer is None:
+            await self.connect()
+            if timing is not None:
+                timing.mark('connect')
+
+        lines = ['{} {} HTTP/1.1'.format(method, url), 'Host: ' + self.host]
+        for headeritem in headers.items():
+            lines.append('{}: {}'.format(headeritem[0], headeritem[1]))
+        buffers = [('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')]
+        if isinstance(body, list):
+            buffers.extend(body)
+        elif body is not None:
+            buffers.append(body)
+        self.writer.writelines(buffers)
+        await _with_timeout(self.writer.drain(), self.timeout)
+        if timing is not None:
+            timing.mark('send')
+
+        httpresp = AsyncHTTPResponse(self.reader, self.timeout)
+        await _with_timeout(httpresp.begin(), self.timeout)
+        if timing is not None:
+            timing.mark('wait')
+        return httpresp
+
+
+class AsyncHTTPConnectionPool(object):
+    '''asyncio counterpart of connpool.HTTPConnectionPool.
+
+    Must only be used from the event loop it was created on.'''
+
+    def __init__(self, host, timeout=10, maxsize=4, connect_timeout=None,
+                 adaptive=None):
+        self.host = host
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.adaptive = adaptive
+        self.maxsize = maxsize
+        self._idle = deque()
+
+    def _new_conn(self):
+        return AsyncHTTPConnection(self.host, self.timeout,
+                                   self.connect_timeout)
+
+    async def _request(self, conn, method, url, headers, body, timing):
+        if self.adaptive is None:
+            return await conn.request(method, url, headers, body, timing)
+        conn.timeout = self.adaptive.timeout()
+        started = time.perf_counter()
+        try:
+            httpresp = await conn.request(method, url, headers, body, timing)
+        except socket.timeout:
+            self.adaptive.expired()
+            raise
+        self.adaptive.observe(time.perf_counter() - started)
+        return httpresp
+
+    def get(self):
+        '''Check out a connection, reusing an idle one if possible.'''
+
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.is_stale():
+                return conn
+            logger.debug('Discarding stale connection to %s', self.host)
+            conn.close()
+        return self._new_conn()
+
+    def put(self, conn):
+        '''Return a connection to the pool, or close it if the pool is full.'''
+
+        if conn.connected and len(self._idle) < self.maxsize:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    def release(self, conn, httpresp):
+        '''Return conn after httpresp has been read completely.'''
+
+        if httpresp.will_close:
+            conn.close()
+        else:
+            self.put(conn)
+
+    def clear(self):
+        '''Close all idle connections.'''
+
+        while self._idle:
+            self._idle.pop().close()
+
+    async def urlopen(self, method, url, headers, body=None, timing=None):
+        '''Send a request and return (conn, httpresp) with the body unread.
+
+        Same reconnect rules as connpool.HTTPConnectionPool.urlopen().'''
+
+        conn = self.get()
+        reused = conn.connected
+        try:
+            return conn, await self._request(conn, method, url, headers, body,
+                                             timing)
+        except STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+            logger.debug('Kept-alive connection to %s was closed, reconnecting',
+                         self.host)
+        except BaseException:
+            conn.close()
+            raise
+
+        conn = self._new_conn()
+        try:
+            return conn, await self._request(conn, method, url, headers, body,
+                                             timing)
+        except BaseException:
+            conn.close()
+            raise
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_pool(host, timeout=10, maxsize=4, connect_timeout=None,
+             adaptive=False):
+    '''Return the pool for (host, timeouts) on the running event loop.
+
+    The first caller decides maxsize.'''
+
+    loop_pools = _pools.setdefault(asyncio.get_running_loop(), {})
+    key = (host, timeout, connect_timeout, adaptive)
+    pool = loop_pools.get(key)
+    if pool is None:
+        pool = loop_pools[key] = AsyncHTTPConnectionPool(
+            host, timeout, maxsize, connect_timeout,
+            AdaptiveTimeout(timeout) if adaptive else None)
+    return pool
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import time
+import json
 import logging
 
 from collections import OrderedDict
@@ -8,6 +9,9 @@ from collections import OrderedDict
 logger = logging.getLogger(__name__)
 
 
+BASE_KEYS = ('module', 'action', 'timeStamp', 'commandNum')
+
+
 class LLSIFAPI(object):
     def __init__(self, module, action, requires=None, options=None, excludes=None):
         self.module = module
@@ -15,12 +19,64 @@ class LLSIFAPI(object):
         self.requires = requires
         self.options = options
         self.excludes = excludes
+        for keys in (requires, options, excludes):
+            assert keys is None or isinstance(keys, list)
+        self._compile()
+
+    def _compile(self):
+        excludes = frozenset(self.excludes or ())
+        self._required_set = frozenset(self.requires or ())
+        # (key, '"key":', required) of the members added from kwargs, in
+        # parse() order; a key listed more than once keeps its first place
+        self._members = []
+        seen = set(excludes)
+        for key in (self.requires or []) + (self.options or []):
+            if key not in seen:
+                seen.add(key)
+                self._members.append((key, dumps_compact(key) + ':',
+                                      key in self._required_set))
+
+        # Overriding module/action/timeStamp/commandNum through kwargs changes
+        # the member order in ways not worth compiling; serialize() falls
+        # back to parse() then.
+        self._compiled = self._required_set.isdisjoint(BASE_KEYS) and \
+            frozenset(self.options or ()).isdisjoint(BASE_KEYS)
+
+        # is_single -> (format string of the leading members, has timeStamp)
+        self._base = {}
+        for is_single in (True, False):
+            members = []
+            has_timestamp = False
+            for key in BASE_KEYS:
+                if key in excludes or key == 'commandNum' and not is_single:
+                    continue
+                if key == 'timeStamp':
+                    members.append(None)
+                    has_timestamp = True
+                elif key == 'commandNum':
+                    members.append('"commandNum":null')
+                else:
+                    value = self.module if key == 'module' else self.action
+                    members.append('{}:{}'.format(dumps_compact(key), dumps_compact(value)))
+            if has_timestamp:
+                base = ','.join('"timeStamp":%d' if member is None else
+                                member.replace('%', '%%') for member in members)
+            else:
+                base = ','.join(members)
+            self._base[is_single] = (base, has_timestamp)
 
     @property
     def uri(self):
         return '/main.php/{}/{}'.format(self.module, self.action)
 
+    def _check_required(self, kwargs):
+        if not self._required_set.issubset(kwargs):
+            for key in self.requires:
+                if key not in kwargs:
+                    raise LLSIFAPIException('Required Key {} not included.'.format(key))
+
     def parse(self, is_single=True, **kwargs):
+        self._check_required(kwargs)
         res = {
             'module': self.module,
             'action': self.action,
@@ -30,24 +86,98 @@ class LLSIFAPI(object):
         if not is_single:
             del res['commandNum']
         if self.requires is not None:
-            assert isinstance(self.requires, list)
             for key in self.requires:
-                if key not in kwargs:
-                    raise LLSIFAPIException('Required Key {} not included.'.format(key))
                 res[key] = kwargs[key]
         if self.options is not None:
-            assert isinstance(self.options, list)
             for key in self.options:
                 if key in kwargs:
                     res[key] = kwargs[key]
         if self.excludes is not None:
-            assert isinstance(self.excludes, list)
             for key in self.excludes:
                 if key in res:
                     del res[key]
-        logger.debug('module: {}, action: {}, parse result: {}'.format(self.module, self.action, res))
+        logger.debug('module: %s, action: %s, parse result: %s', self.module, self.action, res)
         return res
 
+    def serialize(self, is_single=True, **kwargs):
+        """Return the request body as compact JSON bytes.
+
+        Same bytes as json.dumps(self.parse(is_single, **kwargs),
+        separators=(',', ':'), ensure_ascii=False).encode('utf-8'), without
+        building the intermediate dict."""
+
+        if not self._compiled:
+            return dumps_compact(self.parse(is_single, **kwargs)).encode('utf-8')
+
+        self._check_required(kwargs)
+        base, has_timestamp = self._base[is_single]
+        members = [base % int(time.time()) if has_timestamp else base] if base else []
+        for key, prefix, required in self._members:
+            if required or key in kwargs:
+                members.append(prefix + dumps_compact(kwargs[key]))
+        return ('{' + ','.join(members) + '}').encode('utf-8')
+
+
+class RequestTemplate(object):
+    """Immutable request body with timeStamp and commandNum filled per call.
+
+    The JSON text of the body is encoded once into a format string with the
+    timeStamp and commandNum values left as slots. encode() only fills the
+    slots, and gives the same text as json.dumps() of the filled-in body
+    with the client's separators.
+    """
+
+    __slots__ = ('items', 'timestamp_index', 'commandnum_index', '_format',
+                 '_commandnum_default')
+
+    def __init__(self, items):
+        self.items = tuple(items)
+        keys = [item[0] for item in self.items]
+        self.timestamp_index = keys.index('timeStamp') if 'timeStamp' in keys else None
+        self.commandnum_index = keys.index('commandNum') if 'commandNum' in keys else None
+
+        members = []
+        for index, (key, value) in enumerate(self.items):
+            if index == self.timestamp_index or index == self.commandnum_index:
+                members.append(dumps_compact(key).replace('%', '%%') + ':%s')
+            else:
+                members.append('{}:{}'.format(dumps_compact(key), dumps_compact(value))
+                               .replace('%', '%%'))
+        self._format = '{' + ','.join(members) + '}'
+        if self.commandnum_index is not None:
+            self._commandnum_default = dumps_compact(self.items[self.commandnum_index][1])
+
+    def encode(self, timestamp, commandnum=None):
+        """Return the JSON text with timeStamp and commandNum filled in.
+
+        timestamp is the decimal timestamp string, which needs no escaping.
+        commandnum replaces the value of commandNum if given."""
+
+        if self.commandnum_index is None:
+            if self.timestamp_index is None:
+                return self._format % ()
+            return self._format % ('"' + timestamp + '"')
+        if commandnum is None:
+            commandnum = self._commandnum_default
+        else:
+            commandnum = dumps_compact(commandnum)
+        if self.timestamp_index is None:
+            return self._format % (commandnum,)
+        if self.timestamp_index < self.commandnum_index:
+            return self._format % ('"' + timestamp + '"', commandnum)
+        return self._format % (commandnum, '"' + timestamp + '"')
+
+
+_compact_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def dumps_compact(obj):
+    """json.dumps() with the separators and escaping used for request bodies."""
+
+    if type(obj) is int:
+        return int.__repr__(obj)
+    return _compact_encoder.encode(obj)
+
 
 class LLSIFAPIException(Exception):
     pass
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Bundling of single API calls into /main.php/api multi-requests.
+
+LLSIFClient.batch() queues the calls made inside a with block and sends
+them together when the block ends:
+
+    with client.batch():
+        userinfo = client.userinfo()
+        notice = client.personalnotice()
+    userinfo = userinfo.result()
+
+AsyncLLSIFClient coalesces calls that are awaited concurrently instead,
+see AsyncLLSIFClient.batch() and COALESCE_WINDOW.
+
+Each caller gets the response it would have got from a single request,
+{"response_data": ..., "status_code": ...}, cut out of the multi-request's
+response.
+"""
+
+from collections import OrderedDict
+
+
+def is_batchable(request, url=None):
+    '''True if a request for api_single_request() can go in a multi-request.
+
+    Requests to a specific url (login, startUp, ...) and requests without
+    module and action can not.'''
+
+    if url is not None or request is None:
+        return False
+    if isinstance(request, (tuple, list)):
+        return True
+    return 'module' in request and 'action' in request
+
+
+def single_response(entry):
+    '''Convert an entry of a multi-request's response_data to the response
+    of a single request.'''
+
+    return OrderedDict([('response_data', entry.get('result')),
+                        ('status_code', entry.get('status', 200))])
+
+
+def resolve(value):
+    '''Return the result of a future, or value itself if it is not one.'''
+
+    if hasattr(value, 'add_done_callback'):
+        return value.result()
+    return value
+
+
+class RequestBatch(object):
+    '''Requests waiting to be sent together, with the futures of their
+    callers.
+
+    Works with concurrent.futures.Future and asyncio.Future alike.'''
+
+    def __init__(self):
+        self.requests = []
+        self.futures = []
+
+    def __len__(self):
+        return len(self.requests)
+
+    def add(self, request, future):
+        self.requests.append(request)
+        self.futures.append(future)
+        return future
+
+    def fan_out(self, respobj):
+        '''Give every caller its part of the multi-request's response.
+
+        If the server rejected the multi-request as a whole, every caller
+        gets the whole response.'''
+
+        entries = respobj.get('response_data') if respobj is not None else None
+        if isinstance(entries, list) and len(entries) == len(self.futures):
+            for future, entry in zip(self.futures, entries):
+                if not future.done():
+                    future.set_result(single_response(entry))
+        else:
+            for future in self.futures:
+                if not future.done():
+                    future.set_result(respobj)
+
+    def fail(self, exc):
+        '''Raise exc to every caller still waiting.'''
+
+        for future in self.futures:
+            if not future.done():
+                future.set_exception(exc)
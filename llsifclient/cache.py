@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Cache of API results that rarely change.
+
+Results are cached per (module, action). Each cacheable call has a
+CacheRule: how long its result stays fresh, and whether it is the same
+for every account (GLOBAL, shared by all clients using the cache) or
+specific to one (USER, keyed by user_id). Calls that change state drop
+the cached results they make stale, see DEFAULT_INVALIDATIONS.
+
+    LLSIFClient.RESPONSE_CACHE = ResponseCache()
+    # optionally, don't even ask the server for fresh cached results
+    LLSIFClient.SKIP_CACHED = True
+
+Cached results are shared between clients and must be treated as read-only.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+GLOBAL = 'global'
+USER = 'user'
+
+
+class CacheRule(object):
+    '''How long the result of a call stays fresh, and who it applies to.'''
+
+    __slots__ = ('ttl', 'scope')
+
+    def __init__(self, ttl, scope=USER):
+        if scope not in (GLOBAL, USER):
+            raise ValueError('Unknown cache scope {}'.format(scope))
+        self.ttl = ttl
+        self.scope = scope
+
+
+# Read-only calls of the startup bundle worth caching
+DEFAULT_RULES = {
+    ('payment', 'productList'): CacheRule(600, GLOBAL),
+    ('banner', 'bannerList'): CacheRule(600, GLOBAL),
+    ('live', 'schedule'): CacheRule(300, GLOBAL),
+    ('album', 'albumAll'): CacheRule(3600, USER),
+    ('background', 'backgroundInfo'): CacheRule(3600, USER),
+    ('award', 'awardInfo'): CacheRule(3600, USER),
+    ('unit', 'unitAll'): CacheRule(600, USER),
+    ('unit', 'deckInfo'): CacheRule(600, USER),
+}
+
+# (module, action) of a mutating call -> cached calls it makes stale
+DEFAULT_INVALIDATIONS = {
+    ('unit', 'merge'): (('unit', 'unitAll'), ('album', 'albumAll')),
+    ('unit', 'rankUp'): (('unit', 'unitAll'), ('album', 'albumAll')),
+    ('unit', 'sale'): (('unit', 'unitAll'), ('unit', 'deckInfo')),
+    ('unit', 'favorite'): (('unit', 'unitAll'),),
+    ('unit', 'deck'): (('unit', 'deckInfo'),),
+    ('secretbox', 'pon'): (('unit', 'unitAll'), ('album', 'albumAll')),
+    ('secretbox', 'multi'): (('unit', 'unitAll'), ('album', 'albumAll')),
+    ('reward', 'open'): (('unit', 'unitAll'), ('album', 'albumAll'),
+                         ('background', 'backgroundInfo'),
+                         ('award', 'awardInfo')),
+    ('reward', 'openAll'): (('unit', 'unitAll'), ('album', 'albumAll'),
+                            ('background', 'backgroundInfo'),
+                            ('award', 'awardInfo')),
+    ('login', 'unitSelect'): (('unit', 'unitAll'), ('unit', 'deckInfo'),
+                              ('album', 'albumAll')),
+    ('live', 'reward'): (('unit', 'unitAll'), ('album', 'albumAll')),
+}
+
+
+class ResponseCache(object):
+    '''Thread-safe cache of API results.
+
+    At most maxsize results are kept; the ones closest to expiring are
+    dropped first.'''
+
+    def __init__(self, rules=None, invalidations=None, maxsize=100000):
+        self.rules = dict(DEFAULT_RULES if rules is None else rules)
+        self.invalidations = dict(DEFAULT_INVALIDATIONS if invalidations is None
+                                  else invalidations)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # (module, action, user_id or None) -> (expiry time, result)
+        self._entries = {}
+        # heap of (expiry time, sequence number, key); entries that were
+        # replaced or dropped stay in it until they reach the top
+        self._expiries = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, module, action, userid):
+        rule = self.rules.get((module, action))
+        if rule is None:
+            return None, None
+        if rule.scope == GLOBAL:
+            return (module, action, None), rule
+        if userid is None:
+            return None, None
+        return (module, action, userid), rule
+
+    def cacheable(self, module, action):
+        return (module, action) in self.rules
+
+    def get(self, module, action, userid=None):
+        '''Return the fresh cached result of a call, or None.'''
+
+        key, rule = self._key(module, action, userid)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def put(self, module, action, userid, result):
+        key, rule = self._key(module, action, userid)
+        if key is None:
+            return
+        expiry = time.monotonic() + rule.ttl
+        with self._lock:
+            self._entries[key] = (expiry, result)
+            heapq.heappush(self._expiries,
+                           (expiry, next(self._sequence), key))
+            if len(self._entries) > self.maxsize:
+                self._evict()
+            elif len(self._expiries) > 2 * len(self._entries) + 64:
+                self._compact()
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            expiry, _, key = heapq.heappop(self._expiries)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == expiry:
+                del self._entries[key]
+
+    def _compact(self):
+        self._expiries = [(entry[0], next(self._sequence), key)
+                          for key, entry in self._entries.items()]
+        heapq.heapify(self._expiries)
+
+    def invalidate(self, module, action, userid=None):
+        '''Drop the cached result of a call.'''
+
+        key, rule = self._key(module, action, userid)
+        if key is not None:
+            with self._lock:
+                self._entries.pop(key, None)
+
+    def observe(self, module, action, userid, result):
+        '''Record the successful result of a call.
+
+        Drops the results the call makes stale, and caches its own result
+        if it is cacheable.'''
+
+        for stale in self.invalidations.get((module, action), ()):
+            self.invalidate(stale[0], stale[1], userid)
+        self.put(module, action, userid, result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            del self._expiries[:]
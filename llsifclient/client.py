@@ -7,7 +7,8 @@ codes, logging in to existing accounts, free and premium drawing and some
 deck management.
 
 Note this class is not usable out of the box. At the very least, you have to
-provide the correct gen_xmessagecode() function. You should also make sure
+provide the correct HMAC key for X-Message-Code as HMAC_SIGNITURE_KEY in
+local_settings.py. You should also make sure
 Client-Version matches with the server, otherwise you will be prompted to
 "update".
 Look for # CUSTOMIZATION in the source code.
@@ -30,20 +31,31 @@ To simulate launching the game client, do something like:
     client = LLSIFClient()
     userinfo, allinfo, connst = client.startapp(loginkey, loginpasswd)
 
+To skip logging in again after a restart, save sessions to disk:
+    LLSIFClient.SESSION_STORE = SessionStore('sessions.db')
+    client = LLSIFClient()
+    client.resume(loginkey, loginpasswd)
+
 """
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import contextlib
 import time
 import logging
-import http.client
 import socket
-import zlib
-import json
 import re
 import copy
 import random
 
-from . import gen_xmessagecode
+from . import connpool
+from . import decoding
+from . import footprint
+from . import headers
+from . import jsoncodec
+from . import ratelimit
+from . import signing
+from . import transport
 
 from .consts import (
     IOS_HEADER,
@@ -52,13 +64,29 @@ from .consts import (
     AUTHORIZE_BASE,
     AUTHORIZE_BASE_AUTHKEY,
     AUTHORIZE_BASE_WEBVIEW,
-    SPECIAL_ROUTER_MAP,
-    MAIN_ROUTER_MAP,
 )
+from .api import RequestTemplate
+from .batching import RequestBatch, is_batchable, resolve
+from .inventory import UnitInventory
+from .planner import PlanResult, plan_units
+from .presentbox import PresentBoxDrain
+from .headers import get_template
+from .ratelimit import RequestScheduler
+from .replay import RecordingPool
+from .retry import RetryPolicy
+from .sessionstate import SessionState
+from .settings import HMAC_SIGNITURE_KEY
 
 
 logger = logging.getLogger(__name__)
 
+# (module, action, single) -> RequestTemplate for (module, action) requests
+_TUPLE_TEMPLATES = {}
+
+# Part header of request_data, after the boundary line
+_MULTIPART_DISPOSITION = \
+    b'\r\nContent-Disposition: form-data; name="request_data"\r\n\r\n'
+
 
 class NewLLSIFClient(object):
 
@@ -89,6 +117,68 @@ class LLSIFClient(object):
 
     # Constants
     SERVER_HOST = 'prod-jp.lovelive.ge.klabgames.net'
+    # Transport engine, see transport.TRANSPORTS; not an asyncio one
+    TRANSPORT = 'stdlib'
+    # Maximum number of idle keep-alive connections kept per host
+    POOL_MAXSIZE = 4
+    # Seconds to wait for a connection, for API responses and for webview
+    # pages. With ADAPTIVE_TIMEOUT, the read timeouts follow the server's
+    # response times instead, never exceeding these.
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 10
+    WEBVIEW_TIMEOUT = 20
+    ADAPTIVE_TIMEOUT = False
+    # Maximum size of a (gunzipped) response body in bytes
+    MAX_RESPONSE_SIZE = 64 * 1024 * 1024
+    # Number of recent request/response pairs kept in memory and logged
+    # when a request fails. With 0 nothing is kept, and payloads are logged
+    # at DEBUG level instead.
+    CAPTURE_SIZE = 0
+    # Key of the X-Message-Code HMAC
+    HMAC_KEY = HMAC_SIGNITURE_KEY
+    # Fraction of responses whose X-Message-Code is checked
+    VERIFY_RATE = 1.0
+    # Request rate limits in requests per second, None for no limit. The
+    # host limit is shared by all clients in the process.
+    SESSION_RATE = None
+    SESSION_BURST = 1
+    HOST_RATE = None
+    HOST_BURST = 10
+    # cache.ResponseCache for results of read-only calls, None to disable.
+    # Set on the class to share it between clients. With SKIP_CACHED,
+    # calls whose cached result is fresh are not sent to the server.
+    RESPONSE_CACHE = None
+    SKIP_CACHED = False
+    # Bundle the independent calls of startapp() into multi-requests. The
+    # real game client does not do this.
+    BATCH_STARTAPP = False
+    # Keep self.inventory, an inventory.UnitInventory of the account's
+    # units, up to date from the results of unit calls. Off by default;
+    # without it sell_and_merge() fetches the units every time.
+    TRACK_INVENTORY = False
+    # sessionstore.SessionStore to save sessions in for resume(), None to
+    # disable. Set on the class to share it between clients. The session is
+    # staged in it after every successful API request that changed the token
+    # or counters, and written with other staged sessions at most every
+    # SessionStore.flush_interval seconds; see stage_session().
+    SESSION_STORE = None
+    # metrics.RequestMetrics to record the per-phase timing of requests in,
+    # None to disable. Set on the class to share it between clients.
+    METRICS = None
+    # replay.CaptureWriter to record every exchange with the server in, and
+    # replay.ReplayPool to answer requests from a capture instead of the
+    # server. None to disable.
+    RECORDER = None
+    REPLAY = None
+    # Wrapper of the connection pool recording exchanges in RECORDER
+    recording_pool_class = RecordingPool
+    # Whether the client needs a transport engine for asyncio
+    asynchronous = False
+    # Keep the session state in a sessionstate.SessionState instead of a
+    # dict, and do not keep the last response around. For processes with
+    # thousands of clients; see memory_footprint(). TRACK_INVENTORY still
+    # keeps an inventory per client.
+    LOW_MEMORY = False
     DEF_HEADERS = OrderedDict([
         ('Accept', '*/*'),
         ('Accept-Encoding', 'gzip,deflate'),
@@ -119,6 +209,29 @@ class LLSIFClient(object):
                       3: 'G',
                       4: 'Loveca stone',
                       5: 'Assist Voucher'}
+    # The "startup" API bundle, see startup_api_calls()
+    STARTUP_REQUESTS = (('login', 'topInfo'),
+                        ('live', 'liveStatus'),
+                        ('live', 'schedule'),
+                        ('marathon', 'marathonInfo'),
+                        ('login', 'topInfoOnce'),
+                        ('unit', 'unitAll'),
+                        ('unit', 'deckInfo'),
+                        ('payment', 'productList'),
+                        ('scenario', 'scenarioStatus'),
+                        ('subscenario', 'subscenarioStatus'),
+                        ('user', 'showAllItem'),
+                        ('battle', 'battleInfo'),
+                        ('banner', 'bannerList'),
+                        ('notice', 'noticeMarquee'),
+                        ('festival', 'festivalInfo'),
+                        ('eventscenario', 'status'),
+                        ('navigation', 'specialCutin'),
+                        ('album', 'albumAll'),
+                        ('award', 'awardInfo'),
+                        ('background', 'backgroundInfo'),
+                        ('online', 'info'),
+                        ('challenge', 'challengeInfo'))
     DEF_NAMES = '''幻の学院生 明るい学院生 期待の学院生 純粋な学院生 素直な学院生
         元気な学院生 天然な学院生 勇敢な学院生 気になる学院生 真面目な学院生
         不思議な学院生 癒し系な学院生 心優しい学院生 さわやかな学院生
@@ -145,10 +258,28 @@ class LLSIFClient(object):
             return 'error_code: {:d}, status_code: {:d}'.format(
                 self.error_code, self.status_code)
 
+    class TokenRejected(LLSIFError, RuntimeError):
+        '''Exception raised when the server answers 403 Forbidden, e.g. to
+        an expired authorize_token.'''
+        pass
+
     def __init__(self):
-        self.session = {'loginkey': None, 'userid': None, 'token': None,
-                        'nonce': 0, 'commandnum': 0, 'wv_header': None,
-                        'last_command': None, 'last_login': None}
+        if self.LOW_MEMORY:
+            self.session = SessionState()
+        else:
+            self.session = {'loginkey': None, 'userid': None, 'token': None,
+                            'nonce': 0, 'commandnum': 0, 'wv_header': None,
+                            'last_command': None, 'last_login': None}
+        self._batch = None
+        # what stage_session() last staged
+        self._staged_session = None
+        self.inventory = UnitInventory() if self.TRACK_INVENTORY else None
+        transport.check_transport(self.TRANSPORT, self.asynchronous)
+        self.signer = signing.get_signer(self.HMAC_KEY)
+        self.retry_policy = RetryPolicy()
+        self.scheduler = RequestScheduler(self.SESSION_RATE, self.SESSION_BURST,
+                                          self.HOST_RATE, self.HOST_BURST)
+        self.capture = deque(maxlen=self.CAPTURE_SIZE) if self.CAPTURE_SIZE else None
 
     def start_session(self):
         '''Start new session by obtaining authorize_token from server.
@@ -158,7 +289,17 @@ class LLSIFClient(object):
 
         logger.info('Start new session')
 
-        # Reset self.session
+        self.reset_session()
+
+        respobj = self.api_single_request(None, '/main.php/login/authkey')
+
+        self.handle_authkey_response(respobj)
+
+        return respobj
+
+    def reset_session(self):
+        '''Forget the current session state.'''
+
         self.session['loginkey'] = None
         self.session['userid'] = None
         self.session['token'] = None
@@ -167,15 +308,16 @@ class LLSIFClient(object):
         self.session['wv_header'] = None
         self.session['last_command'] = None
         self.session['last_login'] = None
+        if self.inventory is not None:
+            self.inventory.clear()
 
-        respobj = self.api_single_request(None, '/main.php/login/authkey')
+    def handle_authkey_response(self, respobj):
+        '''Save the authorize_token returned by /login/authkey.'''
 
         self.session['token'] = respobj['response_data']['authorize_token']
         logger.info('Acquired auth token from server')
         logger.debug(self.session['token'])
 
-        return respobj
-
     def login(self, login_key, login_passwd):
         '''Login to server with login_key and login_password.
 
@@ -187,11 +329,25 @@ class LLSIFClient(object):
 
         logger.info('Logging in')
 
+        requestdata = self.login_request_data(login_key, login_passwd)
+
+        respobj = self.api_single_request(requestdata, '/main.php/login/login')
+
+        self.handle_login_response(respobj, login_key)
+
+        return respobj
+
+    def login_request_data(self, login_key, login_passwd):
+        '''Request data for /login/login and /login/startUp.'''
+
         requestdata = OrderedDict([('login_key', login_key),
                                    ('login_passwd', login_passwd)])
         # CUSTOMIZATION: Optionally, also include ('devtoken', GCM registration ID)
 
-        respobj = self.api_single_request(requestdata, '/main.php/login/login')
+        return requestdata
+
+    def handle_login_response(self, respobj, login_key):
+        '''Check the response to /login/login and update the session.'''
 
         # sanity checks
         if respobj['status_code'] != 200:
@@ -215,8 +371,6 @@ class LLSIFClient(object):
         self.session['commandnum'] = 1
         self.session['last_login'] = time.time()
 
-        return respobj
-
     def lbonus(self):
         '''Get and retrieve information about daily login bonuses.'''
 
@@ -296,8 +450,7 @@ class LLSIFClient(object):
         tosstate = self.toscheck()
 
         # Insert wait here: changing name and agreeing to TOS
-        logger.debug('Sleep for a bit...')
-        time.sleep(random.uniform(1, 3))
+        self.think(1, 3)
 
         if not tosstate['response_data']['is_agreed']:
             self.tosagree(tosstate['response_data']['tos_id'])
@@ -313,8 +466,7 @@ class LLSIFClient(object):
                            x in unitlist['response_data']['unit_initial_set']]
 
         # Insert wait here: selecting leader
-        logger.debug('Sleep for a bit...')
-        time.sleep(random.uniform(3, 5))
+        self.think(3, 5)
 
         if leader not in available_units:
             leader = random.choice(available_units)
@@ -322,21 +474,29 @@ class LLSIFClient(object):
         self.tutorialskip()
 
         unitinfo = self.unit_and_deck()
-        mergebase = unitinfo['response_data'][0]['result'][0]['unit_owning_user_id']
-        mergepartners = [unitinfo['response_data'][0]
-                                 ['result'][10]['unit_owning_user_id']]
+        mergebase, mergepartners, rankuppartner = \
+            self.tutorial_practice_units(unitinfo)
         self.unitmerge(mergebase, mergepartners)
 
         self.tutorialskip()
 
-        rankupbase = mergebase
-        rankuppartner = unitinfo['response_data'][0]['result'][9]['unit_owning_user_id']
-        self.unitrankup(rankupbase, rankuppartner)
+        self.unitrankup(mergebase, rankuppartner)
 
         self.tutorialskip()
 
         return (newloginkey, newloginpasswd)
 
+    def tutorial_practice_units(self, unitinfo):
+        '''Pick the units the tutorial uses for practice and awakening.
+
+        unitinfo is the response to unit_and_deck() right after selecting
+        the leader. Returns (base, merge partners, rank-up partner).'''
+
+        units = unitinfo['response_data'][0]['result']
+        return (units[0]['unit_owning_user_id'],
+                [units[10]['unit_owning_user_id']],
+                units[9]['unit_owning_user_id'])
+
     def account_from_transfer_code(self, newloginkey, newloginpasswd,
                                    transfercode):
         '''Start a new game account by using a transfer code.
@@ -356,20 +516,86 @@ class LLSIFClient(object):
         self.toscheck()
 
         # Insert wait here: inputting transfer code
-        logger.debug('Sleep for a bit...')
-        time.sleep(random.uniform(1, 3))
+        self.think(1, 3)
 
         transferstate = self.use_transfer_code(transfercode)
+        self.check_transfer_response(transferstate)
+
+        return (newloginkey, newloginpasswd)
+
+    def check_transfer_response(self, transferstate):
+        '''Raise LLSIFAPIError if using a transfer code failed.'''
 
         if transferstate['status_code'] != 200:
             logger.error('Using transfer code failed')
-            logger.error(str(transferstate))
+            logger.error('%s', transferstate)
             if transferstate['response_data']['error_code'] == 4402:
                 logger.error('Transfer code incorrect')
             raise self.LLSIFAPIError(transferstate['response_data']['error_code'],
                                      transferstate['status_code'])
 
-        return (newloginkey, newloginpasswd)
+    def resume(self, loginkey, loginpasswd):
+        '''Continue the saved session of an account, or start the game.
+
+        With SESSION_STORE, the token and counters of the last successful
+        request of the session that was flushed to it are restored, and
+        checked with a single userInfo call. If there is no saved session
+        or the server rejects it, startapp() is run.
+
+        Returns True if the saved session was resumed.'''
+
+        if self.restore_session(loginkey):
+            try:
+                self.userinfo()
+            except self.TokenRejected:
+                logger.info('Saved session rejected, starting over')
+                self.SESSION_STORE.delete(self.SERVER_HOST, loginkey)
+            else:
+                self.save_session()
+                return True
+
+        self.startapp(loginkey, loginpasswd)
+        self.save_session()
+        return False
+
+    def restore_session(self, loginkey):
+        '''Load the session of loginkey from SESSION_STORE.
+
+        Returns True if there was one.'''
+
+        if self.SESSION_STORE is None:
+            return False
+        saved = self.SESSION_STORE.load(self.SERVER_HOST, loginkey)
+        if saved is None:
+            return False
+        self.reset_session()
+        self.session.update(saved)
+        self.session['loginkey'] = loginkey
+        logger.info('Restored saved session of user %s', saved['userid'])
+        return True
+
+    def save_session(self):
+        '''Save the current session in SESSION_STORE now, if there is one.'''
+
+        if self.SESSION_STORE is not None and self.session['token'] is not None:
+            self.SESSION_STORE.save(self.SERVER_HOST, self.session)
+
+    def stage_session(self):
+        '''Stage the current session in SESSION_STORE if its token or
+        counters changed since it was last staged.
+
+        Called after every successful API request. Returns True if the
+        store is due to be flushed.'''
+
+        store = self.SESSION_STORE
+        if store is None or self.session['token'] is None:
+            return False
+        staged = (self.session['loginkey'], self.session['token'],
+                  self.session['nonce'], self.session['commandnum'])
+        if staged == self._staged_session:
+            return False
+        self._staged_session = staged
+        return store.stage(self.SERVER_HOST, self.session)
 
     def startapp(self, loginkey, loginpasswd):
         '''Simulate starting the game client.
@@ -382,18 +608,22 @@ class LLSIFClient(object):
         self.start_session()
         self.login(loginkey, loginpasswd)
 
-        userinfo = self.userinfo()
-        self.personalnotice()
+        with self.batch(self.BATCH_STARTAPP):
+            userinfo = self.userinfo()
+            self.personalnotice()
+            tosstate = self.toscheck()
+        userinfo = resolve(userinfo)
+        tosstate = resolve(tosstate)
 
-        tosstate = self.toscheck()
         if not tosstate['response_data']['is_agreed']:
             # Insert wait here: agreeing to TOS
-            logger.debug('Sleep for a bit...')
-            time.sleep(random.uniform(1, 3))
+            self.think(1, 3)
             self.tosagree(tosstate['response_data']['tos_id'])
 
-        connectstate = self.checkconnectedaccount()
-        self.lbonus()
+        with self.batch(self.BATCH_STARTAPP):
+            connectstate = self.checkconnectedaccount()
+            self.lbonus()
+        connectstate = resolve(connectstate)
 
         self.handle_webview_get_request('/webview.php/announce/index?0=')
         self.session['wv_header'] = None
@@ -413,12 +643,17 @@ class LLSIFClient(object):
         logger.debug('New login_key: %s', newloginkey)
         logger.debug('New login_passwd: %s', newloginpasswd)
 
-        requestdata = OrderedDict([('login_key', newloginkey),
-                                   ('login_passwd', newloginpasswd)])
-        # CUSTOMIZATION: Optionally, also include ('devtoken', GCM registration ID)
+        requestdata = self.login_request_data(newloginkey, newloginpasswd)
 
         respobj = self.api_single_request(requestdata, '/main.php/login/startUp')
 
+        self.handle_register_response(respobj, newloginkey, newloginpasswd)
+
+        return respobj
+
+    def handle_register_response(self, respobj, newloginkey, newloginpasswd):
+        '''Check the response to /login/startUp and update the session.'''
+
         if respobj['status_code'] != 200:
             raise RuntimeError('/login/startUp returned status_code: %d',
                                respobj['status_code'])
@@ -434,8 +669,6 @@ class LLSIFClient(object):
         self.session['commandnum'] = 1
         self.session['last_login'] = time.time()
 
-        return respobj
-
     def start_without_invite(self, loginkey, loginpasswd):
         '''Start new account from scratch.
 
@@ -460,12 +693,17 @@ class LLSIFClient(object):
 
         respobj = self.api_single_request(('user', 'userInfo'))
 
+        self.when_done(respobj, self.check_userinfo_response)
+
+        return respobj
+
+    def check_userinfo_response(self, respobj):
+        '''Warn if /user/userInfo is about a different user.'''
+
         if respobj['response_data']['user']['user_id'] != self.session['userid']:
             logger.warning('/user/userInfo returned different user_id %s',
                            respobj['response_data']['user']['user_id'])
 
-        return respobj
-
     def toscheck(self):
         '''Check TOS agreement state.'''
 
@@ -543,7 +781,7 @@ class LLSIFClient(object):
     def login_unitselect(self, unit):
         '''Select among new account starting units.'''
 
-        logger.info('Selecting unit %s', str(unit))
+        logger.info('Selecting unit %s', unit)
 
         requestdata = OrderedDict([('module', 'login'),
                                    ('action', 'unitSelect'),
@@ -612,6 +850,36 @@ class LLSIFClient(object):
 
         return respobj
 
+    def sell_and_merge(self, policy, batch_size=10):
+        '''Merge and sell units in bulk as a planner.UnitPolicy says.
+
+        The units are fetched first unless self.inventory is up to date.
+        The unit/merge and unit/sale calls are sent batch_size at a time in
+        multi-requests, stopping at the first one that fails or whose
+        result does not match the units sent.
+
+        Returns a planner.PlanResult.'''
+
+        logger.info('Selling and merging units')
+
+        inventory = self.inventory
+        if inventory is None:
+            inventory = UnitInventory.from_response(self.unit_and_deck())
+        elif not inventory or inventory.stale:
+            self.unit_and_deck()
+
+        plan = plan_units(inventory, policy)
+        logger.info('Unit plan: %s', plan.summary())
+
+        result = PlanResult()
+        for requests in plan.batches(batch_size):
+            result.check(requests, self.api_multiple_requests(requests))
+            if not result.ok:
+                logger.error('Unit plan stopped: %s', result.summary())
+                break
+
+        return result
+
     def personalnotice(self):
         '''Not sure what this does.
 
@@ -622,12 +890,17 @@ class LLSIFClient(object):
 
         respobj = self.api_single_request(('personalnotice', 'get'))
 
-        if respobj['response_data']['has_notice']:
-            logger.warning('Personal notice:')
-            logger.warning(str(respobj))
+        self.when_done(respobj, self.check_personalnotice_response)
 
         return respobj
 
+    def check_personalnotice_response(self, respobj):
+        '''Log the personal notice, if there is one.'''
+
+        if respobj['response_data']['has_notice']:
+            logger.warning('Personal notice:')
+            logger.warning('%s', respobj)
+
     def startup_api_calls(self):
         '''Execute the "startup" API bundle.
 
@@ -637,37 +910,15 @@ class LLSIFClient(object):
 
         logger.info('Executing "startup" API bundle')
 
-        apirequest = [('login', 'topInfo'),
-                      ('live', 'liveStatus'),
-                      ('live', 'schedule'),
-                      ('marathon', 'marathonInfo'),
-                      ('login', 'topInfoOnce'),
-                      ('unit', 'unitAll'),
-                      ('unit', 'deckInfo'),
-                      ('payment', 'productList'),
-                      ('scenario', 'scenarioStatus'),
-                      ('subscenario', 'subscenarioStatus'),
-                      ('user', 'showAllItem'),
-                      ('battle', 'battleInfo'),
-                      ('banner', 'bannerList'),
-                      ('notice', 'noticeMarquee'),
-                      ('festival', 'festivalInfo'),
-                      ('eventscenario', 'status'),
-                      ('navigation', 'specialCutin'),
-                      ('album', 'albumAll'),
-                      ('award', 'awardInfo'),
-                      ('background', 'backgroundInfo'),
-                      ('online', 'info'),
-                      ('challenge', 'challengeInfo')]
-
-        respobj = self.api_multiple_requests(apirequest)
+        respobj = self.api_multiple_requests(self.STARTUP_REQUESTS)
 
         return respobj
 
     def unit_and_deck(self):
         '''Execute /unit/unitAll and unit/deckInfo.
 
-        Common request to retrieve complete deck info.'''
+        Common request to retrieve complete deck info. With TRACK_INVENTORY
+        the result is also loaded into self.inventory.'''
 
         logger.info('Retrieving complete deck info')
 
@@ -734,6 +985,29 @@ class LLSIFClient(object):
 
         return respobj
 
+    def drain_present_box(self, category=0, items=None, units=True,
+                          open_all=True, batch_size=20):
+        '''Open the presents in the present box.
+
+        Returns a presentbox.PresentBoxDrain. Nothing is requested until it
+        is iterated over; iterating yields the opened presents, fetching and
+        opening the box page by page. Its stats attribute counts opened
+        presents, round-trips and items per second.
+
+        category: 0 => everything(default), 1 => members, 2 => items
+        items: INCENTIVE_ITEM keys to open, None for all
+        units: whether to open members
+
+        reward/openAll is used when everything in category is to be opened
+        and open_all is set; otherwise up to batch_size reward/open calls
+        are bundled in each multi-request. Stops at the first present that
+        can not be opened, e.g. when the unit box is full.'''
+
+        logger.info('Emptying present box')
+
+        return PresentBoxDrain(self, category, items, units, open_all,
+                               batch_size)
+
     def recruitinfo(self):
         '''Get information about all recruitment tabs.'''
 
@@ -782,7 +1056,7 @@ class LLSIFClient(object):
         Only jumping to specific rank is implemented. "Page turning" is not
         implemented.'''
 
-        logger.info('Retrieving event ranking at {:d}'.format(rank))
+        logger.info('Retrieving event ranking at %d', rank)
 
         requestdata = OrderedDict([('module', 'ranking'),
                                    ('action', 'eventPlayer'),
@@ -820,11 +1094,35 @@ class LLSIFClient(object):
         Default url is /main.php/module/action.
         Submits requests like {"module":"","commandNum":"","action":"","timeStamp":""}'''
 
-        logger.debug('Submitting API request %s', str(request))
+        respobj = self.cached_response(request)
+        if respobj is not None:
+            return respobj
+
+        if self._batch is not None:
+            if is_batchable(request, url):
+                return self._batch.add(request, Future())
+            self.flush_batch()
+
+        url, requestdata, timestamp = self.encode_single_request(request, url)
+
+        respstatus, respheaders, respbody, respobj = self.api_post_request(
+            url, requestdata=requestdata, timestamp=timestamp)
+
+        self.update_cache(request, respobj)
+
+        return respobj
+
+    def encode_single_request(self, request, url=None):
+        '''Encode a request for api_single_request().
+
+        Returns (url, request_data as bytes or None, timestamp).'''
+
+        logger.debug('Submitting API request %s', request)
+        is_tuple = isinstance(request, (tuple, list))
         if url is None:
-            try:
+            if is_tuple:
                 url = '/'.join(['', 'main.php', request[0], request[1]])
-            except KeyError:
+            else:
                 url = '/'.join(['', 'main.php', request['module'],
                                 request['action']])
         logger.debug('request URL: %s', url)
@@ -836,29 +1134,38 @@ class LLSIFClient(object):
         if request is None:
             requestdata = None
         else:
-            try:  # duck typing: tuple?
-                requestdata = OrderedDict([
-                    ('module', request[0]),
-                    ('commandNum', self.session['loginkey'] + '.' + timestamp + '.' + str(self.session['commandnum'])),
-                    ('action', request[1]),
-                    ('timeStamp', timestamp)])
-            except KeyError:  # duck typing: dict?
-                requestdata = copy.deepcopy(request)
+            if is_tuple:
+                requestdata = self.request_template(request).encode(
+                    timestamp, self.session['loginkey'] + '.' + timestamp + '.' + str(self.session['commandnum'])
+                ).encode('utf-8')
+            else:
+                requestdata = OrderedDict(request)
                 if 'commandNum' in requestdata:
                     requestdata['commandNum'] = self.session['loginkey'] + '.' + timestamp + '.' + str(self.session['commandnum'])
                 if 'timeStamp' in requestdata:
                     requestdata['timeStamp'] = timestamp
+                requestdata = jsoncodec.dumps(requestdata)
+            logger.debug('JSON request-data: %s', requestdata)
 
-            requestjson = json.dumps(requestdata, separators=(',', ':'),
-                                     ensure_ascii=False)
-            logger.debug('JSON request-data: %s', requestjson)
+        return (url, requestdata, timestamp)
 
-            requestdata = requestjson.encode('utf-8')
+    def request_template(self, request, single=True):
+        '''Return the RequestTemplate for request.
 
-        respstatus, respheaders, respbody, respobj = self.api_post_request(
-            url, requestdata=requestdata, timestamp=timestamp)
+        request is a (module, action) tuple. Templates are cached for the
+        lifetime of the process.'''
 
-        return respobj
+        key = (request[0], request[1], single)
+        template = _TUPLE_TEMPLATES.get(key)
+        if template is None:
+            if single:
+                items = [('module', request[0]), ('commandNum', None),
+                         ('action', request[1]), ('timeStamp', None)]
+            else:
+                items = [('module', request[0]), ('action', request[1]),
+                         ('timeStamp', None)]
+            template = _TUPLE_TEMPLATES[key] = RequestTemplate(items)
+        return template
 
     def api_multiple_requests(self, requests, url='/main.php/api'):
         '''Execute multiple API requests in one connection.
@@ -868,6 +1175,23 @@ class LLSIFClient(object):
         (ordered) dictionaries.
         Submits requests like [{"module":"","action":"","timeStamp":""},...]'''
 
+        requests, cached = self.split_cached(requests)
+
+        respobj = None
+        if not requests or len(cached) < len(requests):
+            requestdata, timestamp = self.encode_multiple_requests(
+                [x for i, x in enumerate(requests) if i not in cached])
+
+            respstatus, respheaders, respbody, respobj = self.api_post_request(
+                url, requestdata=requestdata, timestamp=timestamp)
+
+        return self.merge_cached(requests, cached, respobj)
+
+    def encode_multiple_requests(self, requests):
+        '''Encode requests for api_multiple_requests().
+
+        Returns (request_data as bytes, timestamp).'''
+
         logger.debug('Submitting multiple API requests in one connection')
 
         timestamp = str(int(time.time()))
@@ -875,26 +1199,184 @@ class LLSIFClient(object):
         requestdata = []
 
         for request in requests:
-            try:
-                # logger.debug('module: %s, action: %s', request[0], request[1])
-                requestdata.append(OrderedDict([('module', request[0]),
-                                                ('action', request[1]),
-                                                ('timeStamp', timestamp)]))
-            except KeyError:
-                temprequest = copy.deepcopy(request)
+            if isinstance(request, (tuple, list)):
+                requestdata.append(self.request_template(
+                    request, single=False).encode(timestamp).encode('utf-8'))
+            else:
+                # A shallow copy is enough: only top-level keys are replaced
+                temprequest = OrderedDict(request)
+                if 'commandNum' in temprequest:
+                    self.session['commandnum'] += 1
+                    temprequest['commandNum'] = self.session['loginkey'] + '.' + timestamp + '.' + str(self.session['commandnum'])
                 if 'timeStamp' in temprequest:
                     temprequest['timeStamp'] = timestamp
-                requestdata.append(temprequest)
+                requestdata.append(jsoncodec.dumps(temprequest))
 
-        requestjson = json.dumps(requestdata, separators=(',', ':'),
-                                 ensure_ascii=False)
-        logger.debug('JSON request-data: %s', requestjson)
+        requestdata = b'[' + b','.join(requestdata) + b']'
+        logger.debug('JSON request-data: %s', requestdata)
 
-        requestdata = requestjson.encode('utf-8')
+        return (requestdata, timestamp)
 
-        respstatus, respheaders, respbody, respobj = self.api_post_request(
-            url, requestdata=requestdata, timestamp=timestamp)
+    @contextlib.contextmanager
+    def batch(self, enabled=True):
+        '''Bundle the API calls made in the block into one multi-request.
+
+        Inside the block, api_single_request() returns a
+        concurrent.futures.Future of the response for calls that can be
+        bundled, and the high-level methods return it as they got it. The
+        calls are sent when the block ends. Calls that can not be bundled,
+        like login, are sent right away, after the calls queued before them.
+
+        With enabled=False, or inside another batch() block, calls are made
+        as usual.'''
+
+        if not enabled or self._batch is not None:
+            yield
+            return
+        self._batch = RequestBatch()
+        try:
+            yield
+            self.flush_batch()
+        finally:
+            batch, self._batch = self._batch, None
+            batch.fail(RuntimeError('Batched request was not sent'))
+
+    def flush_batch(self):
+        '''Send the calls queued by batch() so far.'''
+
+        batch = self._batch
+        if not batch:
+            return
+        self._batch = RequestBatch()
 
+        logger.debug('Sending %d batched requests', len(batch))
+        try:
+            respobj = self.api_multiple_requests(batch.requests)
+        except BaseException as exc:
+            batch.fail(exc)
+            raise
+        batch.fan_out(respobj)
+
+    @staticmethod
+    def when_done(respobj, callback):
+        '''Call callback with respobj, once it has arrived if it is a future.'''
+
+        if isinstance(respobj, Future):
+            respobj.add_done_callback(
+                lambda future: future.exception() or callback(future.result()))
+        else:
+            callback(respobj)
+
+    @staticmethod
+    def request_key(request):
+        '''Return (module, action) of a request, or None if it has none.'''
+
+        if isinstance(request, (tuple, list)):
+            return (request[0], request[1])
+        if request is not None and 'module' in request:
+            return (request['module'], request['action'])
+        return None
+
+    def cached_response(self, request):
+        '''Return a response made from the cache if request can be skipped.
+
+        Only with SKIP_CACHED; returns None otherwise.'''
+
+        if self.RESPONSE_CACHE is None or not self.SKIP_CACHED:
+            return None
+        key = self.request_key(request)
+        if key is None:
+            return None
+        result = self.RESPONSE_CACHE.get(key[0], key[1], self.session['userid'])
+        if result is None:
+            return None
+        logger.debug('Using cached result of %s/%s', *key)
+        self.update_inventory(request, result)
+        return OrderedDict([('response_data', result), ('status_code', 200)])
+
+    def update_cache(self, request, respobj):
+        '''Record the response to a single request in the cache and the
+        unit inventory.'''
+
+        if respobj is None or respobj.get('status_code', 200) != 200:
+            return
+        key = self.request_key(request)
+        if key is None:
+            return
+        if self.RESPONSE_CACHE is not None:
+            self.RESPONSE_CACHE.observe(key[0], key[1], self.session['userid'],
+                                        respobj['response_data'])
+        self.update_inventory(request, respobj['response_data'])
+
+    def update_inventory(self, request, result):
+        '''Update self.inventory from the successful result of request.'''
+
+        if self.inventory is None:
+            return
+        key = self.request_key(request)
+        if key is not None:
+            self.inventory.observe(key[0], key[1], request, result)
+
+    def split_cached(self, requests):
+        '''Find the requests of a multi-request that can be skipped.
+
+        Returns (requests as a list, {index: cached result}). The dict is
+        empty unless SKIP_CACHED is set.'''
+
+        requests = list(requests)
+        cached = {}
+        if self.RESPONSE_CACHE is not None and self.SKIP_CACHED:
+            for i, request in enumerate(requests):
+                key = self.request_key(request)
+                if key is None:
+                    continue
+                result = self.RESPONSE_CACHE.get(key[0], key[1],
+                                                 self.session['userid'])
+                if result is not None:
+                    cached[i] = result
+            if cached:
+                logger.debug('Using %d cached results', len(cached))
+        return (requests, cached)
+
+    def merge_cached(self, requests, cached, respobj):
+        '''Update the cache from the response to a multi-request, and put
+        the results from split_cached() back in their places.
+
+        respobj is None if every request was cached. Returns the response
+        to all of requests; requests the server left unanswered are left
+        out of it.'''
+
+        if self.RESPONSE_CACHE is None and self.inventory is None:
+            return respobj
+        if respobj is None:
+            respobj = OrderedDict([('response_data', []), ('status_code', 200)])
+        if not isinstance(respobj.get('response_data'), list):
+            return respobj
+
+        received = iter(respobj['response_data'])
+        merged = []
+        for i, request in enumerate(requests):
+            if i in cached:
+                merged.append(OrderedDict([('result', cached[i]),
+                                           ('status', 200),
+                                           ('commandNum', False),
+                                           ('timeStamp', int(time.time()))]))
+                self.update_inventory(request, cached[i])
+                continue
+            entry = next(received, None)
+            if entry is None:
+                logger.warning('No result for %s in the multi-request response',
+                               self.request_key(request))
+                continue
+            merged.append(entry)
+            key = self.request_key(request)
+            if key is not None and entry.get('status') == 200:
+                if self.RESPONSE_CACHE is not None:
+                    self.RESPONSE_CACHE.observe(key[0], key[1],
+                                                self.session['userid'],
+                                                entry.get('result'))
+                self.update_inventory(request, entry.get('result'))
+        respobj['response_data'] = merged
         return respobj
 
     def build_headers(self, timestamp, requestdata, nonce,
@@ -903,42 +1385,63 @@ class LLSIFClient(object):
 
         logger.debug('Building HTTP headers')
 
-        headers = copy.deepcopy(self.DEF_HEADERS)
-        authorize_header = copy.deepcopy(self.DEF_AUTHORIZE)
+        if requestdata is None:
+            xmessagecode = None
+        else:
+            xmessagecode = self.gen_xmessagecode(requestdata)
 
-        authorize_header['timeStamp'] = timestamp
-        authorize_header['nonce'] = nonce
+        headers = self.header_template().build(
+            timestamp, nonce, userid, token, xmessagecode)
+        logger.debug('Authorize header: %s', headers['Authorize'])
 
-        if token is None:
-            del authorize_header['token']
-        else:
-            authorize_header['token'] = token
+        return headers
 
-        if userid is None:
-            del headers['User-ID']
-        else:
-            headers['User-ID'] = userid
+    def header_template(self):
+        '''Return the HeaderTemplate compiled from DEF_HEADERS and DEF_AUTHORIZE.
 
-        headers['Authorize'] = '&'.join('{}={}'.format(*item) for
-                                        item in authorize_header.items())
-        logger.debug('Authorize header: %s', headers['Authorize'])
+        The template is looked up by the current contents of the defaults on
+        every call, so changes to them apply from the next request on, as
+        they did before templates. Templates are compiled once per process
+        for each distinct set of defaults.'''
 
-        if requestdata is None:
-            del headers['X-Message-Code']
-        else:
-            headers['X-Message-Code'] = self.gen_xmessagecode(requestdata)
+        return get_template(self.DEF_HEADERS, self.DEF_AUTHORIZE)
 
-        return headers
+    def reset_header_template(self):
+        '''Kept for compatibility: header_template() follows changes to
+        DEF_HEADERS and DEF_AUTHORIZE by itself.'''
+
+        pass
 
     def gen_xmessagecode(self, data):
         '''Calculate X-Message-Code.
 
         The server will discard API calls without the correct X-Message-Code.
-        This is one of the security measures of the game.'''
+        This is one of the security measures of the game.
+
+        This is the one place the key is used: responses are checked with
+        it too, see response_verifier(). A subclass that signs differently
+        only needs to override it.'''
+
+        # CUSTOMIZATION: the key comes from settings.HMAC_SIGNITURE_KEY.
+        # Without the correct key the client will not work.
+        return self.signer.sign(data)
+
+    def response_verifier(self, httpresp):
+        '''Return an incremental HMAC to check the body of httpresp with.
 
-        # CUSTOMIZATION: provide the correct function here, or the client will
-        # not work.
-        return gen_xmessagecode.gen_xmessagecode(data)
+        Returns None if the response is not to be checked: responses without
+        X-Message-Code are not, and only a VERIFY_RATE fraction of the
+        others are. The body is checked against gen_xmessagecode().'''
+
+        if httpresp.getheader('X-Message-Code') is None:
+            return None
+        if self.VERIFY_RATE < 1 and random.random() >= self.VERIFY_RATE:
+            return None
+        if type(self).gen_xmessagecode is not LLSIFClient.gen_xmessagecode:
+            # Signed by a subclass; check with the same code, which needs
+            # the whole body
+            return signing.BufferedVerifier(self.gen_xmessagecode)
+        return self.signer.verifier()
 
     def multipart_form_data_enc(self, data):
         '''Create snippets for HTTP multipart encoding.
@@ -946,13 +1449,17 @@ class LLSIFClient(object):
         The actual game client's implementation is different from Python's http
         libraries, and this implementation attempts to emulate the actual game
         client. The server will take any valid implementation, so this isn't
-        strictly necessary, but whatever.'''
+        strictly necessary, but whatever.
+
+        The body is returned as a list of buffers, with data itself not
+        copied; connection pools send them without joining them.'''
 
         boundary = '-' * 28 + \
                    '{:012x}'.format(random.randrange(16**12))
-        body = b'--' + boundary.encode('utf-8') + b'\r\n' + \
-               b'Content-Disposition: form-data; name="request_data"\r\n\r\n' +\
-               data + b'\r\n--' + boundary.encode('utf-8') + b'--\r\n'
+        delimiter = boundary.encode('utf-8')
+        body = [b'--' + delimiter + _MULTIPART_DISPOSITION,
+                memoryview(data),
+                b'\r\n--' + delimiter + b'--\r\n']
         contenttype = 'multipart/form-data; boundary=' + boundary
 
         return (contenttype, body)
@@ -963,13 +1470,246 @@ class LLSIFClient(object):
         Returns:
             HTTP status code,
             HTTP headers in the response as a list of tuples,
-            body of the response (gunzipped if necessary), and
+            body of the response (gunzipped if necessary) as bytes, and
             body as decoded JSON objects (dicts, lists, etc)
 
+        The body is gunzipped while it streams in from the socket. Bodies
+        larger than MAX_RESPONSE_SIZE after gunzipping raise
+        decoding.ResponseTooLarge.
+
+        Timeouts, connection errors, 5xx and 204 responses are retried as
+        decided by self.retry_policy (see retry.RetryPolicy). RuntimeError
+        is raised when it gives up.
+
         Known error codes:
         If transfer code has been used elsewhere, server returns 403 Forbidden
         and {"code":20001,"message":""} '''
 
+        with self.request_timing(url) as timing:
+            headers, requestbody = self.begin_post_request(requestdata,
+                                                           timestamp, timing)
+            pool = self.connection_pool(self.READ_TIMEOUT)
+
+            attempt = 0
+            while True:
+                attempt += 1
+                self.pace()
+                self.begin_attempt(attempt, timing)
+                try:
+                    httpconn, httpresp = pool.urlopen('POST', url, headers,
+                                                      requestbody, timing)
+
+                    logger.debug('Receiving from server')
+
+                    verifier = self.response_verifier(httpresp)
+                    try:
+                        respbody = decoding.read_body(httpresp,
+                                                      self.MAX_RESPONSE_SIZE,
+                                                      verifier, timing)
+                    except BaseException:
+                        httpconn.close()
+                        raise
+
+                    if self.end_attempt(url, headers, requestbody, pool,
+                                        httpconn, httpresp, respbody, timing):
+                        break
+                except self.retry_policy.RETRYABLE_ERRORS as exc:
+                    logger.info('HTTP request failed: %r', exc)
+                except BaseException:
+                    self.retry_policy.end(attempt, False)
+                    raise
+
+                self.schedule_retry(attempt)
+
+            response = self.end_post_request(attempt, httpresp, respbody,
+                                             verifier, timing)
+        if self.stage_session():
+            self.SESSION_STORE.flush()
+        return response
+
+    # The steps of api_post_request() around its I/O, shared with
+    # AsyncLLSIFClient
+
+    def begin_post_request(self, requestdata, timestamp, timing):
+        '''Build the request and start a new call of retry_policy.
+
+        Returns (headers, body), see build_post_request().'''
+
+        headers, requestbody = self.build_post_request(requestdata, timestamp)
+        if timing is not None:
+            timing.mark('build')
+        logger.debug('Connecting to server')
+        self.retry_policy.begin()
+        return (headers, requestbody)
+
+    def begin_attempt(self, attempt, timing):
+        '''Called when attempt is about to be sent, after pace().'''
+
+        if timing is not None:
+            timing.attempts = attempt
+            timing.mark('queue')
+
+    def end_attempt(self, url, headers, requestbody, pool, httpconn,
+                    httpresp, respbody, timing):
+        '''Release the connection of a response that has been read.
+
+        Returns True if the response is to be used, False if the request
+        should be retried.'''
+
+        pool.release(httpconn, httpresp)
+        if timing is not None:
+            timing.status = httpresp.status
+        respheaders = httpresp.getheaders()
+        self.record_exchange(url, headers, requestbody, httpresp.status,
+                             respheaders, respbody)
+        return self.check_http_status(httpresp.status, respheaders, respbody)
+
+    def schedule_retry(self, attempt):
+        '''Hold the next attempt for as long as retry_policy says.
+
+        Raises RuntimeError if it gives up.'''
+
+        policy = self.retry_policy
+        delay = policy.next_delay(attempt)
+        if delay is None:
+            policy.end(attempt, False)
+            self.dump_capture()
+            raise RuntimeError('HTTP request failed {:d} times'.format(attempt))
+        logger.debug('Retrying in %.2f seconds', delay)
+        self.scheduler.defer(delay)
+
+    def end_post_request(self, attempt, httpresp, respbody, verifier, timing):
+        '''Check and decode the response that ended the request.
+
+        Returns what api_post_request() returns.'''
+
+        self.retry_policy.end(attempt, True)
+        response = self.handle_post_response(httpresp, httpresp.getheaders(),
+                                             respbody, verifier)
+        if timing is not None:
+            timing.mark('decode')
+        return response
+
+    def connection_pool(self, read_timeout):
+        '''Return the connection pool of TRANSPORT for requests with
+        read_timeout.'''
+
+        if self.REPLAY is not None:
+            return self.REPLAY
+        pool = transport.get_pool(self.TRANSPORT, self.SERVER_HOST,
+                                  self.CONNECT_TIMEOUT, read_timeout,
+                                  self.POOL_MAXSIZE, self.ADAPTIVE_TIMEOUT,
+                                  self.asynchronous)
+        if self.RECORDER is not None:
+            pool = self.recording_pool_class(pool, self.RECORDER)
+        return pool
+
+    @contextlib.contextmanager
+    def request_timing(self, url):
+        '''Time a request to url with METRICS.
+
+        Yields a metrics.RequestTiming to mark the phases of the request on,
+        or None if METRICS is None. The timing is recorded when the block
+        ends, with the exception if it raised one.'''
+
+        metrics = self.METRICS
+        if metrics is None:
+            yield None
+            return
+        timing = metrics.start(url)
+        try:
+            yield timing
+        except BaseException as exc:
+            metrics.finish(timing, timing.status, exc)
+            raise
+        metrics.finish(timing, timing.status)
+
+    def think(self, low, high):
+        '''Pause between low and high seconds, like a player would.
+
+        This does not block: the pause delays the next request instead, see
+        ratelimit.RequestScheduler.'''
+
+        logger.debug('Think for a bit...')
+        self.scheduler.think(low, high)
+
+    def pace(self):
+        '''Wait until the next request is due.
+
+        Called before every request. Waits out think time, retry backoff
+        and rate limits with self.scheduler.wait(), which raises
+        ratelimit.Cancelled once self.scheduler.cancel() is called.'''
+
+        self.scheduler.wait(self.SERVER_HOST)
+
+    def record_exchange(self, url, headers, requestbody, status,
+                        respheaders, respbody):
+        '''Keep a request/response pair in the capture buffer, if enabled.'''
+
+        if self.capture is not None:
+            self.capture.append((time.time(), url, headers, requestbody,
+                                 status, respheaders, respbody))
+
+    def dump_capture(self, level=logging.ERROR):
+        '''Log and clear the exchanges kept in the capture buffer.'''
+
+        if not self.capture:
+            return
+        logger.log(level, 'Last %d exchanges with the server:', len(self.capture))
+        for item in self.capture:
+            logger.log(level, '%.3f POST %s', item[0], item[1])
+            logger.log(level, '  request headers: %s', item[2])
+            logger.log(level, '  request body: %s',
+                       None if item[3] is None else b''.join(item[3]))
+            logger.log(level, '  response %s headers: %s', item[4], item[5])
+            logger.log(level, '  response body: %s', item[6])
+        self.capture.clear()
+
+    def memory_footprint(self):
+        '''Estimate how much memory this client keeps alive, in bytes.
+
+        Returns an OrderedDict of attribute -> bytes, largest first, and
+        the whole client under 'total'. Objects shared with other clients,
+        see shared_objects(), are not counted. See footprint.deep_sizeof().'''
+
+        shared = self.shared_objects()
+        seen = set()
+        sizes = [(name, footprint.deep_sizeof(value, shared, seen))
+                 for name, value in vars(self).items()]
+        report = OrderedDict(sorted(sizes, key=lambda item: item[1],
+                                    reverse=True))
+        report['total'] = footprint.deep_sizeof(self, shared)
+        return report
+
+    def shared_objects(self):
+        '''Return the objects this client shares with other clients.
+
+        These are the contents of the process-wide registries (signers,
+        host rate limit buckets, connection pools, header and request
+        templates), the DNS cache, the fleet retry budget, and the
+        RESPONSE_CACHE, SESSION_STORE, METRICS, RECORDER and REPLAY of the
+        class.'''
+
+        shared = [self.signer, self.retry_policy.fleet_budget,
+                  transport.DNS_CACHE, self.RESPONSE_CACHE, self.SESSION_STORE,
+                  self.METRICS, self.RECORDER, self.REPLAY]
+        registries = ((signing._signers, signing._signers_lock),
+                      (ratelimit._host_buckets, ratelimit._host_buckets_lock),
+                      (connpool._pools, connpool._pools_lock),
+                      (headers._templates, headers._templates_lock))
+        for registry, lock in registries:
+            with lock:
+                shared.extend(registry.values())
+        shared.extend(list(_TUPLE_TEMPLATES.values()))
+        return [item for item in shared if item is not None]
+
+    def build_post_request(self, requestdata=None, timestamp=None):
+        '''Build headers and body for a POST to the server.
+
+        Advances the nonce. Returns (headers, body); body is a list of
+        buffers (see multipart_form_data_enc()), or None if there is no
+        request_data.'''
+
         logger.debug('Making HTTP request')
         if not timestamp:
             timestamp = str(int(time.time()))
@@ -981,58 +1721,50 @@ class LLSIFClient(object):
 
         if requestdata is None:
             headers['Content-Length'] = 0
+            requestbody = None
         else:
             contenttype, requestbody = self.multipart_form_data_enc(requestdata)
-            headers['Content-Length'] = len(requestbody)
+            headers['Content-Length'] = connpool.body_length(requestbody)
             headers['Content-Type'] = contenttype
 
-        logger.debug('Connecting to server')
-
-        # retry the request 10 times
-        for timeout_attempt in range(10):
-            try:
-                # time.sleep(random.uniform(0.3, 0.5))
-                httpconn = http.client.HTTPConnection(self.SERVER_HOST, timeout=10)
-                httpconn.connect()
-                httpconn.putrequest("POST", url, skip_accept_encoding=True)
-                for headeritem in headers.items():
-                    httpconn.putheader(headeritem[0], headeritem[1])
-                httpconn.endheaders()
-
-                if requestdata is not None:
-                    httpconn.send(requestbody)
-
-                logger.debug('Receiving from server')
-                httpresp = httpconn.getresponse()
-
-                respheaders = httpresp.getheaders()
-                respbody = httpresp.read()
-
-                logger.debug('Server response headers:')
-                logger.debug(str(respheaders))
-                logger.debug('Server response body:')
-                logger.debug(str(respbody))
-
-                httpconn.close()
-
-                if not httpresp.status == 200:
-                    logger.warning('HTTP status code: {:d}'.format(httpresp.status))
-                    # Check docstring for known error codes
-                    logger.warning('HTTP headers: %s', str(respheaders))
-                    logger.warning('HTTP response body: %s', str(respbody))
-                    if (httpresp.status >= 500 and httpresp.status <= 599) or \
-                            httpresp.status == 204:
-                        logger.warning('Retry HTTP connection')
-                        continue
-                    else:
-                        raise RuntimeError('HTTP status code {:d}'.format(httpresp.status))
-            except socket.timeout:
-                logger.info('HTTP request timed out')
-                # continue
-            else:
-                break
-        else:
-            raise RuntimeError('HTTP request failed 10 times')
+        return (headers, requestbody)
+
+    def check_http_status(self, status, respheaders, respbody):
+        '''Check the HTTP status of a response.
+
+        Returns True on success and False if the request should be retried.
+        Raises RuntimeError otherwise.'''
+
+        # Payloads can be hundreds of KB; only stringify them if they are
+        # going to be logged. With a capture buffer they are kept there
+        # instead.
+        if self.capture is None and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Server response headers: %s', respheaders)
+            logger.debug('Server response body: %s', respbody)
+
+        if not status == 200:
+            logger.warning('HTTP status code: %d', status)
+            # Check docstring for known error codes
+            logger.warning('HTTP headers: %s', respheaders)
+            logger.warning('HTTP response body: %s', respbody)
+            if self.retry_policy.is_retryable_status(status):
+                logger.warning('Retry HTTP connection')
+                return False
+            self.dump_capture()
+            if status == 403:
+                raise self.TokenRejected('HTTP status code 403')
+            raise RuntimeError('HTTP status code {:d}'.format(status))
+
+        return True
+
+    def handle_post_response(self, httpresp, respheaders, respbody,
+                             verifier=None):
+        '''Check and decode a successful response to api_post_request().
+
+        httpresp only needs status and getheader(); respbody must already
+        be gunzipped. verifier is the object from response_verifier(), fed
+        with respbody; X-Message-Code is not checked without it. Returns the
+        same tuple as api_post_request().'''
 
         # Some sanity checks for returned data
 
@@ -1040,6 +1772,7 @@ class LLSIFClient(object):
             logger.warning('Response header "Maintenance" is {:s}'.format(
                 httpresp.getheader('Maintenance')))
             if httpresp.getheader('Maintenance') == '1':
+                self.dump_capture()
                 raise RuntimeError('Server under maintenance')
 
         if httpresp.getheader('server-version') is not None and \
@@ -1058,27 +1791,19 @@ class LLSIFClient(object):
             logger.warning('Server returned version_up: %s',
                            httpresp.getheader('version_up'))
 
-        # gunzip response if required
-        if httpresp.getheader('Content-Encoding') == 'gzip' or \
-           httpresp.getheader('Content-Encoding') == 'deflate':
-            respbody = zlib.decompress(respbody, zlib.MAX_WBITS + 32)
-            logger.debug('gunzipped server response body:')
-            logger.debug(str(respbody))
-        elif httpresp.getheader('Content-Encoding') is not None:
-            logger.warning('Server returned Content-Encoding: %s',
-                           httpresp.getheader('Content-Encoding'))
+        # The body has already been gunzipped while it was read, see
+        # decoding.ResponseDecoder
 
         # More sanity checks
-        if httpresp.getheader('X-Message-Code') is not None and \
-           not self.gen_xmessagecode(respbody) == \
-           httpresp.getheader('X-Message-Code'):
+        if verifier is not None and not self.signer.matches(
+                verifier.hexdigest(), httpresp.getheader('X-Message-Code')):
             logger.warning('Server response X-Message-Code incorrect')
 
         # Decode JSON objects if found
         contenttype = httpresp.getheader('Content-Type')
         if contenttype.find('application/json') == 0:
             contentenc = re.search('charset=([^= ,]*)', contenttype).group(1)
-            respobj = json.loads(respbody.decode(encoding=contentenc))
+            respobj = jsoncodec.loads(respbody, contentenc)
         else:
             logger.warning('Server returned Content-Type: %s', contenttype)
             respobj = None
@@ -1086,7 +1811,7 @@ class LLSIFClient(object):
         if 'status_code' in respobj and respobj['status_code'] != 200:
             logger.warning('JSON response status_code: %s',
                            str(respobj['status_code']))
-            logger.warning('Full response: %s', str(respbody))
+            logger.warning('Full response: %s', respbody)
 
         try:
             if 'response_data' in respobj and \
@@ -1095,9 +1820,10 @@ class LLSIFClient(object):
         except TypeError:
             pass
 
-        self._last_response_headers = respheaders
-        self._last_response_body = respbody
-        self._last_response_object = respobj
+        if not self.LOW_MEMORY:
+            self._last_response_headers = respheaders
+            self._last_response_body = respbody
+            self._last_response_object = respobj
 
         return (httpresp.status, respheaders, respbody, respobj)
 
@@ -1109,6 +1835,43 @@ class LLSIFClient(object):
         This method reuses headers when possible. To clear existing headers,
         set LLSIFClient.session['wv_header'] = None.'''
 
+        headers = self.build_webview_headers()
+
+        pool = self.connection_pool(self.WEBVIEW_TIMEOUT)
+
+        with self.request_timing(url) as timing:
+            self.pace()
+            if timing is not None:
+                timing.mark('queue')
+            try:
+                httpconn, httpresp = pool.urlopen('GET', url, headers,
+                                                  timing=timing)
+
+                try:
+                    respbody = httpresp.read()
+                except BaseException:
+                    httpconn.close()
+                    raise
+
+                return self.end_webview_request(pool, httpconn, httpresp,
+                                                respbody, timing)
+            except socket.timeout:
+                return (504, [], b'')
+
+    def end_webview_request(self, pool, httpconn, httpresp, respbody, timing):
+        '''Release the connection of a webview response that has been read.
+
+        Returns what handle_webview_get_request() returns.'''
+
+        pool.release(httpconn, httpresp)
+        if timing is not None:
+            timing.status = httpresp.status
+            timing.mark('read')
+        return (httpresp.status, httpresp.getheaders(), respbody)
+
+    def build_webview_headers(self):
+        '''Return the headers for webview requests, building them if needed.'''
+
         if self.session['wv_header'] is None:
             timestamp = str(int(time.time()))
 
@@ -1139,22 +1902,9 @@ class LLSIFClient(object):
                                             item in authorize_header.items())
             headers['user-id'] = self.session['userid']
 
-            logger.debug(str(headers))
+            logger.debug('%s', headers)
             self.session['wv_header'] = headers
         else:
             headers = self.session['wv_header']
 
-        try:
-            httpconn = http.client.HTTPConnection(self.SERVER_HOST, timeout=20)
-            httpconn.request("GET", url, headers=headers)
-            httpresp = httpconn.getresponse()
-
-            respstatus = httpresp.status
-            respheaders = httpresp.getheaders()
-            respbody = httpresp.read()
-
-            httpconn.close()
-
-            return (respstatus, respheaders, respbody)
-        except socket.timeout:
-            return (504, [], b'')
+        return headers
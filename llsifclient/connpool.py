@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+import http.client
+import logging
+import select
+import socket
+import threading
+import time
+
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean a kept-alive connection was closed by the server while it
+# sat idle in the pool. Seeing one of these on a reused connection is not a
+# failure of the request itself.
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+# Most buffers passed to one sendmsg() call; POSIX guarantees at least 16
+_IOV_MAX = 16
+
+
+def body_length(body):
+    '''Return the length of a request body, either bytes or a list of
+    buffers.'''
+
+    if isinstance(body, list):
+        return sum(memoryview(part).nbytes for part in body)
+    return len(body)
+
+
+def sendmsg_all(sock, buffers):
+    '''Send a list of buffers like sock.sendall(b''.join(buffers)), with
+    scatter/gather I/O instead of joining them.'''
+
+    if not hasattr(sock, 'sendmsg'):
+        for buf in buffers:
+            sock.sendall(buf)
+        return
+    views = deque(memoryview(buf).cast('B') for buf in buffers if len(buf))
+    while views:
+        sent = sock.sendmsg(list(views)[:_IOV_MAX])
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views.popleft())
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+class AdaptiveTimeout(object):
+    '''Read timeout following the response times of a server.
+
+    Computed like TCP's retransmission timeout (RFC 6298): the smoothed
+    response time plus four times its variation, kept between minimum and
+    maximum. Doubled after every timeout until a response comes in time.'''
+
+    def __init__(self, maximum, minimum=1.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.srtt = None
+        self.rttvar = None
+        self._backoff = 1
+        self._lock = threading.Lock()
+
+    def timeout(self):
+        if self.srtt is None:
+            return self.maximum
+        timeout = max(self.minimum, self.srtt + 4 * self.rttvar)
+        return min(self.maximum, timeout * self._backoff)
+
+    def observe(self, seconds):
+        '''Record the response time of a request.'''
+
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = seconds
+                self.rttvar = seconds / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+                self.srtt = 0.875 * self.srtt + 0.125 * seconds
+            self._backoff = 1
+
+    def expired(self):
+        '''Record that a request timed out.'''
+
+        with self._lock:
+            self._backoff = min(self._backoff * 2, 64)
+
+
+class TimeoutHTTPConnection(http.client.HTTPConnection):
+    '''HTTPConnection with separate connect and read timeouts.
+
+    timeout applies to connecting, read_timeout to everything after.'''
+
+    def __init__(self, host, timeout=10, read_timeout=None):
+        super().__init__(host, timeout=timeout)
+        self.read_timeout = timeout if read_timeout is None else read_timeout
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+    def set_read_timeout(self, timeout):
+        self.read_timeout = timeout
+        if self.sock is not None:
+            self.sock.settimeout(timeout)
+
+    def _send_output(self, message_body=None, encode_chunked=False):
+        # Sends the header block and a body given as a list of buffers
+        # with one sendmsg(), without joining them.
+        if not isinstance(message_body, list) or encode_chunked:
+            return super()._send_output(message_body, encode_chunked)
+        self._buffer.extend((b'', b''))
+        buffers = [b'\r\n'.join(self._buffer)] + message_body
+        del self._buffer[:]
+        if self.sock is None:
+            if not self.auto_open:
+                raise http.client.NotConnected()
+            self.connect()
+        sendmsg_all(self.sock, buffers)
+
+
+class HTTPConnectionPool(object):
+    '''Pool of keep-alive HTTP connections to a single host.
+
+    At most maxsize idle connections are kept. Checking out a connection
+    never blocks: if the pool is empty a new connection is created.
+
+    timeout is the read timeout; connect_timeout defaults to it. With
+    adaptive (an AdaptiveTimeout), the read timeout of every request is
+    taken from it instead, and the response times are fed back to it.'''
+
+    connection_class = TimeoutHTTPConnection
+
+    def __init__(self, host, timeout=10, maxsize=4, connect_timeout=None,
+                 adaptive=None):
+        self.host = host
+        self.timeout = timeout
+        self.connect_timeout = timeout if connect_timeout is None \
+            else connect_timeout
+        self.adaptive = adaptive
+        self.maxsize = maxsize
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def read_timeout(self):
+        if self.adaptive is not None:
+            return self.adaptive.timeout()
+        return self.timeout
+
+    def _new_conn(self):
+        logger.debug('Opening new connection to %s', self.host)
+        return self.connection_class(self.host, timeout=self.connect_timeout,
+                                     read_timeout=self.read_timeout())
+
+    @staticmethod
+    def is_stale(conn):
+        '''Return True if an idle connection can not be reused.
+
+        An idle keep-alive socket should have nothing to read. If select()
+        reports it readable, the server has either closed it (EOF) or sent
+        something we did not ask for; both mean it must be discarded.'''
+
+        if conn.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def get(self):
+        '''Check out a connection, reusing an idle one if possible.'''
+
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not self.is_stale(conn):
+                    return conn
+                logger.debug('Discarding stale connection to %s', self.host)
+                conn.close()
+        return self._new_conn()
+
+    def put(self, conn):
+        '''Return a connection to the pool, or close it if the pool is full.'''
+
+        with self._lock:
+            if conn.sock is not None and len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def release(self, conn, httpresp):
+        '''Return conn after httpresp has been read completely.'''
+
+        if httpresp.will_close:
+            conn.close()
+        else:
+            self.put(conn)
+
+    def clear(self):
+        '''Close all idle connections.'''
+
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+    def urlopen(self, method, url, headers, body=None, timing=None):
+        '''Send a request and return (conn, httpresp) with the body unread.
+
+        body is bytes or a list of buffers, which are sent together with
+        the headers without being joined.
+
+        If a reused connection turns out to be closed by the server, the
+        request is sent once more on a fresh connection. Errors on a fresh
+        connection are raised to the caller.
+
+        timing is an optional metrics.RequestTiming to mark the connect,
+        send and wait phases on.
+
+        The caller must read the response and then call release().'''
+
+        conn = self.get()
+        reused = conn.sock is not None
+        try:
+            return conn, self._send(conn, method, url, headers, body, timing)
+        except STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+            logger.debug('Kept-alive connection to %s was closed, reconnecting',
+                         self.host)
+        except BaseException:
+            conn.close()
+            raise
+
+        conn = self._new_conn()
+        try:
+            return conn, self._send(conn, method, url, headers, body, timing)
+        except BaseException:
+            conn.close()
+            raise
+
+    def _send(self, conn, method, url, headers, body, timing=None):
+        if self.adaptive is not None:
+            conn.set_read_timeout(self.adaptive.timeout())
+        if timing is not None and conn.sock is None:
+            conn.connect()
+            timing.mark('connect')
+
+        conn.putrequest(method, url, skip_accept_encoding=True)
+        for headeritem in headers.items():
+            conn.putheader(headeritem[0], headeritem[1])
+        conn.endheaders(body)
+        if timing is not None:
+            timing.mark('send')
+
+        if self.adaptive is None:
+            httpresp = conn.getresponse()
+        else:
+            started = time.perf_counter()
+            try:
+                httpresp = conn.getresponse()
+            except socket.timeout:
+                self.adaptive.expired()
+                raise
+            self.adaptive.observe(time.perf_counter() - started)
+        if timing is not None:
+            timing.mark('wait')
+        return httpresp
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, timeout=10, maxsize=4, connect_timeout=None,
+             adaptive=False, pool_class=HTTPConnectionPool):
+    '''Return the process-wide pool for (host, timeouts).
+
+    timeout is the read timeout, see HTTPConnectionPool. The first caller
+    decides maxsize.'''
+
+    with _pools_lock:
+        key = (pool_class, host, timeout, connect_timeout, adaptive)
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = pool_class(
+                host, timeout, maxsize, connect_timeout,
+                AdaptiveTimeout(timeout) if adaptive else None)
+        return pool
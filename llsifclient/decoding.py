@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import http.client
+import logging
+import zlib
+
+from .metrics import TimedVerifier
+
+logger = logging.getLogger(__name__)
+
+# Size of the reads from the socket while streaming a response body
+READ_CHUNK_SIZE = 64 * 1024
+# Most bytes inflated at a time, bounding the temporary copies of the
+# output of highly compressed chunks
+INFLATE_CHUNK_SIZE = 256 * 1024
+
+
+class ResponseTooLarge(RuntimeError):
+    '''Raised when a decoded response body exceeds the size limit.'''
+    pass
+
+
+class ResponseDecoder(object):
+    '''Incrementally decode a response body as it arrives.
+
+    gzip and deflate bodies are inflated chunk by chunk, so the compressed
+    body is never held in memory as a whole. max_size caps the size of the
+    decoded body; it is checked while inflating, so a small compressed body
+    can not expand past it. If verifier is given, its update() is called
+    with every decoded chunk, e.g. to compute X-Message-Code as the body
+    streams in.
+
+    Decoded chunks are appended to a single bytearray, which finish()
+    copies into bytes once the body is complete.'''
+
+    def __init__(self, content_encoding=None, max_size=None, verifier=None):
+        if content_encoding in ('gzip', 'deflate'):
+            # + 32: autodetect gzip or zlib header
+            self._zlib = zlib.decompressobj(zlib.MAX_WBITS + 32)
+        else:
+            if content_encoding is not None:
+                logger.warning('Server returned Content-Encoding: %s',
+                               content_encoding)
+            self._zlib = None
+        self.max_size = max_size
+        self.verifier = verifier
+        self.size = 0
+        self.received = 0
+        self._body = bytearray()
+
+    def _append(self, data):
+        if data:
+            self.size += len(data)
+            if self.max_size is not None and self.size > self.max_size:
+                raise ResponseTooLarge(
+                    'Response body exceeds {:d} bytes'.format(self.max_size))
+            if self.verifier is not None:
+                self.verifier.update(data)
+            self._body += data
+
+    def feed(self, chunk):
+        '''Feed a chunk of the body as received from the server.'''
+
+        self.received += len(chunk)
+        if self._zlib is None:
+            self._append(chunk)
+            return
+
+        while chunk:
+            limit = INFLATE_CHUNK_SIZE
+            if self.max_size is not None:
+                # Inflate no more than one byte past the limit
+                limit = min(limit, self.max_size - self.size + 1)
+            self._append(self._zlib.decompress(chunk, limit))
+            chunk = self._zlib.unconsumed_tail
+
+    def finish(self):
+        '''Return the complete decoded body, as bytes.
+
+        Raises http.client.IncompleteRead if a non-empty gzip or deflate
+        body ended before the end of its stream.'''
+
+        if self._zlib is not None:
+            self._append(self._zlib.flush())
+            if self.received and not self._zlib.eof:
+                raise http.client.IncompleteRead(self._body)
+        body, self._body = self._body, bytearray()
+        return bytes(body)
+
+
+def _decoder(httpresp, max_size, verifier, timing):
+    if timing is not None and verifier is not None:
+        verifier = TimedVerifier(verifier, timing)
+    return ResponseDecoder(httpresp.getheader('Content-Encoding'), max_size,
+                           verifier)
+
+
+def read_body(httpresp, max_size=None, verifier=None, timing=None):
+    '''Read and decode the body of an http.client.HTTPResponse.
+
+    timing is an optional metrics.RequestTiming to mark the read,
+    decompress and verify phases on.'''
+
+    decoder = _decoder(httpresp, max_size, verifier, timing)
+    while True:
+        chunk = httpresp.read(READ_CHUNK_SIZE)
+        if timing is not None:
+            timing.mark('read')
+        if not chunk:
+            break
+        decoder.feed(chunk)
+        if timing is not None:
+            timing.mark('decompress')
+    body = decoder.finish()
+    if timing is not None:
+        timing.mark('decompress')
+    return body
+
+
+async def read_body_async(httpresp, max_size=None, verifier=None, timing=None):
+    '''Read and decode the body of an aioconn.AsyncHTTPResponse.'''
+
+    decoder = _decoder(httpresp, max_size, verifier, timing)
+    async for chunk in httpresp.iter_chunks(READ_CHUNK_SIZE):
+        if timing is not None:
+            timing.mark('read')
+        decoder.feed(chunk)
+        if timing is not None:
+            timing.mark('decompress')
+    if timing is not None:
+        timing.mark('read')
+    body = decoder.finish()
+    if timing is not None:
+        timing.mark('decompress')
+    return body
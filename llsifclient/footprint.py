@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Estimating how much memory an object keeps alive.
+
+    for name, size in client.memory_footprint().items():
+        print(name, size)
+
+deep_sizeof() adds up sys.getsizeof() of an object and everything it
+references through containers, __dict__ and __slots__. Classes, modules
+and functions are not counted, nor are objects in exclude, which is how
+process-wide objects shared between clients are left out. Interned and
+cached objects (small ints, short strings) are counted as if they were
+owned, so the result is an upper bound.
+"""
+
+import sys
+import types
+
+from collections import deque
+
+# Referenced objects that are never counted
+_SKIPPED = (type, types.ModuleType, types.FunctionType,
+            types.BuiltinFunctionType, types.MethodType)
+
+
+def _slot_names(cls):
+    for klass in cls.__mro__:
+        slots = klass.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in ('__dict__', '__weakref__'):
+                yield name
+
+
+def deep_sizeof(obj, exclude=(), seen=None):
+    '''Return the bytes obj and the objects it references take up.
+
+    Objects in exclude, and objects whose id() is in seen, are not
+    counted; seen is updated with everything counted, so a shared seen
+    counts objects referenced from several places once.'''
+
+    if seen is None:
+        seen = set()
+    seen.update(id(item) for item in exclude)
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _SKIPPED):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        if hasattr(item, '__dict__'):
+            stack.append(item.__dict__)
+        for name in _slot_names(type(item)):
+            try:
+                stack.append(getattr(item, name))
+            except AttributeError:
+                pass
+    return total
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from collections import OrderedDict
+
+# Header and Authorize fields filled in per request. Everything else is
+# copied from the defaults as-is.
+HEADER_SLOTS = ('Authorize', 'User-ID', 'X-Message-Code')
+AUTHORIZE_SLOTS = ('timeStamp', 'token', 'nonce')
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+class HeaderTemplate(object):
+    '''Precompiled request headers.
+
+    Built once from DEF_HEADERS and DEF_AUTHORIZE. build() only fills in
+    the per-request values, and gives the same result as copying the
+    defaults and filling them in: fields whose value is None are dropped,
+    and the order of the remaining ones is kept.'''
+
+    def __init__(self, headers, authorize):
+        # (has user id, has X-Message-Code) -> (keys, values, slot indices)
+        self._variants = {}
+        for has_userid in (False, True):
+            for has_xmc in (False, True):
+                self._variants[(has_userid, has_xmc)] = self._compile_headers(
+                    headers, has_userid, has_xmc)
+
+        self._authorize_formats = {
+            False: self._compile_authorize(authorize, False),
+            True: self._compile_authorize(authorize, True),
+        }
+
+    @staticmethod
+    def _compile_headers(headers, has_userid, has_xmc):
+        keys = []
+        values = []
+        slots = {}
+        for key, value in headers.items():
+            if key == 'User-ID' and not has_userid or \
+                    key == 'X-Message-Code' and not has_xmc:
+                continue
+            if key in HEADER_SLOTS:
+                slots[key] = len(values)
+            keys.append(key)
+            values.append(value)
+        # Slots missing from the defaults are appended, as assigning them to
+        # a copy of the defaults would do.
+        for key, needed in (('User-ID', has_userid), ('Authorize', True),
+                            ('X-Message-Code', has_xmc)):
+            if needed and key not in slots:
+                slots[key] = len(values)
+                keys.append(key)
+                values.append(None)
+        return (tuple(keys), values, slots.get('Authorize'),
+                slots.get('User-ID'), slots.get('X-Message-Code'))
+
+    @staticmethod
+    def _compile_authorize(authorize, has_token):
+        parts = []
+        for key, value in authorize.items():
+            if key == 'token' and not has_token:
+                continue
+            if key in AUTHORIZE_SLOTS:
+                parts.append('{}=%({})s'.format(key, key))
+            else:
+                parts.append('{}={}'.format(key, value).replace('%', '%%'))
+        for key, needed in (('timeStamp', True), ('nonce', True),
+                            ('token', has_token)):
+            if needed and key not in authorize:
+                parts.append('{}=%({})s'.format(key, key))
+        return '&'.join(parts)
+
+    def authorize(self, timestamp, nonce, token=None):
+        '''Return the Authorize header value.'''
+
+        return self._authorize_formats[token is not None] % {
+            'timeStamp': timestamp, 'nonce': nonce, 'token': token}
+
+    def build(self, timestamp, nonce, userid=None, token=None,
+              xmessagecode=None):
+        '''Return a fresh OrderedDict of headers for one request.'''
+
+        keys, values, authorize_idx, userid_idx, xmc_idx = \
+            self._variants[(userid is not None, xmessagecode is not None)]
+        values = list(values)
+        values[authorize_idx] = self.authorize(timestamp, nonce, token)
+        if userid_idx is not None:
+            values[userid_idx] = userid
+        if xmc_idx is not None:
+            values[xmc_idx] = xmessagecode
+        return OrderedDict(zip(keys, values))
+
+
+def get_template(headers, authorize):
+    '''Return the process-wide HeaderTemplate for the current contents of
+    headers and authorize.'''
+
+    key = (tuple(headers.items()), tuple(authorize.items()))
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = _templates[key] = HeaderTemplate(headers, authorize)
+    return template
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""Compact model of the units (members) of an account.
+
+UnitInventory keeps one small UnitRecord per unit instead of the dicts of
+unit/unitAll, with indexes by unit_id, rarity, level and favorite flag:
+
+    inventory = UnitInventory.from_response(client.unit_and_deck())
+    fodder = inventory.find(rarity=N, favorite=False, in_deck=False,
+                            level_max=True)
+    client.unitsale(fodder[:30])
+
+LLSIFClient keeps one up to date as client.inventory: it is loaded from
+the results of unit/unitAll and unit/deckInfo whenever they are requested,
+and updated from the results of merge, rankUp, sale, favorite and scouting
+without fetching the units again. Calls that add units without returning
+them, like opening presents, set its stale flag instead.
+"""
+
+from collections import OrderedDict
+
+# Unit rarities
+N = 1
+R = 2
+SR = 3
+UR = 4
+SSR = 5
+
+# (max_level, idolized) -> rarity, for unit records without a rarity
+_RARITY_BY_MAX_LEVEL = {(30, False): N, (40, False): R, (60, False): SR,
+                        (80, False): UR, (70, False): SSR,
+                        (40, True): N, (60, True): R, (80, True): SR,
+                        (100, True): UR, (90, True): SSR}
+
+# Calls whose result lists the units they added in secret_box_items
+_SCOUTS = frozenset([('secretbox', 'pon'), ('secretbox', 'multi')])
+# Calls that add units to the box without returning all of them
+_ADDS_UNITS = frozenset([('reward', 'open'), ('reward', 'openAll'),
+                         ('login', 'unitSelect'), ('live', 'reward')])
+
+
+class UnitRecord(object):
+    '''One unit of the account.'''
+
+    __slots__ = ('owning_id', 'unit_id', 'rarity', 'level', 'max_level',
+                 'exp', 'rank', 'max_rank', 'love', 'max_love',
+                 'skill_level', 'favorite')
+
+    def __init__(self, owning_id, unit_id, rarity, level, max_level, exp=0,
+                 rank=1, max_rank=2, love=0, max_love=0, skill_level=1,
+                 favorite=False):
+        self.owning_id = owning_id
+        self.unit_id = unit_id
+        self.rarity = rarity
+        self.level = level
+        self.max_level = max_level
+        self.exp = exp
+        self.rank = rank
+        self.max_rank = max_rank
+        self.love = love
+        self.max_love = max_love
+        self.skill_level = skill_level
+        self.favorite = favorite
+
+    @classmethod
+    def from_json(cls, unit):
+        '''Make a record from a unit as in the result of unit/unitAll.'''
+
+        rank = unit.get('rank', 1)
+        max_rank = unit.get('max_rank', 2)
+        max_level = unit['max_level']
+        rarity = unit.get('rarity')
+        if rarity is None:
+            rarity = _RARITY_BY_MAX_LEVEL.get((max_level, rank >= max_rank))
+        return cls(unit['unit_owning_user_id'], unit['unit_id'], rarity,
+                   unit['level'], max_level, unit.get('exp', 0), rank,
+                   max_rank, unit.get('love', 0), unit.get('max_love', 0),
+                   unit.get('unit_skill_level', 1),
+                   bool(unit.get('favorite_flag')))
+
+    @property
+    def is_level_max(self):
+        return self.level >= self.max_level
+
+    @property
+    def is_idolized(self):
+        return self.rank >= self.max_rank
+
+    def __repr__(self):
+        return '<UnitRecord {} unit_id={} rarity={} level={}/{}{}>'.format(
+            self.owning_id, self.unit_id, self.rarity, self.level,
+            self.max_level, ' favorite' if self.favorite else '')
+
+
+class UnitInventory(object):
+    '''The units of an account, indexed for queries.
+
+    Attributes:
+        decks: unit_deck_id -> tuple of unit_owning_user_ids
+        main_deck: unit_deck_id of the main deck, or None
+        stale: True once a call has changed the units in a way the
+            inventory could not follow; fetch unit/unitAll again to
+            refresh it'''
+
+    def __init__(self):
+        self.decks = OrderedDict()
+        self.main_deck = None
+        self.stale = False
+        self._units = {}
+        self._by_unit_id = {}
+        self._by_rarity = {}
+        self._by_level = {}
+        self._favorites = set()
+        self._in_deck = frozenset()
+
+    @classmethod
+    def from_response(cls, respobj):
+        '''Make an inventory from the response to LLSIFClient.unit_and_deck().'''
+
+        inventory = cls()
+        units, decks = respobj['response_data']
+        inventory.load_units(units['result'])
+        inventory.load_decks(decks['result'])
+        return inventory
+
+    def __len__(self):
+        return len(self._units)
+
+    def __contains__(self, owning_id):
+        return owning_id in self._units
+
+    def __iter__(self):
+        return iter(self._units.values())
+
+    def get(self, owning_id, default=None):
+        return self._units.get(owning_id, default)
+
+    def clear(self):
+        self._units.clear()
+        self._by_unit_id.clear()
+        self._by_rarity.clear()
+        self._by_level.clear()
+        self._favorites.clear()
+        self.decks.clear()
+        self._in_deck = frozenset()
+        self.main_deck = None
+        self.stale = False
+
+    # loading and updating
+
+    def load_units(self, units):
+        '''Replace the units with the result of unit/unitAll.'''
+
+        decks, main_deck = self.decks.copy(), self.main_deck
+        self.clear()
+        self._set_decks(decks, main_deck)
+        for unit in units:
+            self.add(unit)
+
+    def load_decks(self, decks):
+        '''Replace the decks with the result of unit/deckInfo.'''
+
+        self._set_decks(OrderedDict(
+            (deck['unit_deck_id'],
+             tuple(slot['unit_owning_user_id']
+                   for slot in deck.get('unit_owning_user_ids', ())))
+            for deck in decks), next((deck['unit_deck_id'] for deck in decks
+                                      if deck.get('main_flag')), None))
+
+    def _set_decks(self, decks, main_deck=None):
+        self.decks = decks
+        self.main_deck = main_deck
+        self._in_deck = frozenset(owning_id for members in decks.values()
+                                  for owning_id in members)
+
+    def add(self, unit):
+        '''Add or replace a unit, given as in the result of unit/unitAll.'''
+
+        record = UnitRecord.from_json(unit)
+        if record.owning_id in self._units:
+            self.remove(record.owning_id)
+        self._units[record.owning_id] = record
+        self._by_unit_id.setdefault(record.unit_id, set()).add(record.owning_id)
+        self._by_rarity.setdefault(record.rarity, set()).add(record.owning_id)
+        self._by_level.setdefault(record.level, set()).add(record.owning_id)
+        if record.favorite:
+            self._favorites.add(record.owning_id)
+        return record
+
+    def remove(self, owning_id):
+        '''Remove a unit; returns its record, or None if it was not there.'''
+
+        record = self._units.pop(owning_id, None)
+        if record is None:
+            return None
+        self._discard(self._by_unit_id, record.unit_id, owning_id)
+        self._discard(self._by_rarity, record.rarity, owning_id)
+        self._discard(self._by_level, record.level, owning_id)
+        self._favorites.discard(owning_id)
+        return record
+
+    @staticmethod
+    def _discard(index, key, owning_id):
+        members = index.get(key)
+        if members is not None:
+            members.discard(owning_id)
+            if not members:
+                del index[key]
+
+    def set_favorite(self, owning_id, favorite):
+        record = self._units.get(owning_id)
+        if record is None:
+            return
+        record.favorite = bool(favorite)
+        if record.favorite:
+            self._favorites.add(owning_id)
+        else:
+            self._favorites.discard(owning_id)
+
+    def observe(self, module, action, request, result):
+        '''Update the inventory from the successful result of a call.
+
+        request is the request as given to api_single_request() or
+        api_multiple_requests().'''
+
+        if module == 'unit':
+            if action == 'unitAll':
+                self.load_units(result)
+            elif action == 'deckInfo':
+                self.load_decks(result)
+            elif action == 'sale':
+                detail = result.get('detail') if isinstance(result, dict) else None
+                if detail is not None:
+                    removed = [unit['unit_owning_user_id'] for unit in detail]
+                else:
+                    removed = request.get('unit_owning_user_id', ())
+                for owning_id in removed:
+                    self.remove(owning_id)
+            elif action in ('merge', 'rankUp'):
+                self._observe_merge(request, result)
+            elif action == 'favorite':
+                self.set_favorite(request.get('unit_owning_user_id'),
+                                  request.get('favorite_flag'))
+            elif action == 'deck':
+                self.stale = True
+        elif (module, action) in _SCOUTS and isinstance(result, dict):
+            units = result.get('secret_box_items', {}).get('unit')
+            if units is None:
+                self.stale = True
+            for unit in units or ():
+                self.add(unit)
+        elif (module, action) in _ADDS_UNITS:
+            self.stale = True
+
+    def _observe_merge(self, request, result):
+        removed = result.get('unit_removed') if isinstance(result, dict) else None
+        if removed is None:
+            removed = request.get('unit_owning_user_ids', ())
+        for owning_id in removed:
+            self.remove(owning_id)
+        after = result.get('after') if isinstance(result, dict) else None
+        if after is not None:
+            self.add(after)
+        else:
+            self.stale = True
+
+    # queries
+
+    def find(self, rarity=None, unit_id=None, favorite=None, in_deck=None,
+             min_level=None, max_level=None, level_max=None, idolized=None):
+        '''Return the unit_owning_user_ids of the units matching all the
+        given conditions, oldest first.
+
+        rarity and unit_id may be a single value or a collection of them.
+        min_level and max_level bound the level; level_max selects units
+        at (or not at) their maximum level.'''
+
+        candidates = []
+        if unit_id is not None:
+            candidates.append(self._union(self._by_unit_id, unit_id))
+        if rarity is not None:
+            candidates.append(self._union(self._by_rarity, rarity))
+        if favorite:
+            candidates.append(self._favorites)
+        if in_deck:
+            candidates.append(self._in_deck)
+        if min_level is not None or max_level is not None:
+            candidates.append(self._union(self._by_level, [
+                level for level in self._by_level
+                if (min_level is None or level >= min_level) and
+                (max_level is None or level <= max_level)]))
+
+        if candidates:
+            candidates.sort(key=len)
+            matches = set(candidates[0]).intersection(*candidates[1:])
+        else:
+            matches = set(self._units)
+        if favorite is False:
+            matches -= self._favorites
+        if in_deck is False:
+            matches -= self._in_deck
+        if level_max is not None:
+            matches = set(owning_id for owning_id in matches
+                          if self._units[owning_id].is_level_max == level_max)
+        if idolized is not None:
+            matches = set(owning_id for owning_id in matches
+                          if self._units[owning_id].is_idolized == idolized)
+        return sorted(matches)
+
+    @staticmethod
+    def _union(index, keys):
+        if not isinstance(keys, (list, tuple, set, frozenset)):
+            return index.get(keys, ())
+        result = set()
+        for key in keys:
+            result.update(index.get(key, ()))
+        return result
+
+    def count(self, **conditions):
+        return len(self.find(**conditions))
+
+    def in_deck(self, owning_id):
+        return owning_id in self._in_deck
+
+    def favorites(self):
+        return sorted(self._favorites)
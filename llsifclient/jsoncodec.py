@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""JSON encoding and decoding with an optional fast backend.
+
+orjson is used when it is installed, ujson (for decoding only) otherwise,
+and the stdlib json module as the fallback.
+
+Request bodies are signed with X-Message-Code over their exact bytes, so
+dumps() must give the same bytes as
+json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+whichever backend is used. orjson matches that for strings, integers,
+booleans, None, lists and dicts with string keys; for anything else (floats
+in particular, which it formats differently) dumps() uses the stdlib.
+"""
+
+import json
+import logging
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+# orjson serializes integers in this range natively
+_ORJSON_INT_MIN = -2 ** 63
+_ORJSON_INT_MAX = 2 ** 64 - 1
+# Runs of this many digits may be integers beyond that range, which some
+# orjson versions decode as floats instead of rejecting them
+_LONG_DIGITS = 20
+_LONG_DIGITS_TEXT = re.compile(r'[0-9]{20}')
+# Digits to b'0', everything else to b' '
+_DIGIT_MAP = bytes(48 if 48 <= i <= 57 else 32 for i in range(256))
+_SCAN_CHUNK = 64 * 1024
+
+backend = None
+
+
+def use_backend(name):
+    '''Select the backend by name. Raises ValueError if it isn't installed.'''
+
+    global backend
+    if name not in BACKENDS:
+        raise ValueError('Unknown JSON backend {}'.format(name))
+    if name == 'orjson' and orjson is None or name == 'ujson' and ujson is None:
+        raise ValueError('JSON backend {} is not installed'.format(name))
+    backend = name
+    logger.debug('Using JSON backend %s', name)
+
+
+def _orjson_safe(obj):
+    '''True if orjson encodes obj byte-for-byte like the stdlib.'''
+
+    kind = type(obj)
+    if kind is str or kind is bool or obj is None:
+        return True
+    if kind is int:
+        return _ORJSON_INT_MIN <= obj <= _ORJSON_INT_MAX
+    if isinstance(obj, (list, tuple)):
+        return all(_orjson_safe(item) for item in obj)
+    if isinstance(obj, dict):
+        return all(type(key) is str and _orjson_safe(value)
+                   for key, value in obj.items())
+    return False
+
+
+def _has_long_digits(data):
+    '''True if data has a run of _LONG_DIGITS digits.'''
+
+    if isinstance(data, str):
+        return _LONG_DIGITS_TEXT.search(data) is not None
+    # translate() is much faster than a regular expression here; scan in
+    # overlapping chunks to not copy the whole body
+    view = memoryview(data)
+    run = b'0' * _LONG_DIGITS
+    for start in range(0, len(view), _SCAN_CHUNK):
+        chunk = view[start:start + _SCAN_CHUNK + _LONG_DIGITS - 1]
+        if run in bytes(chunk).translate(_DIGIT_MAP):
+            return True
+    return False
+
+
+def dumps_stdlib(obj):
+    '''Reference encoding of request bodies.'''
+
+    return _encoder.encode(obj).encode('utf-8')
+
+
+def dumps(obj):
+    '''Encode obj as compact UTF-8 JSON bytes.'''
+
+    if backend == 'orjson' and _orjson_safe(obj):
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # e.g. lone surrogates; let the stdlib decide
+            pass
+    return dumps_stdlib(obj)
+
+
+def loads(data, encoding='utf-8'):
+    '''Decode JSON from bytes in the given encoding, or from str.'''
+
+    if isinstance(data, (bytes, bytearray, memoryview)) and \
+            encoding.replace('-', '').lower() != 'utf8':
+        data = bytes(data).decode(encoding)
+
+    if backend == 'orjson' and not _has_long_digits(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects some input the stdlib accepts, like NaN;
+            # retry below.
+            pass
+    elif backend == 'ujson':
+        try:
+            return ujson.loads(data)
+        except ValueError:
+            pass
+
+    if not isinstance(data, str):
+        data = bytes(data).decode('utf-8')
+    return json.loads(data)
+
+
+if orjson is not None:
+    use_backend('orjson')
+elif ujson is not None:
+    use_backend('ujson')
+else:
+    use_backend('json')
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""Per-phase timing of requests to the server.
+
+    metrics = RequestMetrics()
+    LLSIFClient.METRICS = metrics
+    metrics.after_request(StatsdExporter('127.0.0.1', 8125))
+    ...
+    print(metrics.summary())
+    open('metrics.prom', 'w').write(metrics.prometheus_text())
+
+Every request is timed phase by phase (see PHASES) and the times are
+recorded in histograms keyed by endpoint and phase. The endpoint of a
+single request is its module/action, e.g. "unit/unitAll"; multi-requests
+are "api". Callbacks registered with before_request() and after_request()
+get the RequestTiming of every request.
+
+With LLSIFClient.METRICS = None (the default) nothing is timed.
+"""
+
+import bisect
+import logging
+import socket
+import threading
+import time
+
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Phases of a request, in order:
+#   build: building headers, signing and encoding the body
+#   queue: waiting for the rate limits and retry backoff
+#   connect: opening a new connection
+#   send: sending the request
+#   wait: waiting for the response headers (time to first byte)
+#   read: reading the body from the socket
+#   decompress: gunzipping the body
+#   verify: computing the X-Message-Code of the response
+#   decode: checking the response and decoding its JSON
+PHASES = ('build', 'queue', 'connect', 'send', 'wait', 'read', 'decompress',
+          'verify', 'decode')
+
+# Upper bounds of the histogram buckets in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def endpoint_of(url):
+    '''Return the endpoint label of a request url.'''
+
+    path = url.split('?', 1)[0]
+    if path.startswith('/main.php/'):
+        return path[len('/main.php/'):]
+    if path.startswith('/webview.php/'):
+        return 'webview/' + path[len('/webview.php/'):]
+    return path
+
+
+class RequestTiming(object):
+    '''Timing of one request, possibly over several attempts.
+
+    Attributes:
+        url
+        endpoint
+        phases: phase -> seconds, summed over attempts
+        attempts
+        status: HTTP status of the response, None if there was none
+        error: the exception that ended the request, or None'''
+
+    __slots__ = ('url', 'endpoint', 'phases', 'attempts', 'status', 'error',
+                 'started', 'finished', '_last', '_carved')
+
+    def __init__(self, url):
+        self.url = url
+        self.endpoint = endpoint_of(url)
+        self.phases = {}
+        self.attempts = 0
+        self.status = None
+        self.error = None
+        self.started = self._last = time.perf_counter()
+        self.finished = None
+        self._carved = 0.0
+
+    def mark(self, phase):
+        '''Charge the time since the previous mark to phase.'''
+
+        now = time.perf_counter()
+        elapsed = now - self._last - self._carved
+        self._last = now
+        self._carved = 0.0
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+
+    def carve(self, phase, seconds):
+        '''Charge seconds, which are part of the running phase, to phase
+        instead.'''
+
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self._carved += seconds
+
+    @property
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+
+class TimedVerifier(object):
+    '''Wraps an X-Message-Code verifier to charge its time to "verify".'''
+
+    __slots__ = ('verifier', 'timing')
+
+    def __init__(self, verifier, timing):
+        self.verifier = verifier
+        self.timing = timing
+
+    def update(self, data):
+        started = time.perf_counter()
+        self.verifier.update(data)
+        self.timing.carve('verify', time.perf_counter() - started)
+
+    def hexdigest(self):
+        return self.verifier.hexdigest()
+
+
+class Histogram(object):
+    '''Counts of observed values in fixed buckets.'''
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # the last count is for values above all the buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, pct):
+        '''Upper bound of the bucket holding the pct-th percentile, None if
+        nothing was observed.'''
+
+        if not self.count:
+            return None
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+
+class RequestMetrics(object):
+    '''Thread-safe registry of request timings.
+
+    Attributes:
+        histograms: (endpoint, phase) -> Histogram; phase "total" is the
+            whole request
+        responses: (endpoint, HTTP status or error class name) -> count'''
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.responses = Counter()
+        self._before = []
+        self._after = []
+        self._lock = threading.Lock()
+
+    def before_request(self, callback):
+        '''Call callback(timing) when a request starts. Returns callback.'''
+
+        self._before.append(callback)
+        return callback
+
+    def after_request(self, callback):
+        '''Call callback(timing) when a request has finished or failed.
+        Returns callback.'''
+
+        self._after.append(callback)
+        return callback
+
+    def start(self, url):
+        timing = RequestTiming(url)
+        for callback in self._before:
+            callback(timing)
+        return timing
+
+    def finish(self, timing, status=None, error=None):
+        timing.finished = time.perf_counter()
+        timing.status = status
+        timing.error = error
+        outcome = status if error is None else type(error).__name__
+        with self._lock:
+            for phase, seconds in timing.phases.items():
+                self._histogram(timing.endpoint, phase).observe(seconds)
+            self._histogram(timing.endpoint, 'total').observe(timing.total)
+            self.responses[(timing.endpoint, outcome)] += 1
+        for callback in self._after:
+            try:
+                callback(timing)
+            except Exception:
+                logger.exception('after_request callback failed')
+
+    def _histogram(self, endpoint, phase):
+        histogram = self.histograms.get((endpoint, phase))
+        if histogram is None:
+            histogram = self.histograms[(endpoint, phase)] = \
+                Histogram(self.buckets)
+        return histogram
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.responses.clear()
+
+    def summary(self):
+        '''Mean and 99th percentile of every phase, slowest endpoints first.'''
+
+        with self._lock:
+            items = sorted(self.histograms.items())
+        totals = dict((endpoint, histogram.sum) for (endpoint, phase), histogram
+                      in items if phase == 'total')
+        lines = []
+        for endpoint in sorted(totals, key=totals.get, reverse=True):
+            total = self.histograms[(endpoint, 'total')]
+            parts = []
+            for phase in PHASES:
+                histogram = self.histograms.get((endpoint, phase))
+                if histogram is not None and histogram.sum:
+                    parts.append('{} {:.1f}'.format(
+                        phase, histogram.mean * 1000))
+            lines.append('{}: {} requests, mean {:.1f} ms, p99 <= {:g} ms '
+                         '({})'.format(endpoint, total.count, total.mean * 1000,
+                                       total.percentile(99) * 1000,
+                                       ', '.join(parts)))
+        return '\n'.join(lines)
+
+    def prometheus_text(self, prefix='llsif_request'):
+        '''Return the metrics in the Prometheus text exposition format.'''
+
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            responses = sorted(self.responses.items(), key=str)
+        lines = ['# HELP {}_seconds Time spent in each phase of requests.'.format(prefix),
+                 '# TYPE {}_seconds histogram'.format(prefix)]
+        for (endpoint, phase), histogram in histograms:
+            labels = 'endpoint="{}",phase="{}"'.format(endpoint, phase)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append('{}_seconds_bucket{{{},le="{:g}"}} {}'.format(
+                    prefix, labels, bound, cumulative))
+            lines.append('{}_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                prefix, labels, histogram.count))
+            lines.append('{}_seconds_sum{{{}}} {!r}'.format(
+                prefix, labels, histogram.sum))
+            lines.append('{}_seconds_count{{{}}} {}'.format(
+                prefix, labels, histogram.count))
+        lines.append('# HELP {}s_total Requests by endpoint and outcome.'.format(prefix))
+        lines.append('# TYPE {}s_total counter'.format(prefix))
+        for (endpoint, outcome), count in responses:
+            lines.append('{}s_total{{endpoint="{}",outcome="{}"}} {}'.format(
+                prefix, endpoint, outcome, count))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdExporter(object):
+    '''after_request() callback sending the phase times of every request
+    to StatsD over UDP, as <prefix>.<endpoint>.<phase>:<ms>|ms.'''
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='llsif'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, timing):
+        name = '{}.{}'.format(self.prefix, timing.endpoint.replace('/', '.'))
+        lines = ['{}.{}:{:.3f}|ms'.format(name, phase, seconds * 1000)
+                 for phase, seconds in timing.phases.items()]
+        lines.append('{}.total:{:.3f}|ms'.format(name, timing.total * 1000))
+        lines.append('{}.{}:1|c'.format(
+            name, timing.status if timing.error is None else 'error'))
+        try:
+            self._sock.sendto('\n'.join(lines).encode('ascii'), self.address)
+        except OSError as exc:
+            logger.debug('Sending to StatsD failed: %r', exc)
+
+    def close(self):
+        self._sock.close()
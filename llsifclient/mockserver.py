@@ -0,0 +1,879 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for the LLSIF game server.
+
+Serves enough of the API for LLSIFClient and AsyncLLSIFClient to run their
+workflows without network access: login/authkey, login/login,
+login/startUp, /main.php/api multi-requests, and the user, tos, reward,
+secretbox, unit and webview endpoints. Responses are gzipped JSON shaped
+like the real server's and signed with X-Message-Code.
+
+    server = MockLLSIFServer(latency=0.02)
+    server.start()
+
+    client = LLSIFClient()
+    client.SERVER_HOST = server.host
+    client.startapp(*client.gen_new_credentials())
+
+    # the next two requests get 503 Service Unavailable
+    server.inject('status', status=503, times=2)
+
+    server.stop()
+
+Unknown login_keys are registered on first login unless auto_register is
+False. Endpoints without a handler return an empty response_data.
+
+From the command line:
+
+    python -m llsifclient.mockserver --port 8080 --latency 0.05
+"""
+
+import argparse
+import gzip
+import hashlib
+import hmac
+import http.server
+import json
+import logging
+import random
+import re
+import socket
+import struct
+import threading
+import time
+
+from collections import Counter, OrderedDict
+from urllib.parse import parse_qsl
+
+from .settings import HMAC_SIGNITURE_KEY
+
+logger = logging.getLogger(__name__)
+
+FAULT_KINDS = ('status', 'no_content', 'maintenance', 'timeout', 'reset')
+
+# error_codes returned with status_code 600
+ERROR_LOGIN_FAILED = 407
+ERROR_HANDOVER_INVALID = 4402
+ERROR_UNIT_MAX = 1202
+ERROR_INVALID_UNIT = 1301
+ERROR_TOO_MANY_UNITS = 1302
+ERROR_INVALID_INCENTIVE = 1401
+
+# unit/sale and unit/merge reject longer lists
+SALE_LIMIT = 30
+MERGE_LIMIT = 12
+
+PRESENT_PAGE_SIZE = 20
+
+# rarity -> (max_level, max_level when idolized, sale price)
+RARITY_STATS = {1: (30, 40, 10),
+                2: (40, 60, 100),
+                3: (60, 80, 1000),
+                4: (80, 100, 10000),
+                5: (70, 90, 5000)}
+RARITY_WEIGHTS = ((1, 60), (2, 30), (3, 8), (5, 1), (4, 1))
+
+UNIT_ADD_TYPE = 1001
+ITEM_ADD_TYPE = 1000
+
+
+class Fault(object):
+    '''An injected failure, applied to the next matching requests.'''
+
+    def __init__(self, kind, times=1, path=None, probability=1.0,
+                 status=503, delay=15):
+        if kind not in FAULT_KINDS:
+            raise ValueError('Unknown fault {}'.format(kind))
+        self.kind = kind
+        self.times = times
+        self.path = path
+        self.probability = probability
+        self.status = status
+        self.delay = delay
+
+    def matches(self, path):
+        return self.path is None or path.startswith(self.path)
+
+
+class MockAccount(object):
+    '''Server side state of one account.'''
+
+    def __init__(self, user_id, login_key, login_passwd):
+        self.user_id = user_id
+        self.login_key = login_key
+        self.login_passwd = login_passwd
+        self.name = ''
+        self.tos_agreed = False
+        self.tutorial_state = 0
+        self.game_coin = 100000
+        self.sns_coin = 50
+        self.unit_max = 300
+        self.units = OrderedDict()
+        self.decks = []
+        self.presents = OrderedDict()
+        self.next_unit_id = user_id * 10000
+        self.handover_code = None
+
+
+class MockLLSIFServer(object):
+    '''Threaded HTTP server emulating the game server.
+
+    latency is a delay in seconds added to every response, or a (min, max)
+    tuple to pick one at random. units and presents are the sizes of the
+    unit list and present box of new accounts. Requests with a token the
+    server did not issue get 403 Forbidden. Requests with a wrong
+    X-Message-Code are counted in bad_signatures, and also get 403 with
+    strict.'''
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, units=200,
+                 presents=100, key=HMAC_SIGNITURE_KEY, server_version=None,
+                 auto_register=True, strict=False, seed=None):
+        self.latency = latency
+        self.units = units
+        self.presents = presents
+        self.key = key
+        self.server_version = server_version
+        self.auto_register = auto_register
+        self.strict = strict
+        self.random = random.Random(seed)
+
+        self.accounts = {}
+        self.tokens = {}
+        self.requests = Counter()
+        self.bad_signatures = 0
+        self.bad_tokens = 0
+        self._faults = []
+        self._next_user_id = 1000000
+        self._next_incentive_id = 1
+        self._lock = threading.RLock()
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port),
+                                                     MockRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self._thread = None
+
+    @property
+    def host(self):
+        '''host:port to use as LLSIFClient.SERVER_HOST.'''
+
+        host, port = self.httpd.server_address[:2]
+        return '{}:{}'.format(host, port)
+
+    def start(self):
+        '''Serve in a background thread.'''
+
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        name='mockserver', daemon=True)
+        self._thread.start()
+        logger.info('Mock server listening on %s', self.host)
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # Fault injection
+
+    def inject(self, kind, times=1, path=None, probability=1.0, status=503,
+               delay=15):
+        '''Make the next matching requests fail.
+
+        kind is one of:
+            'status': respond with HTTP status (5xx by default)
+            'no_content': respond with 204 No Content
+            'maintenance': respond with the "Maintenance: 1" header
+            'timeout': send nothing for delay seconds, then close
+            'reset': close the connection with a TCP reset
+        Only requests whose path starts with path match. times is the number
+        of requests to fail, None for no limit; each matching request fails
+        with the given probability.'''
+
+        fault = Fault(kind, times, path, probability, status, delay)
+        with self._lock:
+            self._faults.append(fault)
+        return fault
+
+    def clear_faults(self):
+        with self._lock:
+            del self._faults[:]
+
+    def _take_fault(self, path):
+        with self._lock:
+            for fault in self._faults:
+                if not fault.matches(path):
+                    continue
+                if fault.probability < 1 and \
+                        self.random.random() >= fault.probability:
+                    continue
+                if fault.times is not None:
+                    fault.times -= 1
+                    if fault.times <= 0:
+                        self._faults.remove(fault)
+                return fault
+        return None
+
+    # Accounts
+
+    def add_account(self, login_key, login_passwd, units=None, presents=None):
+        '''Create an account with units and presents of random content.'''
+
+        with self._lock:
+            user_id = self._next_user_id
+            self._next_user_id += 1
+            account = MockAccount(user_id, login_key, login_passwd)
+            for _ in range(self.units if units is None else units):
+                self._new_unit(account)
+            owning_ids = list(account.units)[:9]
+            account.decks = [OrderedDict([
+                ('unit_deck_id', 1),
+                ('main_flag', True),
+                ('deck_name', 'ユニット 1'),
+                ('unit_owning_user_ids', [
+                    OrderedDict([('position', position + 1),
+                                 ('unit_owning_user_id', owning_id)])
+                    for position, owning_id in enumerate(owning_ids)])])]
+            for _ in range(self.presents if presents is None else presents):
+                self._new_present(account)
+            self.accounts[login_key] = account
+        return account
+
+    def _new_unit(self, account, unit_id=None, rarity=None):
+        if rarity is None:
+            rarity = self._random_rarity()
+        if unit_id is None:
+            unit_id = self.random.randrange(1, 1500)
+        max_level = RARITY_STATS[rarity][0]
+        level = self.random.randrange(1, max_level + 1)
+        account.next_unit_id += 1
+        unit = OrderedDict([
+            ('unit_owning_user_id', account.next_unit_id),
+            ('unit_id', unit_id),
+            ('rarity', rarity),
+            ('exp', level * 100),
+            ('next_exp', 0 if level == max_level else (level + 1) * 100),
+            ('level', level),
+            ('max_level', max_level),
+            ('rank', 1),
+            ('max_rank', 2),
+            ('love', 0),
+            ('max_love', 25 * rarity),
+            ('unit_skill_level', 1),
+            ('max_hp', rarity + 1),
+            ('favorite_flag', False),
+            ('display_rank', 1),
+            ('is_rank_max', False),
+            ('is_love_max', False),
+            ('is_level_max', level == max_level),
+            ('is_skill_level_max', False),
+            ('insert_date', time.strftime('%Y-%m-%d %H:%M:%S'))])
+        account.units[unit['unit_owning_user_id']] = unit
+        return unit
+
+    def _random_rarity(self):
+        pick = self.random.randrange(sum(w for _, w in RARITY_WEIGHTS))
+        for rarity, weight in RARITY_WEIGHTS:
+            if pick < weight:
+                return rarity
+            pick -= weight
+        return 1
+
+    def _new_present(self, account):
+        incentive_id = self._next_incentive_id
+        self._next_incentive_id += 1
+        if self.random.random() < 0.5:
+            add_type = UNIT_ADD_TYPE
+            item_id = self.random.randrange(1, 1500)
+            amount = 1
+            message = 'Member reward'
+        else:
+            add_type = ITEM_ADD_TYPE
+            item_id = self.random.randrange(1, 6)
+            amount = self.random.choice((1, 5, 100, 1000))
+            message = 'Login bonus'
+        account.presents[incentive_id] = OrderedDict([
+            ('incentive_id', incentive_id),
+            ('incentive_item_id', item_id),
+            ('add_type', add_type),
+            ('amount', amount),
+            ('item_category_id', 0 if add_type == UNIT_ADD_TYPE else item_id),
+            ('incentive_message', message),
+            ('insert_date', time.strftime('%Y-%m-%d %H:%M:%S')),
+            ('remaining_time', '')])
+
+    # Request handling
+
+    def sign(self, body):
+        return hmac.new(self.key, body, hashlib.sha1).hexdigest()
+
+    def _sleep_latency(self):
+        if isinstance(self.latency, tuple):
+            delay = self.random.uniform(*self.latency)
+        else:
+            delay = self.latency
+        if delay:
+            time.sleep(delay)
+
+    def handle(self, handler, method):
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        path = handler.path.split('?', 1)[0]
+
+        with self._lock:
+            self.requests[path] += 1
+
+        fault = self._take_fault(path)
+        self._sleep_latency()
+        if fault is not None and self._apply_fault(handler, fault):
+            return
+
+        if method == 'GET':
+            if path.startswith('/webview.php/'):
+                self._send(handler, 200, self._webview_page(path),
+                           'text/html; charset=UTF-8')
+            else:
+                self._send(handler, 404, b'', 'text/html; charset=UTF-8')
+            return
+
+        try:
+            status, respobj = self.dispatch(path, handler.headers, body)
+        except Exception:
+            logger.exception('Error handling %s', path)
+            status, respobj = (500, {'code': 500, 'message': ''})
+        extra = [('Maintenance', '1')] if fault is not None else []
+        self._send_json(handler, status, respobj, extra)
+
+    def _apply_fault(self, handler, fault):
+        '''Apply fault to the response. Returns True if nothing else is to
+        be sent.'''
+
+        logger.debug('Injecting fault %s on %s', fault.kind, handler.path)
+        if fault.kind == 'status':
+            self._send(handler, fault.status, b'', 'text/html; charset=UTF-8')
+        elif fault.kind == 'no_content':
+            self._send(handler, 204, None, None)
+        elif fault.kind == 'maintenance':
+            # the response itself is normal, see handle()
+            return False
+        elif fault.kind == 'timeout':
+            time.sleep(fault.delay)
+            handler.close_connection = True
+        elif fault.kind == 'reset':
+            handler.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                          struct.pack('ii', 1, 0))
+            handler.close_connection = True
+        return True
+
+    def dispatch(self, path, headers, body):
+        '''Return (HTTP status, response object) for a POST.'''
+
+        requestdata = self._request_data(headers, body)
+        if requestdata is not None:
+            if headers.get('X-Message-Code') != self.sign(requestdata):
+                with self._lock:
+                    self.bad_signatures += 1
+                logger.warning('Bad X-Message-Code on %s', path)
+                if self.strict:
+                    return (403, {'code': 10002, 'message': ''})
+            request = json.loads(requestdata.decode('utf-8'))
+        else:
+            request = None
+
+        authorize = dict(parse_qsl(headers.get('Authorize') or ''))
+        token = authorize.get('token')
+
+        if path == '/main.php/login/authkey':
+            return (200, self._response(self._authkey()))
+
+        with self._lock:
+            known = token in self.tokens
+            if not known:
+                self.bad_tokens += 1
+        if not known:
+            logger.warning('Unknown token on %s', path)
+            return (403, {'code': 10001, 'message': ''})
+
+        if path == '/main.php/login/login':
+            return (200, self._login(token, request))
+        if path == '/main.php/login/startUp':
+            return (200, self._startup(token, request))
+        if path == '/main.php/login/startWithoutInvite':
+            return (200, self._response([]))
+
+        account = self.tokens.get(token)
+        if path == '/main.php/api':
+            results = []
+            for item in request:
+                result, status = self.call(account, item['module'],
+                                           item['action'], item)
+                results.append(OrderedDict([('result', result),
+                                            ('status', status),
+                                            ('commandNum', False),
+                                            ('timeStamp', int(time.time()))]))
+            return (200, self._response(results))
+
+        match = re.match('/main.php/([^/]+)/([^/]+)$', path)
+        if match is None:
+            return (404, {'code': 404, 'message': 'Not Found'})
+        result, status = self.call(account, match.group(1), match.group(2),
+                                   request or {})
+        return (200, self._response(result, status))
+
+    @staticmethod
+    def _request_data(headers, body):
+        '''Extract request_data from a multipart/form-data body.'''
+
+        match = re.search('boundary=([^; ]+)', headers.get('Content-Type') or '')
+        if not body or match is None:
+            return None
+        delimiter = b'--' + match.group(1).encode('ascii')
+        for part in body.split(delimiter):
+            head, sep, content = part.partition(b'\r\n\r\n')
+            if sep and b'name="request_data"' in head:
+                return content[:-2] if content.endswith(b'\r\n') else content
+        return None
+
+    @staticmethod
+    def _response(response_data, status=200):
+        return OrderedDict([('response_data', response_data),
+                            ('status_code', status)])
+
+    def _send_json(self, handler, status, respobj, extra_headers=()):
+        body = json.dumps(respobj, separators=(',', ':'),
+                          ensure_ascii=False).encode('utf-8')
+        headers = [('X-Message-Code', self.sign(body)),
+                   ('version_up', '0'),
+                   ('Server-Version', self.server_version or
+                    handler.headers.get('Client-Version') or '')]
+        headers.extend(extra_headers)
+        self._send(handler, status, body, 'application/json; charset=utf-8',
+                   headers)
+
+    def _send(self, handler, status, body, contenttype, headers=()):
+        handler.send_response(status)
+        if body is not None:
+            if 'gzip' in (handler.headers.get('Accept-Encoding') or ''):
+                body = gzip.compress(body, 6)
+                handler.send_header('Content-Encoding', 'gzip')
+            handler.send_header('Content-Type', contenttype)
+            handler.send_header('Content-Length', str(len(body)))
+        for key, value in headers:
+            handler.send_header(key, value)
+        handler.end_headers()
+        if body:
+            handler.wfile.write(body)
+
+    def _webview_page(self, path):
+        return ('<!DOCTYPE html><html><head><meta charset="UTF-8">'
+                '<title>お知らせ</title></head><body>' +
+                '<div class="notice">{}</div>'.format(path) * 50 +
+                '</body></html>').encode('utf-8')
+
+    # Session endpoints
+
+    def _new_token(self, account=None):
+        token = ''.join(self.random.choice(
+            'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789')
+            for _ in range(80))
+        with self._lock:
+            self.tokens[token] = account
+        return token
+
+    def _authkey(self):
+        return OrderedDict([('authorize_token', self._new_token()),
+                            ('dummy_token', '')])
+
+    def _login(self, token, request):
+        login_key = request.get('login_key')
+        login_passwd = request.get('login_passwd')
+        account = self.accounts.get(login_key)
+        if account is None and self.auto_register:
+            account = self.add_account(login_key, login_passwd)
+            account.tos_agreed = True
+        if account is None or account.login_passwd != login_passwd:
+            return self._response({'error_code': ERROR_LOGIN_FAILED}, 600)
+        with self._lock:
+            self.tokens.pop(token, None)
+        return self._response(OrderedDict([
+            ('authorize_token', self._new_token(account)),
+            ('user_id', account.user_id),
+            ('review_version', ''),
+            ('server_timestamp', int(time.time()))]))
+
+    def _startup(self, token, request):
+        account = self.add_account(request['login_key'],
+                                   request['login_passwd'], units=0,
+                                   presents=0)
+        for unit_id in range(1, 12):
+            self._new_unit(account, unit_id, rarity=1)
+        with self._lock:
+            self.tokens[token] = account
+        return self._response(OrderedDict([
+            ('login_key', account.login_key),
+            ('login_passwd', account.login_passwd),
+            ('user_id', account.user_id)]))
+
+    # API calls
+
+    def call(self, account, module, action, request):
+        '''Run one API call. Returns (result, status).'''
+
+        method = getattr(self, 'api_{}_{}'.format(module, action), None)
+        if method is None:
+            return (self._filler(module, action), 200)
+        with self._lock:
+            return method(account, request)
+
+    def _filler(self, module, action):
+        '''Plausibly sized response for calls without a handler.'''
+
+        if module == 'payment' and action == 'productList':
+            return OrderedDict([('restriction_info', {'restricted': False}),
+                                ('sns_product_list', [
+                                    OrderedDict([('product_id', 'com.klab.lovelive.{}'.format(i)),
+                                                 ('name', 'ラブカストーン{}個'.format(i)),
+                                                 ('price', 120 * i),
+                                                 ('can_buy', True)])
+                                    for i in range(1, 30)])])
+        if module == 'banner' and action == 'bannerList':
+            return OrderedDict([('time_limit', '2037-12-31 23:59:59'),
+                                ('member_category_list', [
+                                    OrderedDict([('banner_type', i % 3),
+                                                 ('target_id', i),
+                                                 ('asset_path', 'assets/image/banner/banner_{:03d}.png'.format(i)),
+                                                 ('webview_url', '/webview.php/announce/detail?id={}'.format(i))])
+                                    for i in range(40)])])
+        if module == 'album' and action == 'albumAll':
+            return [OrderedDict([('unit_id', i), ('rank_max_flag', False),
+                                 ('love_max_flag', False),
+                                 ('rank_level_max_flag', False),
+                                 ('all_max_flag', False),
+                                 ('highest_love_per_unit', 0),
+                                 ('total_love', 0),
+                                 ('favorite_point', 0)])
+                    for i in range(1, 600)]
+        return []
+
+    def api_user_userInfo(self, account, request):
+        return (OrderedDict([('user', OrderedDict([
+            ('user_id', account.user_id),
+            ('name', account.name),
+            ('level', 1),
+            ('exp', 0),
+            ('next_exp', 11),
+            ('game_coin', account.game_coin),
+            ('sns_coin', account.sns_coin),
+            ('unit_max', account.unit_max),
+            ('energy_max', 25),
+            ('friend_max', 10),
+            ('tutorial_state', account.tutorial_state)]))]), 200)
+
+    def api_user_changeName(self, account, request):
+        before = account.name
+        account.name = request['name']
+        return (OrderedDict([('before_name', before),
+                             ('after_name', account.name)]), 200)
+
+    def api_personalnotice_get(self, account, request):
+        return (OrderedDict([('has_notice', False), ('notice_id', 0),
+                             ('type', 0), ('title', ''), ('contents', '')]),
+                200)
+
+    def api_tos_tosCheck(self, account, request):
+        return (OrderedDict([('tos_id', 1), ('is_agreed', account.tos_agreed)]),
+                200)
+
+    def api_tos_tosAgree(self, account, request):
+        account.tos_agreed = True
+        return ([], 200)
+
+    def api_platformAccount_isConnectedLlAccount(self, account, request):
+        return (OrderedDict([('is_connected', False)]), 200)
+
+    def api_lbonus_execute(self, account, request):
+        return (OrderedDict([
+            ('sheets', []),
+            ('calendar_info', OrderedDict([
+                ('current_date', time.strftime('%Y-%m-%d %H:%M:%S')),
+                ('current_month', OrderedDict([('year', 2016), ('month', 4),
+                                               ('days', [])]))])),
+            ('total_login_info', OrderedDict([('login_count', 1),
+                                              ('remaining_count', 0)]))]),
+            200)
+
+    def api_tutorial_progress(self, account, request):
+        account.tutorial_state = request['tutorial_state']
+        return ([], 200)
+
+    def api_tutorial_skip(self, account, request):
+        account.tutorial_state = -1
+        return ([], 200)
+
+    def api_login_unitList(self, account, request):
+        return (OrderedDict([('unit_initial_set', [
+            OrderedDict([('unit_initial_set_id', i),
+                         ('unit_list', list(range(i * 9, i * 9 + 9))),
+                         ('center_unit_id', i * 9)])
+            for i in range(1, 10)])]), 200)
+
+    def api_login_unitSelect(self, account, request):
+        return (OrderedDict([('unit_id', list(range(1, 10)))]), 200)
+
+    def api_handover_start(self, account, request):
+        account.handover_code = '{:08X}'.format(self.random.randrange(16 ** 8))
+        return (OrderedDict([('code', account.handover_code)]), 200)
+
+    def api_handover_exec(self, account, request):
+        for source in self.accounts.values():
+            if source.handover_code is not None and \
+                    source.handover_code == request['handover']:
+                source.handover_code = None
+                del self.accounts[source.login_key]
+                source.login_key = account.login_key
+                source.login_passwd = account.login_passwd
+                self.accounts[account.login_key] = source
+                return (True, 200)
+        return ({'error_code': ERROR_HANDOVER_INVALID}, 600)
+
+    # unit
+
+    def api_unit_unitAll(self, account, request):
+        return (list(account.units.values()), 200)
+
+    def api_unit_deckInfo(self, account, request):
+        return (account.decks, 200)
+
+    def _owned_units(self, account, owning_ids, limit):
+        if len(owning_ids) > limit:
+            return None, ({'error_code': ERROR_TOO_MANY_UNITS}, 600)
+        if len(set(owning_ids)) != len(owning_ids) or \
+                any(owning_id not in account.units for owning_id in owning_ids):
+            return None, ({'error_code': ERROR_INVALID_UNIT}, 600)
+        return [account.units[owning_id] for owning_id in owning_ids], None
+
+    def api_unit_sale(self, account, request):
+        units, error = self._owned_units(
+            account, request['unit_owning_user_id'], SALE_LIMIT)
+        if error:
+            return error
+        before = account.game_coin
+        detail = []
+        for unit in units:
+            price = RARITY_STATS[unit['rarity']][2] * unit['level']
+            detail.append(OrderedDict([
+                ('unit_owning_user_id', unit['unit_owning_user_id']),
+                ('unit_id', unit['unit_id']),
+                ('price', price)]))
+            account.game_coin += price
+            del account.units[unit['unit_owning_user_id']]
+        return (OrderedDict([
+            ('total', account.game_coin - before),
+            ('detail', detail),
+            ('before_user_info', OrderedDict([('game_coin', before)])),
+            ('after_user_info', OrderedDict([('game_coin', account.game_coin)]))]),
+            200)
+
+    def api_unit_merge(self, account, request):
+        base = account.units.get(request['base_owning_unit_user_id'])
+        partners, error = self._owned_units(
+            account, request['unit_owning_user_ids'], MERGE_LIMIT)
+        if error:
+            return error
+        if base is None or base in partners:
+            return ({'error_code': ERROR_INVALID_UNIT}, 600)
+        before = OrderedDict(base)
+        gained = sum(partner['level'] * 100 * partner['rarity']
+                     for partner in partners)
+        base['exp'] += gained
+        base['level'] = min(base['max_level'], base['exp'] // 100)
+        base['is_level_max'] = base['level'] == base['max_level']
+        base['next_exp'] = 0 if base['is_level_max'] else (base['level'] + 1) * 100
+        for partner in partners:
+            del account.units[partner['unit_owning_user_id']]
+        account.game_coin -= 100 * len(partners)
+        return (OrderedDict([('before', before), ('after', OrderedDict(base)),
+                             ('use_game_coin', 100 * len(partners)),
+                             ('unit_removed', [p['unit_owning_user_id']
+                                               for p in partners])]), 200)
+
+    def api_unit_rankUp(self, account, request):
+        base = account.units.get(request['base_owning_unit_user_id'])
+        partners, error = self._owned_units(
+            account, request['unit_owning_user_ids'], 1)
+        if error:
+            return error
+        if base is None or base in partners or \
+                partners[0]['unit_id'] != base['unit_id'] and \
+                base['rarity'] != 1:
+            return ({'error_code': ERROR_INVALID_UNIT}, 600)
+        before = OrderedDict(base)
+        base['rank'] = base['display_rank'] = base['max_rank']
+        base['is_rank_max'] = True
+        base['max_level'] = RARITY_STATS[base['rarity']][1]
+        base['is_level_max'] = False
+        del account.units[partners[0]['unit_owning_user_id']]
+        return (OrderedDict([('before', before), ('after', OrderedDict(base)),
+                             ('use_game_coin', 1000),
+                             ('unit_removed', [partners[0]['unit_owning_user_id']])]),
+                200)
+
+    def api_unit_favorite(self, account, request):
+        unit = account.units.get(request.get('unit_owning_user_id'))
+        if unit is None:
+            return ({'error_code': ERROR_INVALID_UNIT}, 600)
+        unit['favorite_flag'] = bool(request.get('favorite_flag'))
+        return ([], 200)
+
+    # reward
+
+    def _presents(self, account, request):
+        category = request.get('category', 0)
+        items = list(account.presents.values())
+        if category == 1:
+            items = [x for x in items if x['add_type'] == UNIT_ADD_TYPE]
+        elif category == 2:
+            items = [x for x in items if x['add_type'] != UNIT_ADD_TYPE]
+        if request.get('order', 0) == 0:
+            items.reverse()
+        return items
+
+    def api_reward_rewardList(self, account, request):
+        items = self._presents(account, request)
+        total = len(items)
+        after = request.get('incentive_id')
+        if after is not None:
+            positions = [i for i, item in enumerate(items)
+                         if item['incentive_id'] == after]
+            items = items[positions[0] + 1:] if positions else []
+        return (OrderedDict([('item_count', total),
+                             ('limit', PRESENT_PAGE_SIZE),
+                             ('order', request.get('order', 0)),
+                             ('items', items[:PRESENT_PAGE_SIZE])]), 200)
+
+    def _open(self, account, present):
+        if present['add_type'] == UNIT_ADD_TYPE:
+            if len(account.units) >= account.unit_max:
+                return False
+            self._new_unit(account, present['incentive_item_id'])
+        elif present['incentive_item_id'] == 3:
+            account.game_coin += present['amount']
+        elif present['incentive_item_id'] == 4:
+            account.sns_coin += present['amount']
+        del account.presents[present['incentive_id']]
+        return True
+
+    def api_reward_open(self, account, request):
+        present = account.presents.get(request['incentive_id'])
+        if present is None:
+            return ({'error_code': ERROR_INVALID_INCENTIVE}, 600)
+        if not self._open(account, present):
+            return ({'error_code': ERROR_UNIT_MAX}, 600)
+        return (OrderedDict([('opened_num', 1), ('success', [present]),
+                             ('fail', []),
+                             ('unit_support_list', [])]), 200)
+
+    def api_reward_openAll(self, account, request):
+        success = []
+        fail = []
+        for present in self._presents(account, request):
+            (success if self._open(account, present) else fail).append(present)
+        if fail and not success:
+            return ({'error_code': ERROR_UNIT_MAX}, 600)
+        return (OrderedDict([('reward_num', len(success) + len(fail)),
+                             ('opened_num', len(success)),
+                             ('total_num', len(account.presents)),
+                             ('success', success), ('fail', fail),
+                             ('unit_support_list', [])]), 200)
+
+    # secretbox
+
+    def api_secretbox_all(self, account, request):
+        return (OrderedDict([
+            ('use_cost', OrderedDict([('game_coin', account.game_coin),
+                                      ('sns_coin', account.sns_coin)])),
+            ('member_category_list', [
+                OrderedDict([('member_category', category), ('page_list', [
+                    OrderedDict([('secret_box_id', category * 10 + i),
+                                 ('name', 'ボックス{}'.format(i)),
+                                 ('cost', OrderedDict([('priority', 1),
+                                                       ('type', 1),
+                                                       ('amount', 5)]))])
+                    for i in range(1, 4)])])
+                for category in (1, 2)])]), 200)
+
+    def _draw(self, account, count):
+        if len(account.units) + count > account.unit_max:
+            return ({'error_code': ERROR_UNIT_MAX}, 600)
+        if account.sns_coin < 5 * count:
+            account.sns_coin += 5 * count
+        account.sns_coin -= 5 * count
+        units = [self._new_unit(account) for _ in range(count)]
+        return (OrderedDict([
+            ('is_unit_max', len(account.units) >= account.unit_max),
+            ('secret_box_items', OrderedDict([('unit', units), ('item', [])])),
+            ('after_user_info', OrderedDict([('sns_coin', account.sns_coin),
+                                             ('game_coin', account.game_coin)]))]),
+            200)
+
+    def api_secretbox_pon(self, account, request):
+        return self._draw(account, 1)
+
+    def api_secretbox_multi(self, account, request):
+        return self._draw(account, request.get('count', 10))
+
+
+class MockRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; with Nagle the body waits
+    # for the client's delayed ACK of the headers.
+    disable_nagle_algorithm = True
+
+    def version_string(self):
+        return 'Apache'
+
+    def do_POST(self):
+        self.server.mock.handle(self, 'POST')
+
+    def do_GET(self):
+        self.server.mock.handle(self, 'GET')
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s', self.address_string(), format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to every response')
+    parser.add_argument('--units', type=int, default=200)
+    parser.add_argument('--presents', type=int, default=100)
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of requests answered with 503')
+    parser.add_argument('--strict', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockLLSIFServer(args.host, args.port, args.latency, args.units,
+                             args.presents, strict=args.strict)
+    if args.error_rate:
+        server.inject('status', times=None, probability=args.error_rate)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""Run the same job over many accounts with bounded concurrency.
+
+    def daily(client, loginkey, loginpasswd):
+        client.startapp(loginkey, loginpasswd)
+        return client.lbonus()
+
+    orchestrator = SessionOrchestrator(max_workers=32, timeout=120)
+    for result in orchestrator.run(credentials, daily):
+        if not result.ok:
+            print(result.login_key, result.error)
+    print(orchestrator.stats.summary())
+
+run_async() does the same with AsyncLLSIFClient and coroutine jobs on the
+running event loop.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class JobTimeout(Exception):
+    '''Raised (as JobResult.error) when a job exceeds its timeout.'''
+    pass
+
+
+class JobResult(object):
+    '''Outcome of one job.
+
+    Attributes:
+        login_key
+        value: return value of the job, None on failure
+        error: the exception raised by the job, None on success
+        elapsed: seconds from the job starting to finishing'''
+
+    def __init__(self, login_key, value=None, error=None, elapsed=None):
+        self.login_key = login_key
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return '<JobResult {} ok {:.3f}s>'.format(self.login_key, self.elapsed)
+        return '<JobResult {} failed: {!r}>'.format(self.login_key, self.error)
+
+
+class ThroughputStats(object):
+    '''Aggregate throughput and per-account latency of a run.'''
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.succeeded = 0
+        self.failed = 0
+        self.latencies = []
+
+    def record(self, result):
+        if result.ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        if result.elapsed is not None:
+            self.latencies.append(result.elapsed)
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    @property
+    def completed(self):
+        return self.succeeded + self.failed
+
+    @property
+    def wall_time(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    @property
+    def accounts_per_minute(self):
+        if self.wall_time <= 0:
+            return 0.0
+        return self.completed * 60.0 / self.wall_time
+
+    def percentile(self, pct):
+        '''Nearest-rank percentile of per-account latency, in seconds.'''
+
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        rank = max(1, int(round(pct / 100.0 * len(ordered))))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    @property
+    def p50(self):
+        return self.percentile(50)
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    def summary(self):
+        if not self.latencies:
+            return '{} accounts, {} failed'.format(self.completed, self.failed)
+        return ('{} accounts, {} failed, {:.1f} accounts/min, '
+                'p50 {:.3f}s, p99 {:.3f}s').format(
+                    self.completed, self.failed, self.accounts_per_minute,
+                    self.p50, self.p99)
+
+
+class SessionOrchestrator(object):
+    '''Runs a per-account job over many (login_key, login_passwd) pairs.
+
+    max_workers caps the number of accounts in flight. max_per_host
+    additionally caps accounts in flight per SERVER_HOST. timeout is the
+    per-job limit in seconds.
+
+    client_factory builds one client per account; it defaults to
+    LLSIFClient for run() and AsyncLLSIFClient for run_async().
+
+    Statistics of the latest run are in self.stats.'''
+
+    def __init__(self, max_workers=16, max_per_host=None, timeout=None,
+                 client_factory=None):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.client_factory = client_factory
+        self.stats = None
+
+    def _host_limiter(self, factory):
+        '''Return a function giving the semaphore limiting the accounts in
+        flight on a host, made with factory(max_per_host). Each run gets
+        its own, so it follows max_per_host as it is when the run starts.'''
+
+        max_per_host = self.max_per_host
+        limits = {}
+        lock = threading.Lock()
+
+        def host_limit(host):
+            with lock:
+                sem = limits.get(host)
+                if sem is None:
+                    sem = limits[host] = factory(max_per_host)
+                return sem
+
+        return host_limit
+
+    def _run_job(self, job, client, login_key, login_passwd, timing,
+                 host_limit):
+        # timing receives [start, end] for the consumer thread
+        timing.append(time.monotonic())
+        try:
+            if host_limit is None:
+                return job(client, login_key, login_passwd)
+            with host_limit(client.SERVER_HOST):
+                return job(client, login_key, login_passwd)
+        finally:
+            timing.append(time.monotonic())
+
+    def run(self, credentials, job):
+        '''Run job(client, login_key, login_passwd) on a thread pool.
+
+        Yields a JobResult for every account as soon as it finishes, in
+        completion order.
+
+        Threads can not be interrupted, so a job that times out is reported
+        as failed and abandoned. Its client's scheduler is cancelled, so the
+        job raises ratelimit.Cancelled at its next request; until then (at
+        worst the next socket timeout) its worker stays busy.'''
+
+        if self.client_factory is None:
+            from .client import LLSIFClient
+            client_factory = LLSIFClient
+        else:
+            client_factory = self.client_factory
+
+        self.stats = stats = ThroughputStats()
+        credentials = iter(credentials)
+        pending = {}
+        host_limit = None if self.max_per_host is None else \
+            self._host_limiter(threading.BoundedSemaphore)
+
+        executor = ThreadPoolExecutor(self.max_workers)
+        try:
+            def refill():
+                while len(pending) < self.max_workers:
+                    try:
+                        login_key, login_passwd = next(credentials)
+                    except StopIteration:
+                        return
+                    timing = []
+                    client = client_factory()
+                    future = executor.submit(
+                        self._run_job, job, client, login_key, login_passwd,
+                        timing, host_limit)
+                    pending[future] = (login_key, timing, client)
+
+            refill()
+            while pending:
+                done, _ = wait(list(pending), self._next_deadline(pending),
+                               FIRST_COMPLETED)
+                finished = time.monotonic()
+
+                for future in done:
+                    login_key, timing, _ = pending.pop(future)
+                    result = JobResult(login_key, elapsed=timing[1] - timing[0])
+                    try:
+                        result.value = future.result()
+                    except Exception as exc:
+                        logger.warning('Job for %s failed: %r', login_key, exc)
+                        result.error = exc
+                    stats.record(result)
+                    yield result
+
+                if self.timeout is not None:
+                    for future, (login_key, timing, client) in \
+                            list(pending.items()):
+                        if timing and finished - timing[0] > self.timeout:
+                            del pending[future]
+                            client.scheduler.cancel()
+                            logger.warning('Job for %s timed out', login_key)
+                            result = JobResult(login_key, error=JobTimeout(),
+                                               elapsed=finished - timing[0])
+                            stats.record(result)
+                            yield result
+
+                refill()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            stats.finish()
+
+    def _next_deadline(self, pending):
+        if self.timeout is None:
+            return None
+        now = time.monotonic()
+        deadlines = [timing[0] + self.timeout - now
+                     for login_key, timing, _ in pending.values() if timing]
+        if not deadlines:
+            # Nothing has started yet; check again shortly.
+            return self.timeout
+        return max(0, min(deadlines))
+
+    async def run_async(self, credentials, job):
+        '''Run coroutine job(client, login_key, login_passwd) on this loop.
+
+        Async generator yielding a JobResult for every account in completion
+        order. Timed out jobs are cancelled.'''
+
+        if self.client_factory is None:
+            from .aioclient import AsyncLLSIFClient
+            client_factory = AsyncLLSIFClient
+        else:
+            client_factory = self.client_factory
+
+        self.stats = stats = ThroughputStats()
+        credentials = iter(credentials)
+        results = asyncio.Queue()
+        host_limit = None if self.max_per_host is None else \
+            self._host_limiter(asyncio.Semaphore)
+
+        async def run_one(client, login_key, login_passwd):
+            if host_limit is None:
+                return await job(client, login_key, login_passwd)
+            async with host_limit(client.SERVER_HOST):
+                return await job(client, login_key, login_passwd)
+
+        async def worker():
+            for login_key, login_passwd in credentials:
+                result = JobResult(login_key)
+                started = time.monotonic()
+                try:
+                    result.value = await asyncio.wait_for(
+                        run_one(client_factory(), login_key, login_passwd),
+                        self.timeout)
+                except asyncio.TimeoutError:
+                    logger.warning('Job for %s timed out', login_key)
+                    result.error = JobTimeout()
+                except Exception as exc:
+                    logger.warning('Job for %s failed: %r', login_key, exc)
+                    result.error = exc
+                result.elapsed = time.monotonic() - started
+                await results.put(result)
+            await results.put(None)
+
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(self.max_workers)]
+        try:
+            running = len(workers)
+            while running:
+                result = await results.get()
+                if result is None:
+                    running -= 1
+                    continue
+                stats.record(result)
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            stats.finish()
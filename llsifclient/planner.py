@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Planning of bulk unit sales and merges.
+
+A UnitPolicy says which units may go: units to feed to a base unit with
+unit/merge, and units to sell with unit/sale. plan_units() turns it into
+the fewest calls the server's list limits allow:
+
+    policy = UnitPolicy(sell_rarities=[N], sell_above_level=20,
+                        feed_base=base, feed_rarities=[R])
+    plan = plan_units(client.inventory, policy)
+    print(plan.summary())
+    result = client.sell_and_merge(policy)
+
+LLSIFClient.sell_and_merge() sends the calls bundled into multi-requests,
+and checks every result against what was planned: the units the server
+reports as removed must be exactly the ones sent.
+"""
+
+from collections import OrderedDict
+
+# Longest lists the server accepts in one call
+SALE_LIMIT = 30
+MERGE_LIMIT = 12
+
+
+class UnitPolicy(object):
+    '''Which units to merge and sell.
+
+    Units that are favorites (keep_favorites), in a deck (keep_decks) or in
+    keep (unit_owning_user_ids) are never touched.
+
+    sell_rarities: rarities to sell; nothing is sold unless given
+    sell_above_level: sell only units above this level
+    sell_level_max: sell only units at their maximum level
+    feed_base: unit_owning_user_id to merge units into, None to merge nothing
+    feed_rarities: rarities to merge into feed_base; these are not sold'''
+
+    def __init__(self, keep_favorites=True, keep_decks=True, keep=(),
+                 sell_rarities=(), sell_above_level=None,
+                 sell_level_max=False, feed_base=None, feed_rarities=()):
+        self.keep_favorites = keep_favorites
+        self.keep_decks = keep_decks
+        self.keep = frozenset(keep)
+        self.sell_rarities = tuple(sell_rarities)
+        self.sell_above_level = sell_above_level
+        self.sell_level_max = sell_level_max
+        self.feed_base = feed_base
+        self.feed_rarities = tuple(feed_rarities)
+
+    def _protected(self):
+        return dict(favorite=False if self.keep_favorites else None,
+                    in_deck=False if self.keep_decks else None)
+
+    def feed_candidates(self, inventory):
+        if self.feed_base is None or not self.feed_rarities:
+            return []
+        if self.feed_base not in inventory:
+            raise RuntimeError('Merge base {} is not in the inventory'.format(
+                self.feed_base))
+        return [owning_id for owning_id in
+                inventory.find(rarity=self.feed_rarities, **self._protected())
+                if owning_id != self.feed_base and owning_id not in self.keep]
+
+    def sale_candidates(self, inventory, feeding=()):
+        if not self.sell_rarities:
+            return []
+        excluded = self.keep.union(feeding)
+        if self.feed_base is not None:
+            excluded = excluded.union([self.feed_base])
+        min_level = None
+        if self.sell_above_level is not None:
+            min_level = self.sell_above_level + 1
+        return [owning_id for owning_id in inventory.find(
+                    rarity=self.sell_rarities, min_level=min_level,
+                    level_max=True if self.sell_level_max else None,
+                    **self._protected())
+                if owning_id not in excluded]
+
+
+class UnitPlan(object):
+    '''The unit/merge and unit/sale calls that carry out a policy.
+
+    Attributes:
+        merges: list of (base, [partners]), at most MERGE_LIMIT partners each
+        sales: list of [units], at most SALE_LIMIT units each'''
+
+    def __init__(self, merges=None, sales=None):
+        self.merges = merges or []
+        self.sales = sales or []
+
+    def __len__(self):
+        return len(self.merges) + len(self.sales)
+
+    def requests(self):
+        '''Return the calls of the plan, merges first.'''
+
+        requests = [OrderedDict([('module', 'unit'),
+                                 ('unit_owning_user_ids', partners),
+                                 ('action', 'merge'),
+                                 ('timeStamp', None),
+                                 ('base_owning_unit_user_id', base),
+                                 ('commandNum', None)])
+                    for base, partners in self.merges]
+        requests.extend(OrderedDict([('module', 'unit'),
+                                     ('action', 'sale'),
+                                     ('timeStamp', None),
+                                     ('unit_owning_user_id', units),
+                                     ('commandNum', None)])
+                        for units in self.sales)
+        return requests
+
+    def batches(self, batch_size):
+        '''Split requests() into multi-requests of at most batch_size calls.'''
+
+        requests = self.requests()
+        return [requests[i:i + batch_size]
+                for i in range(0, len(requests), batch_size)]
+
+    def summary(self):
+        return '{} units merged in {} calls, {} sold in {} calls'.format(
+            sum(len(partners) for _, partners in self.merges),
+            len(self.merges), sum(len(units) for units in self.sales),
+            len(self.sales))
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def plan_units(inventory, policy):
+    '''Return the UnitPlan carrying out policy on an inventory.UnitInventory.'''
+
+    feeding = policy.feed_candidates(inventory)
+    selling = policy.sale_candidates(inventory, feeding)
+    return UnitPlan([(policy.feed_base, partners)
+                     for partners in _chunks(feeding, MERGE_LIMIT)],
+                    _chunks(selling, SALE_LIMIT))
+
+
+class PlanResult(object):
+    '''Outcome of running a UnitPlan.
+
+    Attributes:
+        merged: units merged away
+        sold: units sold
+        game_coin: G received for the sales
+        requests: round-trips to the server
+        errors: (request, status, error_code) of the calls that failed
+        mismatches: (request, expected, removed) of the calls whose result
+            removed other units than the ones sent'''
+
+    def __init__(self):
+        self.merged = 0
+        self.sold = 0
+        self.game_coin = 0
+        self.requests = 0
+        self.errors = []
+        self.mismatches = []
+
+    @property
+    def ok(self):
+        return not self.errors and not self.mismatches
+
+    def check(self, requests, respobj):
+        '''Check the response to a multi-request of the plan.'''
+
+        self.requests += 1
+        entries = respobj.get('response_data')
+        if not isinstance(entries, list):
+            error_code = entries.get('error_code') \
+                if isinstance(entries, dict) else None
+            self.errors.extend((request, respobj.get('status_code'), error_code)
+                               for request in requests)
+            return
+        for request, entry in zip(requests, entries):
+            result = entry.get('result')
+            if entry.get('status') != 200:
+                self.errors.append((request, entry.get('status'),
+                                    result.get('error_code')
+                                    if isinstance(result, dict) else None))
+                continue
+            if request['action'] == 'sale':
+                expected = request['unit_owning_user_id']
+                removed = [unit['unit_owning_user_id']
+                           for unit in result.get('detail', ())]
+                self.sold += len(removed)
+                self.game_coin += result.get('total', 0)
+            else:
+                expected = request['unit_owning_user_ids']
+                removed = result.get('unit_removed', [])
+                self.merged += len(removed)
+                after = result.get('after')
+                if after is not None and after.get('unit_owning_user_id') != \
+                        request['base_owning_unit_user_id']:
+                    self.mismatches.append((request, expected, removed))
+                    continue
+            if sorted(removed) != sorted(expected):
+                self.mismatches.append((request, expected, removed))
+
+    def summary(self):
+        return ('{} units merged, {} sold for {} G in {} requests, '
+                '{} errors, {} mismatches').format(
+                    self.merged, self.sold, self.game_coin, self.requests,
+                    len(self.errors), len(self.mismatches))
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Emptying the present box with as few round-trips as possible.
+
+    drain = client.drain_present_box(items=[3, 4])  # G and Loveca only
+    for present in drain:
+        print(present['incentive_message'], present['amount'])
+    print(drain.stats.summary())
+
+With AsyncLLSIFClient use "async for" instead.
+
+When everything in a category is to be opened, reward/openAll is used.
+Otherwise the presents of a page are opened with reward/open calls bundled
+into multi-requests, and the request for the next page goes into the same
+multi-request as the last opens of the current one, ahead of them so the
+last present of the page, which the next page starts after, is still in
+the box when it is listed. Opening stops at the first present the server
+refuses to open, typically because the unit box is full.
+"""
+
+import logging
+import time
+
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# add_type of member (unit) presents
+UNIT_ADD_TYPE = 1001
+# Number of presents in a page of reward/rewardList
+PAGE_SIZE = 20
+
+
+class DrainStats(object):
+    '''Progress of a PresentBoxDrain.
+
+    Attributes:
+        opened: presents opened
+        skipped: presents left in the box by the filter
+        pages: pages of the box listed
+        requests: round-trips to the server
+        error: (status, error_code) of the call that stopped the drain,
+            None if it ran to the end
+        started: time.monotonic() of the first request, None before it
+        elapsed: seconds since the drain started'''
+
+    def __init__(self):
+        self.opened = 0
+        self.skipped = 0
+        self.pages = 0
+        self.requests = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def items_per_second(self):
+        elapsed = self.elapsed
+        return self.opened / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return ('{} presents opened, {} skipped, {} pages, {} requests in '
+                '{:.1f} s ({:.1f} items/s){}').format(
+                    self.opened, self.skipped, self.pages, self.requests,
+                    self.elapsed, self.items_per_second(),
+                    '' if self.error is None else
+                    ', stopped by status {} error_code {}'.format(*self.error))
+
+
+class PresentBoxDrain(object):
+    '''Lazily opens the present box; iterate over it to get the opened
+    presents.
+
+    category is as for reward/rewardList: 0 for everything, 1 for members,
+    2 for items. items is a collection of LLSIFClient.INCENTIVE_ITEM keys to
+    open, None for all of them; units is whether to open members. batch_size
+    is the maximum number of reward/open calls in one multi-request.'''
+
+    def __init__(self, client, category=0, items=None, units=True,
+                 open_all=True, batch_size=PAGE_SIZE):
+        self.client = client
+        self.category = category
+        self.items = None if items is None else frozenset(items)
+        self.units = units
+        self.use_open_all = open_all and self.items is None and units
+        self.batch_size = batch_size
+        self.stats = DrainStats()
+
+        self._listed = False
+        self._done = False
+        self._pending = deque()
+        self._next_page = None
+        # what each request of the multi-request in flight is for
+        self._sent = []
+
+    def __iter__(self):
+        while True:
+            requests = self.next_requests()
+            if not requests:
+                break
+            respobj = self.client.api_multiple_requests(requests)
+            for present in self.consume(respobj):
+                yield present
+
+    async def __aiter__(self):
+        while True:
+            requests = self.next_requests()
+            if not requests:
+                break
+            respobj = await self.client.api_multiple_requests(requests)
+            for present in self.consume(respobj):
+                yield present
+
+    def wanted(self, present):
+        '''True if the filter lets present be opened.'''
+
+        if present.get('add_type') == UNIT_ADD_TYPE:
+            return self.units
+        return self.items is None or present.get('incentive_item_id') in self.items
+
+    def _list_request(self, after=None):
+        request = OrderedDict([('module', 'reward'),
+                               ('action', 'rewardList'),
+                               ('timeStamp', None),
+                               ('order', 0),
+                               ('filter', [0]),
+                               ('category', self.category)])
+        if after is not None:
+            request['incentive_id'] = after
+        return request
+
+    @staticmethod
+    def _open_request(incentive_id):
+        return OrderedDict([('module', 'reward'),
+                            ('action', 'open'),
+                            ('timeStamp', None),
+                            ('incentive_id', incentive_id),
+                            ('commandNum', None)])
+
+    def _open_all_request(self):
+        return OrderedDict([('module', 'reward'),
+                            ('action', 'openAll'),
+                            ('timeStamp', None),
+                            ('order', 0),
+                            ('filter', [0]),
+                            ('category', self.category),
+                            ('commandNum', None)])
+
+    def next_requests(self):
+        '''Return the next multi-request to send, or an empty list when
+        done.'''
+
+        self._sent = []
+        if self._done:
+            return []
+        if self.stats.started is None:
+            self.stats.started = time.monotonic()
+        if self.use_open_all:
+            self._sent.append(('open_all', None))
+            return [self._open_all_request()]
+        if not self._listed:
+            self._listed = True
+            self._sent.append(('list', None))
+            return [self._list_request()]
+
+        requests = []
+        batch = [self._pending.popleft()
+                 for _ in range(min(self.batch_size, len(self._pending)))]
+        if not self._pending and self._next_page is not None:
+            # prefetch the next page along with the last opens of this one,
+            # listing it before the present it starts after is opened
+            self._sent.append(('list', None))
+            requests.append(self._list_request(self._next_page))
+            self._next_page = None
+        for present in batch:
+            self._sent.append(('open', present))
+            requests.append(self._open_request(present['incentive_id']))
+        if not requests:
+            self._finish()
+        return requests
+
+    def consume(self, respobj):
+        '''Process the response to the last next_requests(). Returns the
+        presents it opened.'''
+
+        self.stats.requests += 1
+        entries = respobj.get('response_data')
+        if not isinstance(entries, list):
+            self._stop(respobj.get('status_code'), self._error_code(entries))
+            return []
+
+        opened = []
+        for (kind, present), entry in zip(self._sent, entries):
+            if entry.get('status') != 200:
+                # The server goes on with the rest of the multi-request;
+                # count what it did open.
+                self._stop(entry.get('status'),
+                           self._error_code(entry.get('result')))
+                continue
+            result = entry['result']
+            if kind == 'open':
+                opened.append(present)
+            elif kind == 'list':
+                self._add_page(result)
+            else:
+                opened.extend(result.get('success', ()))
+                if result.get('fail'):
+                    # opened what it could, the rest did not fit
+                    self._stop(200, None)
+                elif not result.get('opened_num') or not result.get('total_num'):
+                    self._finish()
+        self.stats.opened += len(opened)
+        return opened
+
+    def _add_page(self, result):
+        page = result.get('items') or []
+        self.stats.pages += 1
+        for present in page:
+            if self.wanted(present):
+                self._pending.append(present)
+            else:
+                self.stats.skipped += 1
+        if len(page) >= result.get('limit', PAGE_SIZE):
+            self._next_page = page[-1]['incentive_id']
+
+    @staticmethod
+    def _error_code(result):
+        return result.get('error_code') if isinstance(result, dict) else None
+
+    def _stop(self, status, error_code):
+        if self.stats.error is not None:
+            return
+        self.stats.error = (status, error_code)
+        logger.warning('Stopped opening presents: status %s, error_code %s',
+                       status, error_code)
+        self._finish()
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self.stats.finished = time.monotonic()
+            logger.info('Present box: %s', self.stats.summary())
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Request pacing for LLSIFClient.
+
+A RequestScheduler decides when a session's next request may be sent. It
+combines three kinds of delays:
+
+    think time: the pauses a human player takes between actions
+    backoff: the wait before retrying a failed request
+    rate limits: per-session, and per-host shared by all sessions in the
+        process
+
+None of these sleep when they are scheduled. They move the session's
+"not before" time forward, and the client waits once, right before it
+sends the next request. So think time overlaps with anything else the
+session does in between, and with AsyncLLSIFClient the wait does not hold
+a thread at all.
+
+deadline() tells when the next request is due. LLSIFClient waits for it
+with wait(), which cancel() interrupts from another thread, so whoever
+runs the session (see orchestrator.SessionOrchestrator) can stop it at
+its next request instead of waiting for it to finish.
+"""
+
+import random
+import threading
+import time
+
+_host_buckets = {}
+_host_buckets_lock = threading.Lock()
+
+
+class Cancelled(Exception):
+    '''Raised by RequestScheduler.wait() once cancel() has been called.'''
+    pass
+
+
+class TokenBucket(object):
+    '''Rate limit of rate requests per second, allowing bursts of burst.
+
+    Implemented as a virtual scheduling (GCRA) bucket: reserve() books the
+    earliest slot at or after the given time, so callers that have to wait
+    are served in order. Thread-safe.'''
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._interval = 1.0 / rate
+        self._tolerance = (burst - 1) * self._interval
+        self._tat = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, at=None):
+        '''Book a slot no earlier than at (time.monotonic() by default).
+
+        Returns the time the slot starts.'''
+
+        if at is None:
+            at = time.monotonic()
+        with self._lock:
+            start = max(at, self._tat - self._tolerance)
+            self._tat = max(self._tat, start) + self._interval
+        return start
+
+
+def get_host_bucket(host, rate, burst=1):
+    '''Return the process-wide TokenBucket for (host, rate, burst).'''
+
+    key = (host, rate, burst)
+    with _host_buckets_lock:
+        bucket = _host_buckets.get(key)
+        if bucket is None:
+            bucket = _host_buckets[key] = TokenBucket(rate, burst)
+    return bucket
+
+
+class RequestScheduler(object):
+    '''Schedule of one session's requests.
+
+    session_rate and host_rate are in requests per second; None means no
+    limit.'''
+
+    def __init__(self, session_rate=None, session_burst=1, host_rate=None,
+                 host_burst=1):
+        self.session_bucket = TokenBucket(session_rate, session_burst) \
+            if session_rate else None
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.not_before = 0.0
+        self._slot = None
+        self._cancelled = threading.Event()
+
+    def defer(self, seconds):
+        '''Hold the next request for at least seconds from now.'''
+
+        self.not_before = max(self.not_before, time.monotonic() + seconds)
+
+    def think(self, low, high):
+        '''Schedule think time of random length between low and high seconds.'''
+
+        self.defer(random.uniform(low, high))
+
+    def delay(self, host):
+        '''Seconds to wait before sending the next request to host.
+
+        Call again after waiting, until it returns 0. Rate limit slots are
+        only booked once think time and backoff are over, so a session
+        that is thinking does not hold up the others.'''
+
+        now = time.monotonic()
+        if self._slot is None:
+            if self.not_before > now:
+                return self.not_before - now
+            at = now
+            if self.session_bucket is not None:
+                at = self.session_bucket.reserve(at)
+            if self.host_rate:
+                at = get_host_bucket(host, self.host_rate,
+                                     self.host_burst).reserve(at)
+            self._slot = at
+            self.not_before = 0.0
+        if self._slot > now:
+            return self._slot - now
+        self._slot = None
+        return 0.0
+
+    def deadline(self, host):
+        '''time.monotonic() at which the next request to host is due.
+
+        As with delay(), ask again once it has passed: the rate limit slot
+        is only booked then. A deadline that is not in the future means the
+        request may be sent now.'''
+
+        return time.monotonic() + self.delay(host)
+
+    def wait(self, host):
+        '''Block until the next request to host is due.
+
+        Raises Cancelled if cancel() has been or is called meanwhile.'''
+
+        delay = self.delay(host)
+        while delay > 0:
+            if self._cancelled.wait(delay):
+                break
+            delay = self.delay(host)
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    def cancel(self):
+        '''Make wait() raise Cancelled, now and from then on.'''
+
+        self._cancelled.set()
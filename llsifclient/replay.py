@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""Recording exchanges with the server, and replaying them.
+
+Record every request and raw (still gzipped) response to a capture file:
+
+    LLSIFClient.RECORDER = CaptureWriter('capture.bin')
+
+Replay them later instead of talking to a server, at full speed or with
+the recorded timing:
+
+    LLSIFClient.REPLAY = ReplayPool('capture.bin', realtime=False)
+
+(AsyncReplayPool for AsyncLLSIFClient.) Responses are replayed in the
+order they were recorded for each method and path; the requests sent
+are not checked. The client does everything it does with a real server,
+headers, signing, gunzipping, verifying and decoding included, so its
+own costs can be profiled without the network.
+
+The capture file is append-only: a header, then for every exchange a
+fixed-size record header, the metadata as JSON, the request body and the
+raw response body. Summarize one with
+
+    python -m llsifclient.replay capture.bin
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import struct
+import threading
+import time
+
+from collections import Counter, deque
+
+from . import connpool
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LLSIFCAP\x01\n'
+# time the request was sent, seconds from sending to the end of the
+# response, lengths of the metadata, request body and response body
+_RECORD = struct.Struct('>ddIII')
+
+
+class Exchange(object):
+    '''A recorded request and its response.
+
+    request_body is bytes, or a list of buffers until it is written.'''
+
+    __slots__ = ('time', 'elapsed', 'method', 'url', 'status',
+                 'request_headers', 'request_body', 'response_headers',
+                 'response_body')
+
+    def __init__(self, time, elapsed, method, url, status, request_headers,
+                 request_body, response_headers, response_body):
+        self.time = time
+        self.elapsed = elapsed
+        self.method = method
+        self.url = url
+        self.status = status
+        self.request_headers = request_headers
+        self.request_body = request_body
+        self.response_headers = response_headers
+        self.response_body = response_body
+
+
+class CaptureWriter(object):
+    '''Thread-safe writer appending exchanges to a capture file.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, exchange):
+        meta = json.dumps({'method': exchange.method,
+                           'url': exchange.url,
+                           'status': exchange.status,
+                           'request_headers': list(exchange.request_headers),
+                           'response_headers': exchange.response_headers},
+                          separators=(',', ':')).encode('utf-8')
+        request_body = exchange.request_body or b''
+        if not isinstance(request_body, list):
+            request_body = [request_body]
+        header = _RECORD.pack(exchange.time, exchange.elapsed, len(meta),
+                              connpool.body_length(request_body),
+                              len(exchange.response_body))
+        with self._lock:
+            self._file.write(header)
+            self._file.write(meta)
+            self._file.writelines(request_body)
+            self._file.write(exchange.response_body)
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    '''Yield the Exchanges of a capture file in the order they were
+    recorded.'''
+
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a capture file'.format(path))
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                if header:
+                    logger.warning('Truncated record at the end of %s', path)
+                return
+            started, elapsed, meta_len, request_len, response_len = \
+                _RECORD.unpack(header)
+            meta = f.read(meta_len)
+            request_body = f.read(request_len)
+            response_body = f.read(response_len)
+            if len(response_body) < response_len:
+                logger.warning('Truncated record at the end of %s', path)
+                return
+            meta = json.loads(meta.decode('utf-8'))
+            yield Exchange(started, elapsed, meta['method'], meta['url'],
+                           meta['status'],
+                           [tuple(item) for item in meta['request_headers']],
+                           request_body or None,
+                           [tuple(item) for item in meta['response_headers']],
+                           response_body)
+
+
+# Recording
+
+class _RecordingResponse(object):
+    '''Wraps an HTTP response to keep the raw body as it is read.'''
+
+    def __init__(self, httpresp, exchange):
+        self._httpresp = httpresp
+        self._chunks = []
+        self.exchange = exchange
+        self.status = httpresp.status
+
+    @property
+    def will_close(self):
+        return self._httpresp.will_close
+
+    def getheader(self, name, default=None):
+        return self._httpresp.getheader(name, default)
+
+    def getheaders(self):
+        return self._httpresp.getheaders()
+
+    def read(self, amt=None):
+        chunk = self._httpresp.read(amt)
+        self._chunks.append(chunk)
+        return chunk
+
+    def raw_body(self):
+        return b''.join(self._chunks)
+
+
+class _AsyncRecordingResponse(_RecordingResponse):
+
+    async def read(self):
+        chunk = await self._httpresp.read()
+        self._chunks.append(chunk)
+        return chunk
+
+    async def iter_chunks(self, size=64 * 1024):
+        async for chunk in self._httpresp.iter_chunks(size):
+            self._chunks.append(chunk)
+            yield chunk
+
+
+class RecordingPool(object):
+    '''Wraps a connpool.HTTPConnectionPool to record every exchange that
+    is read to the end.'''
+
+    _response_class = _RecordingResponse
+
+    def __init__(self, pool, writer):
+        self.pool = pool
+        self.writer = writer
+
+    def _wrap(self, method, url, headers, body, sent, started, result):
+        conn, httpresp = result
+        # elapsed holds the start time until release()
+        exchange = Exchange(sent, started, method, url, httpresp.status,
+                            [(key, str(value)) for key, value in headers.items()],
+                            body, httpresp.getheaders(), None)
+        return conn, self._response_class(httpresp, exchange)
+
+    def urlopen(self, method, url, headers, body=None, timing=None):
+        sent, started = time.time(), time.perf_counter()
+        return self._wrap(method, url, headers, body, sent, started,
+                          self.pool.urlopen(method, url, headers, body, timing))
+
+    def release(self, conn, httpresp):
+        exchange = httpresp.exchange
+        exchange.elapsed = time.perf_counter() - exchange.elapsed
+        exchange.response_body = httpresp.raw_body()
+        self.writer.write(exchange)
+        self.pool.release(conn, httpresp)
+
+
+class AsyncRecordingPool(RecordingPool):
+    '''RecordingPool for aioconn.AsyncHTTPConnectionPool.'''
+
+    _response_class = _AsyncRecordingResponse
+
+    async def urlopen(self, method, url, headers, body=None, timing=None):
+        sent, started = time.time(), time.perf_counter()
+        return self._wrap(method, url, headers, body, sent, started,
+                          await self.pool.urlopen(method, url, headers, body,
+                                                  timing))
+
+
+# Replaying
+
+class ReplayConnection(object):
+    '''Stands in for the connection of a replayed response.'''
+
+    def close(self):
+        pass
+
+    def release(self):
+        pass
+
+
+class ReplayResponse(object):
+    '''A recorded response, as http.client.HTTPResponse.'''
+
+    will_close = False
+
+    def __init__(self, exchange):
+        self.status = exchange.status
+        self._headers = exchange.response_headers
+        self._body = exchange.response_body
+        self._pos = 0
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        for key, value in self._headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def getheaders(self):
+        return list(self._headers)
+
+    def read(self, amt=None):
+        end = len(self._body) if amt is None else self._pos + amt
+        chunk = self._body[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+
+class AsyncReplayResponse(ReplayResponse):
+    '''A recorded response, as aioconn.AsyncHTTPResponse.'''
+
+    async def read(self):
+        return ReplayResponse.read(self)
+
+    async def iter_chunks(self, size=64 * 1024):
+        while True:
+            chunk = ReplayResponse.read(self, size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class ReplayPool(object):
+    '''Stands in for a connection pool, answering requests from a capture
+    file.
+
+    Requests get the recorded responses to the same method and path in
+    recorded order. With cycle, they start over when they run out;
+    otherwise RuntimeError is raised. With realtime, the timing of the
+    capture is kept: a request is answered no earlier than its recorded
+    offset from the first request replayed, plus the time the response
+    took when it was recorded.'''
+
+    _response_class = ReplayResponse
+
+    def __init__(self, path, realtime=False, cycle=False):
+        self.realtime = realtime
+        self.cycle = cycle
+        self.replayed = 0
+        self._recorded = {}
+        self._start = None
+        for exchange in read_capture(path):
+            self._recorded.setdefault(self._key(exchange.method, exchange.url),
+                                      []).append(exchange)
+            if self._start is None or exchange.time < self._start:
+                self._start = exchange.time
+        self._queues = {}
+        # time.monotonic() the capture's first request is replayed at
+        self._anchor = None
+        self._lock = threading.Lock()
+        self.rewind()
+
+    @staticmethod
+    def _key(method, url):
+        return (method, url.split('?', 1)[0])
+
+    def __len__(self):
+        return sum(len(exchanges) for exchanges in self._recorded.values())
+
+    def rewind(self):
+        '''Start replaying from the beginning again.'''
+
+        with self._lock:
+            self._queues = dict((key, deque(exchanges))
+                                for key, exchanges in self._recorded.items())
+            self._anchor = None
+
+    def next_exchange(self, method, url):
+        key = self._key(method, url)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue and self.cycle and key in self._recorded:
+                queue = self._queues[key] = deque(self._recorded[key])
+            if not queue:
+                raise RuntimeError('No recorded response to {} {}'.format(
+                    method, url))
+            self.replayed += 1
+            return queue.popleft()
+
+    def delay(self, exchange):
+        '''Return the seconds to wait before answering with exchange to
+        keep the recorded timing.'''
+
+        offset = exchange.time - self._start
+        now = time.monotonic()
+        with self._lock:
+            if self._anchor is None:
+                self._anchor = now - offset
+            anchor = self._anchor
+        return max(anchor + offset - now, 0.0) + exchange.elapsed
+
+    def urlopen(self, method, url, headers, body=None, timing=None):
+        exchange = self.next_exchange(method, url)
+        if self.realtime:
+            time.sleep(self.delay(exchange))
+        if timing is not None:
+            timing.mark('wait')
+        return ReplayConnection(), self._response_class(exchange)
+
+    def release(self, conn, httpresp):
+        pass
+
+    def clear(self):
+        pass
+
+
+class AsyncReplayPool(ReplayPool):
+    '''ReplayPool for AsyncLLSIFClient.'''
+
+    _response_class = AsyncReplayResponse
+
+    async def urlopen(self, method, url, headers, body=None, timing=None):
+        exchange = self.next_exchange(method, url)
+        if self.realtime:
+            await asyncio.sleep(self.delay(exchange))
+        if timing is not None:
+            timing.mark('wait')
+        return ReplayConnection(), self._response_class(exchange)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Summarize a capture file.')
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    counts = Counter()
+    sizes = Counter()
+    elapsed = Counter()
+    first = last = None
+    for exchange in read_capture(args.path):
+        key = '{} {}'.format(exchange.method, exchange.url.split('?', 1)[0])
+        counts[key] += 1
+        sizes[key] += len(exchange.response_body)
+        elapsed[key] += exchange.elapsed
+        first = exchange.time if first is None else first
+        last = exchange.time
+    for key, count in counts.most_common():
+        print('{:6d} {:<50} {:9.1f} KiB {:8.1f} ms'.format(
+            count, key, sizes[key] / 1024.0, elapsed[key] * 1000 / count))
+    if first is not None:
+        print('{} exchanges over {:.1f} s'.format(sum(counts.values()),
+                                                  last - first))
+
+
+if __name__ == '__main__':
+    main()
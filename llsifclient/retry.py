@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Retry policy for requests to the game server.
+
+Failed requests are retried after an exponentially growing, fully
+jittered delay, so that clients which failed together do not retry
+together. Retries are also limited by retry budgets: one per client and
+one shared by every client in the process (FLEET_BUDGET). When the server
+is overloaded and most requests fail, the budgets run dry and requests fail
+fast instead of multiplying the load.
+"""
+
+import asyncio
+import http.client
+import logging
+import random
+import socket
+import threading
+import time
+
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Errors worth another attempt: the request timed out, or the connection
+# could not be made or broke before a response was read.
+RETRYABLE_ERRORS = (
+    socket.timeout,
+    ConnectionError,  # refused, reset, aborted, broken pipe
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    http.client.IncompleteRead,
+    asyncio.IncompleteReadError,
+)
+
+
+class RetryBudget(object):
+    '''Token bucket of retries.
+
+    Every request adds ratio tokens and every retry takes one, so retries
+    can not exceed ratio times the number of requests. On top of that the
+    bucket refills at min_rate tokens per second, which lets a client that
+    makes few requests still retry. The bucket holds at most burst tokens.
+
+    Thread-safe; one budget can be shared by many clients.'''
+
+    def __init__(self, ratio=0.2, min_rate=1.0, burst=10):
+        self.ratio = ratio
+        self.min_rate = min_rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * self.min_rate)
+        self._last = now
+
+    def deposit(self):
+        '''Account for a new request.'''
+
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self):
+        '''Take a token for a retry. Returns False if the budget is spent.'''
+
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def refund(self):
+        '''Return a token taken by withdraw() for a retry that was not made.'''
+
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+# Shared by all RetryPolicy instances unless they are given their own.
+FLEET_BUDGET = RetryBudget(ratio=0.1, min_rate=5.0, burst=100)
+
+
+class RetryStats(object):
+    '''Counters of a RetryPolicy.
+
+    Attributes:
+        calls: number of calls
+        failures: calls that gave up
+        retries: attempts after the first one
+        budget_exhausted: retries refused by a retry budget
+        attempts: Counter of {number of attempts: number of calls}'''
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.attempts = Counter()
+
+    def mean_attempts(self):
+        if not self.calls:
+            return 0.0
+        return sum(n * count for n, count in self.attempts.items()) / self.calls
+
+    def summary(self):
+        return ('{} calls, {} failed, {} retries ({:.2f} attempts per call), '
+                '{} retries refused by budget').format(
+                    self.calls, self.failures, self.retries,
+                    self.mean_attempts(), self.budget_exhausted)
+
+
+class RetryPolicy(object):
+    '''When and how long to wait before retrying a request.
+
+    The delay before attempt n + 1 is uniformly random between 0 and
+    min(backoff_cap, backoff_base * 2 ** (n - 1)) seconds ("full jitter").
+    A retry needs a token from both the per-client budget and
+    fleet_budget.
+
+    Create one policy per client; the statistics and the per-client budget
+    belong to it. Pass fleet_budget=None to only use the per-client one.'''
+
+    RETRYABLE_ERRORS = RETRYABLE_ERRORS
+
+    def __init__(self, max_attempts=10, backoff_base=0.5, backoff_cap=30.0,
+                 budget=None, fleet_budget=FLEET_BUDGET):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.budget = RetryBudget() if budget is None else budget
+        self.fleet_budget = fleet_budget
+        self.stats = RetryStats()
+
+    @staticmethod
+    def is_retryable_status(status):
+        '''True for HTTP statuses the server uses for temporary failures.'''
+
+        return 500 <= status <= 599 or status == 204
+
+    def is_retryable_error(self, exc):
+        return isinstance(exc, self.RETRYABLE_ERRORS)
+
+    def backoff(self, attempt):
+        '''Seconds to wait after the given (1-based) failed attempt.'''
+
+        return random.uniform(0, min(self.backoff_cap,
+                                     self.backoff_base * 2 ** (attempt - 1)))
+
+    def begin(self):
+        '''Account for a new call.'''
+
+        self.stats.calls += 1
+        self.budget.deposit()
+        if self.fleet_budget is not None:
+            self.fleet_budget.deposit()
+
+    def next_delay(self, attempt):
+        '''Decide whether to retry after attempt failed.
+
+        Returns the delay in seconds, or None to give up.'''
+
+        if attempt >= self.max_attempts:
+            return None
+        if not self.budget.withdraw():
+            self.stats.budget_exhausted += 1
+            logger.warning('Retry budget of this client exhausted')
+            return None
+        if self.fleet_budget is not None and not self.fleet_budget.withdraw():
+            self.budget.refund()
+            self.stats.budget_exhausted += 1
+            logger.warning('Fleet retry budget exhausted')
+            return None
+        self.stats.retries += 1
+        return self.backoff(attempt)
+
+    def end(self, attempts, ok):
+        '''Account for a finished call.'''
+
+        self.stats.attempts[attempts] += 1
+        if not ok:
+            self.stats.failures += 1
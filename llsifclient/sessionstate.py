@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Compact session state for LLSIFClient.LOW_MEMORY.
+
+SessionState holds the same fields as the session dict of LLSIFClient in
+__slots__, and is used like that dict: session['token'], get(),
+update(), items(). Fields can not be added.
+"""
+
+# Fields of a session, with their values in a fresh one
+FIELDS = ('loginkey', 'userid', 'token', 'nonce', 'commandnum', 'wv_header',
+          'last_command', 'last_login')
+_DEFAULTS = (None, None, None, 0, 0, None, None, None)
+
+
+class SessionState(object):
+    '''Session state in __slots__, with the mapping interface of a dict.'''
+
+    __slots__ = FIELDS
+
+    def __init__(self, *args, **kwargs):
+        self.reset()
+        self.update(*args, **kwargs)
+
+    def reset(self):
+        '''Set every field back to its value in a fresh session.'''
+
+        for field, value in zip(FIELDS, _DEFAULTS):
+            setattr(self, field, value)
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in FIELDS
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __eq__(self, other):
+        try:
+            return dict(self.items()) == dict(other.items())
+        except AttributeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'SessionState({!r})'.format(dict(self.items()))
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in FIELDS else default
+
+    def keys(self):
+        return list(FIELDS)
+
+    def values(self):
+        return [getattr(self, field) for field in FIELDS]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in FIELDS]
+
+    def update(self, *args, **kwargs):
+        for other in args + (kwargs,):
+            items = other.items() if hasattr(other, 'items') else other
+            for key, value in items:
+                self[key] = value
+
+    def copy(self):
+        return SessionState(self)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""On-disk store of session state, for resuming sessions after a restart.
+
+One SQLite file holds the authorize token and counters of every account
+of a fleet:
+
+    LLSIFClient.SESSION_STORE = SessionStore('sessions.db')
+
+    client = LLSIFClient()
+    client.resume(loginkey, loginpasswd)   # startapp() only if needed
+
+After every successful API request whose token or counters changed, the
+client stages its session with stage(). Staged sessions are written
+together by flush(), which the client calls once flush_interval seconds
+have passed since the last one (in an executor with AsyncLLSIFClient), and
+which close() calls too. A crash loses at most flush_interval seconds of
+counters; load() sees staged sessions straight away.
+
+The tokens in the file are as good as the passwords for as long as the
+server accepts them; keep it private.
+"""
+
+import sqlite3
+import threading
+import time
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    host TEXT NOT NULL,
+    login_key TEXT NOT NULL,
+    user_id INTEGER,
+    token TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    commandnum INTEGER NOT NULL,
+    last_login REAL,
+    saved REAL NOT NULL,
+    PRIMARY KEY (host, login_key)
+)'''
+
+# Fields of LLSIFClient.session kept in the store
+FIELDS = ('userid', 'token', 'nonce', 'commandnum', 'last_login')
+
+
+class SessionStore(object):
+    '''Thread-safe SQLite store of session snapshots, one per account and
+    server host.
+
+    Snapshots older than max_age seconds are not loaded. Staged snapshots
+    are due to be flushed flush_interval seconds after the last flush.'''
+
+    def __init__(self, path, max_age=None, flush_interval=1.0):
+        self.path = path
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # (host, login_key) -> row of a staged snapshot
+        self._staged = {}
+        self._staged_lock = threading.Lock()
+        self._flushed = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(_SCHEMA)
+            self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def save(self, host, session):
+        '''Save the snapshot of a session (dict or sessionstate.SessionState)
+        with a login key and token.'''
+
+        self.save_many(host, [session])
+
+    def save_many(self, host, sessions):
+        '''Save several sessions in one transaction.'''
+
+        rows = [self._row(host, session) for session in sessions
+                if session['loginkey'] is not None and
+                session['token'] is not None]
+        with self._lock:
+            with self._staged_lock:
+                for row in rows:
+                    self._staged.pop(row[:2], None)
+            self._write(rows)
+
+    @staticmethod
+    def _row(host, session):
+        return (host, session['loginkey'], session['userid'],
+                session['token'], session['nonce'], session['commandnum'],
+                session['last_login'], time.time())
+
+    def _write(self, rows):
+        if rows:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO sessions '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.commit()
+
+    def stage(self, host, session):
+        '''Stage a snapshot of a session for the next flush(), without
+        touching the disk.
+
+        Returns True if a flush is due.'''
+
+        if session['loginkey'] is None or session['token'] is None:
+            return False
+        row = self._row(host, session)
+        with self._staged_lock:
+            self._staged[row[:2]] = row
+            return time.monotonic() - self._flushed >= self.flush_interval
+
+    def flush(self):
+        '''Save the staged snapshots in one transaction.'''
+
+        with self._lock:
+            with self._staged_lock:
+                rows = list(self._staged.values())
+                self._staged.clear()
+                self._flushed = time.monotonic()
+            self._write(rows)
+
+    def load(self, host, login_key):
+        '''Return the saved fields of a session as a dict, or None.'''
+
+        with self._staged_lock:
+            row = self._staged.get((host, login_key))
+        if row is not None:
+            row = row[2:]
+        else:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT user_id, token, nonce, commandnum, last_login, '
+                    'saved FROM sessions WHERE host = ? AND login_key = ?',
+                    (host, login_key)).fetchone()
+        if row is None:
+            return None
+        if self.max_age is not None and time.time() - row[5] > self.max_age:
+            return None
+        return dict(zip(FIELDS, row[:5]))
+
+    def delete(self, host, login_key):
+        with self._lock:
+            with self._staged_lock:
+                self._staged.pop((host, login_key), None)
+            self._conn.execute(
+                'DELETE FROM sessions WHERE host = ? AND login_key = ?',
+                (host, login_key))
+            self._conn.commit()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
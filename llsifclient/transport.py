@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Transport engines carrying requests to the server.
+
+LLSIFClient.TRANSPORT names the engine; connection_pool() gets its pool
+from get_pool(). Engines:
+
+    stdlib   connpool.HTTPConnectionPool, http.client connections
+    socket   TunedConnectionPool: connections on sockets with TCP_NODELAY
+             and SO_KEEPALIVE, with the server's address cached
+    async    aioconn.AsyncHTTPConnectionPool, for AsyncLLSIFClient
+
+A pool has urlopen(method, url, headers, body=None, timing=None), which
+returns (connection, response) with the response body unread, and
+release(connection, response), called once the body has been read.
+Responses need status, getheader(), getheaders(), will_close and read()
+(iter_chunks() too for async engines). Other engines can be added with
+register_transport(). Async engines only work with AsyncLLSIFClient and
+the others only with LLSIFClient; get_pool() raises ValueError for an
+engine of the wrong kind.
+"""
+
+import socket
+import threading
+import time
+
+from . import aioconn
+from . import connpool
+
+# Seconds an idle connection waits before sending TCP keep-alive probes
+KEEPALIVE_IDLE = 60
+
+
+class DNSCache(object):
+    '''Thread-safe cache of getaddrinfo() results.'''
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        '''Return the getaddrinfo() list of (host, port) for TCP.'''
+
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+DNS_CACHE = DNSCache()
+
+
+class TunedHTTPConnection(connpool.TimeoutHTTPConnection):
+    '''Connection on a socket with TCP_NODELAY and SO_KEEPALIVE, resolved
+    through DNS_CACHE.'''
+
+    dns_cache = DNS_CACHE
+
+    def connect(self):
+        error = None
+        for family, socktype, proto, _, address in \
+                self.dns_cache.resolve(self.host, self.port):
+            sock = socket.socket(family, socktype, proto)
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                if hasattr(socket, 'TCP_KEEPIDLE'):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE,
+                                    KEEPALIVE_IDLE)
+                sock.settimeout(self.timeout)
+                sock.connect(address)
+            except OSError as exc:
+                sock.close()
+                error = exc
+                continue
+            sock.settimeout(self.read_timeout)
+            self.sock = sock
+            return
+        # the server may have moved
+        self.dns_cache.forget(self.host, self.port)
+        raise error if error is not None else \
+            OSError('No address for {}'.format(self.host))
+
+
+class TunedConnectionPool(connpool.HTTPConnectionPool):
+    '''HTTPConnectionPool of TunedHTTPConnections.'''
+
+    connection_class = TunedHTTPConnection
+
+
+def _stdlib_pool(host, connect_timeout, read_timeout, maxsize, adaptive):
+    return connpool.get_pool(host, read_timeout, maxsize, connect_timeout,
+                             adaptive)
+
+
+def _socket_pool(host, connect_timeout, read_timeout, maxsize, adaptive):
+    return connpool.get_pool(host, read_timeout, maxsize, connect_timeout,
+                             adaptive, TunedConnectionPool)
+
+
+def _async_pool(host, connect_timeout, read_timeout, maxsize, adaptive):
+    return aioconn.get_pool(host, read_timeout, maxsize, connect_timeout,
+                            adaptive)
+
+
+# name -> function(host, connect_timeout, read_timeout, maxsize, adaptive)
+# returning the pool to use
+TRANSPORTS = {
+    'stdlib': _stdlib_pool,
+    'socket': _socket_pool,
+    'async': _async_pool,
+}
+# Names of the engines in TRANSPORTS that are for AsyncLLSIFClient
+ASYNC_TRANSPORTS = set(['async'])
+
+
+def register_transport(name, get_pool, asynchronous=False):
+    '''Make an engine available as LLSIFClient.TRANSPORT = name.
+
+    get_pool(host, connect_timeout, read_timeout, maxsize, adaptive) must
+    return a pool as described in the module docstring; it is called for
+    every request, so it should cache its pools. asynchronous says whether
+    its pools are for AsyncLLSIFClient.'''
+
+    TRANSPORTS[name] = get_pool
+    if asynchronous:
+        ASYNC_TRANSPORTS.add(name)
+    else:
+        ASYNC_TRANSPORTS.discard(name)
+
+
+def check_transport(name, asynchronous=False):
+    '''Raise ValueError unless name is an engine for a client that is
+    asynchronous or not.'''
+
+    if name not in TRANSPORTS:
+        raise ValueError('Unknown transport {}'.format(name))
+    if (name in ASYNC_TRANSPORTS) != asynchronous:
+        raise ValueError('Transport {} can not be used with {}'.format(
+            name, 'AsyncLLSIFClient' if asynchronous else 'LLSIFClient'))
+
+
+def get_pool(name, host, connect_timeout=10, read_timeout=10, maxsize=4,
+             adaptive=False, asynchronous=False):
+    '''Return the pool of engine name for host, for a client that is
+    asynchronous or not.'''
+
+    check_transport(name, asynchronous)
+    return TRANSPORTS[name](host, connect_timeout, read_timeout, maxsize,
+                            adaptive)
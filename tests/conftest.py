@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+import pytest
+
+from llsifclient.aioclient import AsyncLLSIFClient
+from llsifclient.client import LLSIFClient
+from llsifclient.mockserver import MockLLSIFServer
+from llsifclient.retry import RetryPolicy
+
+logging.getLogger('llsifclient').setLevel(logging.ERROR)
+
+
+@pytest.fixture
+def server():
+    with MockLLSIFServer(units=60, presents=50, seed=1) as server:
+        yield server
+
+
+def _client_class(base, server):
+    class Client(base):
+        SERVER_HOST = server.host
+
+        def __init__(self):
+            super().__init__()
+            self.retry_policy = RetryPolicy(backoff_base=0.001,
+                                            fleet_budget=None)
+
+        def think(self, low, high):
+            pass
+
+    return Client
+
+
+@pytest.fixture
+def client_class(server):
+    '''LLSIFClient talking to server, without think time.'''
+
+    return _client_class(LLSIFClient, server)
+
+
+@pytest.fixture
+def async_client_class(server):
+    return _client_class(AsyncLLSIFClient, server)
+
+
+@pytest.fixture
+def client(client_class):
+    '''A client of a fresh account, after startapp().'''
+
+    client = client_class()
+    client.startapp(*client.gen_new_credentials())
+    return client
+
+
+@pytest.fixture
+def account(server, client):
+    '''Server side state of the account of client.'''
+
+    return server.accounts[client.session['loginkey']]
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+import pytest
+
+from llsifclient import api
+from llsifclient.api import LLSIFAPI, LLSIFAPIException, RequestTemplate
+from llsifclient.consts import MAIN_ROUTER_MAP
+
+
+def reference_parse(definition, is_single=True, **kwargs):
+    # LLSIFAPI.parse() before required keys were checked against a set
+    res = {
+        'module': definition.module,
+        'action': definition.action,
+        'timeStamp': int(time.time()),
+        'commandNum': None,
+    }
+    if not is_single:
+        del res['commandNum']
+    for key in definition.requires or ():
+        if key not in kwargs:
+            raise LLSIFAPIException('Required Key {} not included.'.format(key))
+        res[key] = kwargs[key]
+    for key in definition.options or ():
+        if key in kwargs:
+            res[key] = kwargs[key]
+    for key in definition.excludes or ():
+        if key in res:
+            del res[key]
+    return res
+
+
+def compact(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+@pytest.fixture(autouse=True)
+def fixed_time(monkeypatch):
+    monkeypatch.setattr(api.time, 'time', lambda: 1460000000.5)
+
+
+@pytest.mark.parametrize('name', sorted(MAIN_ROUTER_MAP))
+@pytest.mark.parametrize('is_single', [True, False])
+def test_parse_matches_reference(name, is_single):
+    definition = MAIN_ROUTER_MAP[name]
+    keys = (definition.requires or []) + (definition.options or [])
+    kwargs = dict((key, {'value': i, 'name': u'学院生'})
+                  for i, key in enumerate(keys))
+
+    assert compact(definition.parse(is_single, **kwargs)) == \
+        compact(reference_parse(definition, is_single, **kwargs))
+
+
+@pytest.mark.parametrize('name', sorted(MAIN_ROUTER_MAP))
+def test_parse_requires_keys(name):
+    definition = MAIN_ROUTER_MAP[name]
+    if not definition.requires:
+        return
+    with pytest.raises(LLSIFAPIException) as excinfo:
+        definition.parse()
+    assert definition.requires[0] in str(excinfo.value)
+
+
+def test_parse_with_repeated_keys():
+    definition = LLSIFAPI('m', 'a', requires=['x', 'x'], options=['x', 'y'],
+                          excludes=['commandNum'])
+
+    assert compact(definition.parse(x=1, y=2)) == \
+        compact(reference_parse(definition, x=1, y=2)) == \
+        '{"module":"m","action":"a","timeStamp":1460000000,"x":1,"y":2}'
+
+
+@pytest.mark.parametrize('name', sorted(MAIN_ROUTER_MAP))
+@pytest.mark.parametrize('is_single', [True, False])
+def test_serialize_matches_parse(name, is_single):
+    definition = MAIN_ROUTER_MAP[name]
+    keys = (definition.requires or []) + (definition.options or [])
+    kwargs = dict((key, {'value': i, 'name': u'学院生'})
+                  for i, key in enumerate(keys))
+
+    assert definition.serialize(is_single, **kwargs) == \
+        compact(reference_parse(definition, is_single, **kwargs)).encode('utf-8')
+    required = dict((key, kwargs[key]) for key in definition.requires or ())
+    assert definition.serialize(is_single, **required) == \
+        compact(reference_parse(definition, is_single, **required)).encode('utf-8')
+
+
+@pytest.mark.parametrize('requires, options, kwargs', [
+    (['x', 'x'], ['x', 'y'], {'x': 1, 'y': 2}),
+    (['x'], ['y', 'x', 'y'], {'x': 1, 'y': 2}),
+    (['x'], ['y', 'x', 'y'], {'x': 1}),
+    (None, ['y', 'y'], {'y': u'%d'}),
+    (['x'], ['action'], {'x': 1, 'action': 'other'}),
+    (['timeStamp'], None, {'timeStamp': 1}),
+])
+def test_serialize_with_repeated_and_base_keys(requires, options, kwargs):
+    definition = LLSIFAPI('m%', 'a', requires=requires, options=options)
+
+    assert definition.serialize(**kwargs) == \
+        compact(reference_parse(definition, **kwargs)).encode('utf-8')
+
+
+def test_serialize_requires_keys():
+    definition = LLSIFAPI('m', 'a', requires=['x', 'x'])
+
+    with pytest.raises(LLSIFAPIException):
+        definition.serialize()
+
+
+@pytest.mark.parametrize('items', [
+    [('module', 'unit'), ('commandNum', None), ('action', 'unitAll'),
+     ('timeStamp', None)],
+    [('module', 'unit'), ('action', 'unitAll'), ('timeStamp', None)],
+    [('commandNum', 'x'), ('module', u'単位%s'), ('timeStamp', None)],
+    [('module', 'live'), ('action', 'schedule')],
+])
+def test_request_template_matches_json(items):
+    template = RequestTemplate(items)
+    filled = dict(items)
+    if 'timeStamp' in filled:
+        filled['timeStamp'] = '1460000000'
+    if 'commandNum' in filled:
+        filled['commandNum'] = 'key.1460000000.3'
+        text = template.encode('1460000000', 'key.1460000000.3')
+    else:
+        text = template.encode('1460000000')
+
+    assert text == compact(dict((key, filled[key]) for key, _ in items))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import pytest
+
+from llsifclient.batching import RequestBatch, is_batchable
+
+API = '/main.php/api'
+
+
+def _bad_open():
+    # reward/open of a present that does not exist; the server answers
+    # this entry of the multi-request with status 600
+    return OrderedDict([('module', 'reward'),
+                        ('action', 'open'),
+                        ('timeStamp', None),
+                        ('incentive_id', -1),
+                        ('commandNum', None)])
+
+
+def test_is_batchable():
+    assert is_batchable(('user', 'userInfo'))
+    assert is_batchable({'module': 'user', 'action': 'userInfo'})
+    assert not is_batchable(('user', 'userInfo'), '/main.php/login/login')
+    assert not is_batchable(None)
+    assert not is_batchable({'module': 'user'})
+
+
+def test_fan_out_gives_every_caller_its_entry():
+    batch = RequestBatch()
+    futures = [batch.add({'n': i}, Future()) for i in range(3)]
+
+    batch.fan_out({'response_data': [{'result': i, 'status': 200 + i}
+                                     for i in range(3)],
+                   'status_code': 200})
+
+    assert [future.result() for future in futures] == [
+        {'response_data': i, 'status_code': 200 + i} for i in range(3)]
+
+
+def test_rejected_batch_goes_to_every_caller():
+    batch = RequestBatch()
+    futures = [batch.add({'n': i}, Future()) for i in range(2)]
+    respobj = {'response_data': {'error_code': 1}, 'status_code': 600}
+
+    batch.fan_out(respobj)
+
+    assert [future.result() for future in futures] == [respobj, respobj]
+
+
+def test_fail_leaves_answered_callers_alone():
+    batch = RequestBatch()
+    answered = batch.add({}, Future())
+    waiting = batch.add({}, Future())
+    answered.set_result('answer')
+
+    batch.fail(RuntimeError('lost'))
+
+    assert answered.result() == 'answer'
+    with pytest.raises(RuntimeError):
+        waiting.result()
+
+
+def test_batch_sends_one_multi_request(server, client, account):
+    before = server.requests[API]
+
+    with client.batch():
+        userinfo = client.userinfo()
+        opened = client.api_single_request(_bad_open())
+        units = client.api_single_request(('unit', 'unitAll'))
+        assert not userinfo.done()
+
+    assert server.requests[API] == before + 1
+    assert userinfo.result()['status_code'] == 200
+    assert userinfo.result()['response_data']['user']['user_id'] == \
+        account.user_id
+    assert opened.result()['status_code'] == 600
+    assert units.result()['status_code'] == 200
+    assert len(units.result()['response_data']) == len(account.units)
+
+
+def test_unbatchable_call_flushes_the_queue(server, client):
+    before = server.requests[API]
+
+    with client.batch():
+        userinfo = client.userinfo()
+        client.api_single_request(None, '/main.php/lbonus/execute')
+        assert userinfo.done()
+
+    assert server.requests[API] == before + 1
+    assert userinfo.result()['status_code'] == 200
+
+
+def test_async_calls_are_coalesced(server, async_client_class):
+    async def run():
+        client = async_client_class()
+        await client.startapp(*client.gen_new_credentials())
+        before = server.requests[API]
+        async with client.batch():
+            results = await asyncio.gather(
+                client.userinfo(), client.api_single_request(_bad_open()),
+                client.api_single_request(('unit', 'unitAll')))
+        return server.requests[API] - before, results
+
+    sent, (userinfo, opened, units) = asyncio.run(run())
+
+    assert sent == 1
+    assert userinfo['status_code'] == 200
+    assert 'user' in userinfo['response_data']
+    assert opened['status_code'] == 600
+    assert units['status_code'] == 200
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+import pytest
+
+from llsifclient import cache
+from llsifclient.cache import GLOBAL, USER, CacheRule, ResponseCache
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    return clock
+
+
+RULES = {('m', 'short'): CacheRule(10, USER),
+         ('m', 'long'): CacheRule(100, USER),
+         ('m', 'global'): CacheRule(10, GLOBAL)}
+
+
+def test_ttl(clock):
+    responses = ResponseCache(RULES)
+    responses.put('m', 'short', 1, 'result')
+
+    clock.now += 9.9
+    assert responses.get('m', 'short', 1) == 'result'
+    clock.now += 0.1
+    assert responses.get('m', 'short', 1) is None
+    assert (responses.hits, responses.misses) == (1, 1)
+
+
+def test_scopes(clock):
+    responses = ResponseCache(RULES)
+    responses.put('m', 'short', 1, 'one')
+    responses.put('m', 'global', 1, 'everyone')
+
+    assert responses.get('m', 'short', 2) is None
+    assert responses.get('m', 'short', None) is None
+    assert responses.get('m', 'global', 2) == 'everyone'
+    assert responses.get('x', 'uncached', 1) is None
+
+
+def test_invalidate(clock):
+    responses = ResponseCache(RULES)
+    responses.put('m', 'short', 1, 'one')
+    responses.put('m', 'short', 2, 'two')
+
+    responses.invalidate('m', 'short', 1)
+
+    assert responses.get('m', 'short', 1) is None
+    assert responses.get('m', 'short', 2) == 'two'
+
+
+def test_mutating_call_drops_dependents(clock):
+    responses = ResponseCache()
+    for call in (('unit', 'unitAll'), ('album', 'albumAll'),
+                 ('unit', 'deckInfo')):
+        responses.put(call[0], call[1], 1, call)
+
+    responses.observe('secretbox', 'pon', 1, {})
+
+    assert responses.get('unit', 'unitAll', 1) is None
+    assert responses.get('album', 'albumAll', 1) is None
+    assert responses.get('unit', 'deckInfo', 1) == ('unit', 'deckInfo')
+
+
+def test_evicts_closest_to_expiring(clock):
+    responses = ResponseCache(RULES, maxsize=3)
+    responses.put('m', 'long', 1, 'long 1')
+    responses.put('m', 'short', 1, 'short 1')
+    responses.put('m', 'long', 2, 'long 2')
+
+    responses.put('m', 'long', 3, 'long 3')
+
+    assert len(responses) == 3
+    assert responses.get('m', 'short', 1) is None
+    assert responses.get('m', 'long', 1) == 'long 1'
+
+
+def test_replaced_and_dropped_entries_are_not_evicted(clock):
+    responses = ResponseCache(RULES, maxsize=2)
+    responses.put('m', 'short', 1, 'old')
+    clock.now += 5
+    responses.put('m', 'short', 1, 'new')
+    responses.put('m', 'long', 1, 'long')
+    responses.invalidate('m', 'long', 1)
+    responses.put('m', 'long', 2, 'long 2')
+
+    responses.put('m', 'long', 3, 'long 3')
+
+    assert len(responses) == 2
+    assert responses.get('m', 'short', 1) is None
+    assert responses.get('m', 'long', 2) == 'long 2'
+    assert responses.get('m', 'long', 3) == 'long 3'
+
+
+def test_expiry_heap_stays_bounded(clock):
+    responses = ResponseCache(RULES)
+    for i in range(10000):
+        responses.put('m', 'short', i % 10, i)
+
+    assert len(responses) == 10
+    assert len(responses._expiries) <= 2 * 10 + 64
+
+
+@pytest.fixture
+def cached_client_class(client_class):
+    client_class.RESPONSE_CACHE = ResponseCache()
+    client_class.SKIP_CACHED = True
+    return client_class
+
+
+def test_cached_calls_are_skipped(server, cached_client_class):
+    client = cached_client_class()
+    client.startapp(*client.gen_new_credentials())
+    client.unit_and_deck()
+    requests = sum(server.requests.values())
+
+    units, decks = [entry['result'] for entry in
+                    client.unit_and_deck()['response_data']]
+
+    assert sum(server.requests.values()) == requests
+    assert len(units) == len(server.accounts[client.session['loginkey']].units)
+
+
+def test_scouting_refetches_units(server, cached_client_class):
+    client = cached_client_class()
+    client.startapp(*client.gen_new_credentials())
+    client.unit_and_deck()
+    account = server.accounts[client.session['loginkey']]
+
+    client.recruit(1, 1)
+    units, decks = [entry['result'] for entry in
+                    client.unit_and_deck()['response_data']]
+
+    assert len(units) == len(account.units)
+
+
+def test_merge_skips_unanswered_requests(cached_client_class):
+    client = cached_client_class()
+    client.session['userid'] = 1
+    requests = [('unit', 'unitAll'), ('user', 'userInfo'),
+                ('unit', 'deckInfo')]
+    respobj = OrderedDict([('response_data', [{'result': 'units',
+                                               'status': 200}]),
+                           ('status_code', 200)])
+
+    merged = client.merge_cached(requests, {2: 'decks'}, respobj)
+
+    assert [entry['result'] for entry in merged['response_data']] == \
+        ['units', 'decks']
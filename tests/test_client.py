@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+
+def test_startapp(server, client, account):
+    assert client.session['userid'] == account.user_id
+    assert client.session['token'] in server.tokens
+    assert server.bad_signatures == 0
+    assert server.bad_tokens == 0
+
+
+def test_unit_and_deck(client, account):
+    respobj = client.unit_and_deck()
+
+    units, decks = [entry['result'] for entry in respobj['response_data']]
+    assert sorted(unit['unit_owning_user_id'] for unit in units) == \
+        sorted(account.units)
+    assert [deck['unit_deck_id'] for deck in decks] == \
+        [deck['unit_deck_id'] for deck in account.decks]
+
+
+def test_connections_are_reused(client):
+    pool = client.connection_pool(client.READ_TIMEOUT)
+    client.userinfo()
+    conn = pool._idle[-1]
+
+    client.userinfo()
+
+    assert pool._idle[-1] is conn
+
+
+def test_retries_5xx_204_and_resets(server, client):
+    server.inject('status', times=2)
+    server.inject('no_content')
+    server.inject('reset')
+
+    assert client.userinfo()['status_code'] == 200
+    # the reset hits a kept-alive connection, which the pool reopens by
+    # itself without a retry
+    assert client.retry_policy.stats.retries == 3
+    assert not server._faults
+
+
+def test_retry_gives_up(server, client):
+    client.retry_policy.max_attempts = 3
+    server.inject('status', times=None)
+
+    with pytest.raises(RuntimeError):
+        client.userinfo()
+    assert client.retry_policy.stats.failures == 1
+
+
+def test_4xx_is_not_retried(server, client):
+    server.inject('status', status=404)
+
+    with pytest.raises(RuntimeError):
+        client.userinfo()
+    assert client.retry_policy.stats.retries == 0
+
+
+def test_maintenance(server, client):
+    server.inject('maintenance')
+
+    with pytest.raises(RuntimeError, match='maintenance'):
+        client.userinfo()
+
+
+def test_async_startapp_and_retry(server, async_client_class):
+    async def run():
+        client = async_client_class()
+        await client.startapp(*client.gen_new_credentials())
+        server.inject('status')
+        server.inject('reset')
+        userinfo = await client.userinfo()
+        return client, userinfo
+
+    client, userinfo = asyncio.run(run())
+
+    assert userinfo['status_code'] == 200
+    assert client.retry_policy.stats.retries == 1
+    assert not server._faults
+    assert server.bad_signatures == 0
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import gzip
+import http.client
+import io
+import os
+import zlib
+
+import pytest
+
+from llsifclient import decoding
+
+
+class FakeResponse(object):
+    '''Just enough of http.client.HTTPResponse for read_body().'''
+
+    def __init__(self, body, content_encoding=None):
+        self._body = io.BytesIO(body)
+        self._content_encoding = content_encoding
+
+    def getheader(self, name):
+        if name == 'Content-Encoding':
+            return self._content_encoding
+        return None
+
+    def read(self, size):
+        return self._body.read(size)
+
+    async def iter_chunks(self, size):
+        while True:
+            chunk = self.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+BODY = os.urandom(1024) * 300
+
+
+@pytest.mark.parametrize('encoding,compress', [
+    (None, lambda body: body),
+    ('gzip', gzip.compress),
+    ('deflate', zlib.compress),
+])
+def test_read_body(encoding, compress):
+    body = decoding.read_body(FakeResponse(compress(BODY), encoding))
+    assert type(body) is bytes
+    assert body == BODY
+
+
+def test_read_body_async():
+    body = asyncio.run(decoding.read_body_async(
+        FakeResponse(gzip.compress(BODY), 'gzip')))
+    assert type(body) is bytes
+    assert body == BODY
+
+
+@pytest.mark.parametrize('encoding,compress', [
+    (None, lambda body: body),
+    ('gzip', gzip.compress),
+])
+def test_size_cap(encoding, compress):
+    response = FakeResponse(compress(BODY), encoding)
+    with pytest.raises(decoding.ResponseTooLarge):
+        decoding.read_body(response, max_size=len(BODY) - 1)
+
+    response = FakeResponse(compress(BODY), encoding)
+    assert decoding.read_body(response, max_size=len(BODY)) == BODY
+
+
+def test_size_cap_stops_inflating():
+    # A few KiB inflating to 64 MiB must not be inflated in full
+    bomb = gzip.compress(bytes(64 * 1024 * 1024))
+    decoder = decoding.ResponseDecoder('gzip', max_size=1024)
+
+    with pytest.raises(decoding.ResponseTooLarge):
+        decoder.feed(bomb)
+    assert decoder.size <= 1025
+
+
+def test_truncated_gzip():
+    compressed = gzip.compress(BODY)
+    response = FakeResponse(compressed[:len(compressed) // 2], 'gzip')
+
+    with pytest.raises(http.client.IncompleteRead) as excinfo:
+        decoding.read_body(response)
+    assert BODY.startswith(excinfo.value.partial)
+
+
+def test_verifier_sees_decoded_body():
+    class Verifier(object):
+        def __init__(self):
+            self.data = b''
+
+        def update(self, data):
+            self.data += data
+
+    verifier = Verifier()
+    decoding.read_body(FakeResponse(gzip.compress(BODY), 'gzip'),
+                       verifier=verifier)
+    assert verifier.data == BODY
+
+
+def test_empty_gzip_body():
+    assert decoding.read_body(FakeResponse(b'', 'gzip')) == b''
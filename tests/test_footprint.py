@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from llsifclient import footprint, ratelimit
+from llsifclient.sessionstate import SessionState
+
+
+class Slotted(object):
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+
+def test_deep_sizeof():
+    payload = bytes(100000)
+
+    assert footprint.deep_sizeof([payload]) > 100000
+    assert footprint.deep_sizeof(Slotted(payload)) > 100000
+    assert footprint.deep_sizeof([payload], exclude=[payload]) < 1000
+
+    seen = set()
+    assert footprint.deep_sizeof([payload], seen=seen) > 100000
+    assert footprint.deep_sizeof({'again': payload}, seen=seen) < 1000
+
+
+def test_shared_objects(client_class):
+    client_class.HOST_RATE = 1000
+    client = client_class()
+    client.startapp(*client.gen_new_credentials())
+
+    shared = [id(item) for item in client.shared_objects()]
+
+    bucket = ratelimit.get_host_bucket(client.SERVER_HOST, client.HOST_RATE,
+                                       client.HOST_BURST)
+    assert id(bucket) in shared
+    assert id(client.signer) in shared
+    assert id(client.connection_pool(client.READ_TIMEOUT)) in shared
+
+
+def test_shared_objects_are_not_counted(client):
+    bucket = ratelimit.get_host_bucket(client.SERVER_HOST, 1000, 10)
+    bucket.payload = bytes(1000000)
+    client.pinned = [bucket, client.signer,
+                     client.connection_pool(client.READ_TIMEOUT)]
+    try:
+        report = client.memory_footprint()
+    finally:
+        del bucket.payload
+
+    assert report['pinned'] < 1000
+    assert report['total'] < 1000000
+
+
+def test_async_pools_are_not_counted(async_client_class):
+    async def footprint():
+        client = async_client_class()
+        await client.startapp(*client.gen_new_credentials())
+        client.pool = client.connection_pool(client.READ_TIMEOUT)
+        return client.memory_footprint()
+
+    report = asyncio.run(footprint())
+
+    assert report['pool'] < 100
+
+
+def test_low_memory(client_class):
+    client = client_class()
+    client.startapp(*client.gen_new_credentials())
+    client_class.LOW_MEMORY = True
+    low = client_class()
+    low.startapp(*low.gen_new_credentials())
+
+    assert isinstance(low.session, SessionState)
+    assert low.session['token'] is not None
+    assert not hasattr(low, '_last_response_body')
+    assert low.userinfo()['status_code'] == 200
+
+    assert low.memory_footprint()['session'] < \
+        client.memory_footprint()['session']
+    assert low.memory_footprint()['total'] < \
+        client.memory_footprint()['total']
+
+
+def test_session_state():
+    session = SessionState(token='abc', nonce=2)
+
+    assert session['token'] == 'abc'
+    assert session.get('nonce') == 2
+    assert session.get('unknown', 'default') == 'default'
+    assert dict(session) == dict(session.items())
+    assert session == dict(session.items())
+    assert session.copy() == session and session.copy() is not session
+    assert len(session) == len(session.keys())
+    assert 'loginkey' in session and 'unknown' not in session
+
+    session.update({'commandnum': 5}, userid=7)
+    assert (session['commandnum'], session['userid']) == (5, 7)
+
+    session.reset()
+    assert session == SessionState()
+    assert session['nonce'] == 0
+
+    with pytest.raises(KeyError):
+        session['unknown']
+    with pytest.raises(KeyError):
+        session['unknown'] = 1
+    with pytest.raises(AttributeError):
+        session.unknown = 1
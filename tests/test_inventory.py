@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+
+@pytest.fixture
+def client(client_class):
+    '''A client tracking the inventory, after startapp().'''
+
+    client_class.TRACK_INVENTORY = True
+    client = client_class()
+    client.startapp(*client.gen_new_credentials())
+    return client
+
+
+def test_off_by_default(server):
+    from llsifclient.client import LLSIFClient
+
+    assert LLSIFClient().inventory is None
+
+
+def test_unit_and_deck_loads_the_inventory(client, account):
+    client.unit_and_deck()
+
+    assert sorted(unit.owning_id for unit in client.inventory) == \
+        sorted(account.units)
+    assert not client.inventory.stale
+
+
+def test_scouted_units_are_added(client, account):
+    client.unit_and_deck()
+
+    client.recruit(1, 1)
+    client.multirecruit(10, 1, 1)
+
+    assert sorted(unit.owning_id for unit in client.inventory) == \
+        sorted(account.units)
+    assert not client.inventory.stale
+
+
+def test_listing_scouting_keeps_the_inventory(client):
+    client.unit_and_deck()
+
+    client.recruitinfo()
+
+    assert not client.inventory.stale
+
+
+def test_presents_make_the_inventory_stale(client):
+    client.unit_and_deck()
+
+    list(client.drain_present_box())
+
+    assert client.inventory.stale
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import json
+import math
+
+from collections import OrderedDict
+
+import pytest
+
+from llsifclient import jsoncodec
+from llsifclient.client import LLSIFClient
+from llsifclient.consts import MAIN_ROUTER_MAP
+
+INSTALLED = [name for name, module in (('orjson', jsoncodec.orjson),
+                                       ('ujson', jsoncodec.ujson),
+                                       ('json', json))
+             if module is not None]
+
+
+def request_samples():
+    samples = []
+    for definition in MAIN_ROUTER_MAP.values():
+        kwargs = dict((key, i) for i, key in enumerate(definition.requires or ()))
+        samples.append(definition.parse(**kwargs))
+        samples.append(definition.parse(is_single=False, **kwargs))
+    for name in LLSIFClient.DEF_NAMES + ['a"b\\c/d', '\x00\x1f\x7f\n\t', '  ',
+                                         '\U0001f3b5', '%s', '  ']:
+        samples.append(OrderedDict([('module', 'user'), ('action', 'changeName'),
+                                    ('timeStamp', '1460000000'), ('name', name),
+                                    ('commandNum', 'key.1460000000.3')]))
+    samples.append(OrderedDict([('module', 'unit'), ('action', 'sale'),
+                                ('unit_owning_user_id', list(range(500))),
+                                ('commandNum', None)]))
+    samples.append([OrderedDict([('module', m), ('action', a), ('timeStamp', '1')])
+                    for m, a in LLSIFClient.STARTUP_REQUESTS])
+    return samples
+
+
+EDGE_CASES = [
+    {'ints': [0, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 64 - 1]},
+    {'big ints': [2 ** 64, -2 ** 63 - 1, 10 ** 30, -2 ** 70]},
+    {'floats': [0.1, 1.0, -0.0, 1e16, 1e-7, 123456789.125, 5e-324]},
+    {'bools': [True, False, None], 'nested': [[[{}]], [], {'': ''}]},
+    {1: 'int key', 2.5: 'float key', None: 'None key'},
+    # True == 1, so it can not share a dict with the int key
+    {True: 'bool key', False: 'other bool key'},
+    {'tuple': (1, 'two', (3,))},
+    {u'キー': u'値', 'emoji': '\U0001f3b5', 'escapes': '"\\/\b\f\n\r\t'},
+]
+
+
+@pytest.fixture(params=INSTALLED)
+def backend(request):
+    previous = jsoncodec.backend
+    jsoncodec.use_backend(request.param)
+    yield request.param
+    jsoncodec.use_backend(previous)
+
+
+def test_dumps_matches_stdlib(backend):
+    for obj in request_samples() + EDGE_CASES:
+        assert jsoncodec.dumps(obj) == jsoncodec.dumps_stdlib(obj), obj
+
+
+def test_dumps_stdlib_is_the_signed_encoding():
+    for obj in request_samples() + EDGE_CASES:
+        assert jsoncodec.dumps_stdlib(obj) == json.dumps(
+            obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def test_dumps_non_string_keys_like_stdlib(backend):
+    # orjson only takes them with OPT_NON_STR_KEYS, and formats them its
+    # own way; the stdlib encoding has to win
+    assert jsoncodec.dumps({1: 'a', 'b': 2}) == b'{"1":"a","b":2}'
+    assert jsoncodec.dumps({2.5: 1}) == b'{"2.5":1}'
+
+
+def test_dumps_lone_surrogate(backend):
+    with pytest.raises(UnicodeEncodeError):
+        jsoncodec.dumps({'s': '\ud800'})
+
+
+def test_loads_matches_stdlib(backend):
+    for obj in request_samples() + EDGE_CASES:
+        data = jsoncodec.dumps_stdlib(obj)
+        assert jsoncodec.loads(data) == json.loads(data.decode('utf-8'))
+        assert jsoncodec.loads(bytearray(data)) == json.loads(data.decode('utf-8'))
+
+
+def test_loads_beyond_backend_limits(backend):
+    data = b'{"big":123456789012345678901234567890,"neg":-18446744073709551617}'
+    assert jsoncodec.loads(data) == {'big': 123456789012345678901234567890,
+                                     'neg': -18446744073709551617}
+    assert jsoncodec.loads(data.decode('ascii'))['big'] == \
+        123456789012345678901234567890
+    assert math.isnan(jsoncodec.loads(b'[NaN]')[0])
+
+
+def test_loads_big_int_across_scan_chunks(backend):
+    padding = b' ' * (jsoncodec._SCAN_CHUNK - 10)
+    data = b'[' + padding + b'123456789012345678901234567890]'
+    assert jsoncodec.loads(data) == [123456789012345678901234567890]
+
+
+def test_loads_other_charsets(backend):
+    text = u'{"name":"幻の学院生"}'
+    assert jsoncodec.loads(text.encode('shift_jis'), 'Shift_JIS') == \
+        {'name': u'幻の学院生'}
+    assert jsoncodec.loads(text) == {'name': u'幻の学院生'}
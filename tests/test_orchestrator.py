@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+
+from llsifclient.orchestrator import JobTimeout, SessionOrchestrator
+from llsifclient.ratelimit import RequestScheduler
+
+
+class FakeClient(object):
+    SERVER_HOST = 'orchestrated.example:80'
+
+    def __init__(self):
+        self.scheduler = RequestScheduler()
+
+
+class Peak(object):
+    '''Highest number of jobs running at once.'''
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self.running -= 1
+
+
+CREDENTIALS = [('key{}'.format(i), 'passwd') for i in range(9)]
+
+
+def _sync_job(peak, failing=()):
+    def job(client, login_key, login_passwd):
+        with peak:
+            time.sleep(0.05)
+        if login_key in failing:
+            raise ValueError(login_key)
+        return login_key
+    return job
+
+
+def _async_job(peak, failing=()):
+    async def job(client, login_key, login_passwd):
+        with peak:
+            await asyncio.sleep(0.05)
+        if login_key in failing:
+            raise ValueError(login_key)
+        return login_key
+    return job
+
+
+def _run_async(orchestrator, job, credentials=CREDENTIALS):
+    async def run():
+        return [result async for result in
+                orchestrator.run_async(credentials, job)]
+    return asyncio.run(run())
+
+
+def test_max_workers():
+    peak = Peak()
+    orchestrator = SessionOrchestrator(max_workers=3,
+                                       client_factory=FakeClient)
+
+    results = list(orchestrator.run(CREDENTIALS, _sync_job(peak)))
+
+    assert sorted(result.value for result in results) == \
+        sorted(key for key, _ in CREDENTIALS)
+    assert peak.peak == 3
+    assert orchestrator.stats.succeeded == len(CREDENTIALS)
+
+
+def test_max_per_host_follows_changes_between_runs():
+    orchestrator = SessionOrchestrator(max_workers=6, max_per_host=1,
+                                       client_factory=FakeClient)
+    peak = Peak()
+    list(orchestrator.run(CREDENTIALS, _sync_job(peak)))
+    assert peak.peak == 1
+
+    orchestrator.max_per_host = 3
+    peak = Peak()
+    list(orchestrator.run(CREDENTIALS, _sync_job(peak)))
+    assert peak.peak == 3
+
+
+def test_async_max_per_host_follows_changes_between_runs():
+    orchestrator = SessionOrchestrator(max_workers=6, max_per_host=2,
+                                       client_factory=FakeClient)
+    peak = Peak()
+    _run_async(orchestrator, _async_job(peak))
+    assert peak.peak == 2
+
+    orchestrator.max_per_host = 4
+    peak = Peak()
+    _run_async(orchestrator, _async_job(peak))
+    assert peak.peak == 4
+
+
+def test_errors_stay_with_their_account():
+    orchestrator = SessionOrchestrator(max_workers=3,
+                                       client_factory=FakeClient)
+
+    results = dict((result.login_key, result) for result in
+                   orchestrator.run(CREDENTIALS, _sync_job(Peak(), ['key4'])))
+
+    assert isinstance(results['key4'].error, ValueError)
+    assert all(result.ok for key, result in results.items() if key != 'key4')
+    assert (orchestrator.stats.succeeded, orchestrator.stats.failed) == (8, 1)
+
+
+def test_async_errors_stay_with_their_account():
+    orchestrator = SessionOrchestrator(max_workers=3,
+                                       client_factory=FakeClient)
+
+    results = dict((result.login_key, result) for result in
+                   _run_async(orchestrator, _async_job(Peak(), ['key4'])))
+
+    assert isinstance(results['key4'].error, ValueError)
+    assert all(result.ok for key, result in results.items() if key != 'key4')
+    assert (orchestrator.stats.succeeded, orchestrator.stats.failed) == (8, 1)
+
+
+def test_async_timeout():
+    async def job(client, login_key, login_passwd):
+        await asyncio.sleep(60 if login_key == 'key0' else 0)
+        return login_key
+
+    orchestrator = SessionOrchestrator(max_workers=3, timeout=0.1,
+                                       client_factory=FakeClient)
+
+    results = dict((result.login_key, result) for result in
+                   _run_async(orchestrator, job, CREDENTIALS[:3]))
+
+    assert isinstance(results['key0'].error, JobTimeout)
+    assert results['key1'].ok and results['key2'].ok
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from llsifclient.inventory import N, R, UnitInventory
+from llsifclient.planner import SALE_LIMIT, UnitPolicy, plan_units
+
+
+def _inventory(levels, rarity=N):
+    inventory = UnitInventory()
+    for owning_id, level in enumerate(levels, 1):
+        inventory.add({'unit_owning_user_id': owning_id, 'unit_id': 1,
+                       'rarity': rarity, 'level': level, 'max_level': 30})
+    return inventory
+
+
+def test_sells_only_above_the_level():
+    inventory = _inventory([19, 20, 21, 30])
+
+    plan = plan_units(inventory, UnitPolicy(sell_rarities=[N],
+                                            sell_above_level=20))
+
+    assert plan.sales == [[3, 4]]
+
+
+def test_sales_are_split_at_the_limit():
+    inventory = _inventory([1] * (SALE_LIMIT + 1))
+
+    plan = plan_units(inventory, UnitPolicy(sell_rarities=[N]))
+
+    assert [len(units) for units in plan.sales] == [SALE_LIMIT, 1]
+
+
+def test_keeps_the_merge_base_and_partners():
+    inventory = _inventory([1, 1, 1])
+    inventory.add({'unit_owning_user_id': 4, 'unit_id': 2, 'rarity': R,
+                   'level': 1, 'max_level': 40})
+
+    plan = plan_units(inventory, UnitPolicy(feed_base=4, feed_rarities=[N]))
+
+    assert plan.merges == [(4, [1, 2, 3])]
+    assert plan.sales == []
+
+
+def test_feed_only_policy_sells_nothing():
+    inventory = _inventory([1, 1, 30])
+    for owning_id in (4, 5):
+        inventory.add({'unit_owning_user_id': owning_id, 'unit_id': 2,
+                       'rarity': R, 'level': 1, 'max_level': 40})
+
+    plan = plan_units(inventory, UnitPolicy(feed_base=4, feed_rarities=[R]))
+
+    assert plan.merges == [(4, [5])]
+    assert plan.sales == []
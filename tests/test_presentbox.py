@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from llsifclient.presentbox import UNIT_ADD_TYPE
+
+
+def test_open_all(client, account):
+    presents = list(account.presents)
+
+    drain = client.drain_present_box()
+    opened = list(drain)
+
+    assert sorted(present['incentive_id'] for present in opened) == \
+        sorted(presents)
+    assert not account.presents
+    assert drain.stats.error is None
+
+
+def test_open_page_by_page(client, account):
+    presents = list(account.presents)
+
+    drain = client.drain_present_box(open_all=False, batch_size=7)
+    opened = list(drain)
+
+    assert sorted(present['incentive_id'] for present in opened) == \
+        sorted(presents)
+    assert not account.presents
+    assert drain.stats.opened == len(presents)
+    assert drain.stats.pages == 3
+    assert drain.stats.error is None
+
+
+def test_item_filter(client, account):
+    kept = [present['incentive_id'] for present in account.presents.values()
+            if present['add_type'] == UNIT_ADD_TYPE
+            or present['incentive_item_id'] != 3]
+
+    drain = client.drain_present_box(items=(3,), units=False)
+    opened = list(drain)
+
+    assert opened
+    assert all(present['incentive_item_id'] == 3 for present in opened)
+    assert sorted(account.presents) == sorted(kept)
+    assert drain.stats.skipped == len(kept)
+
+
+def test_stops_when_unit_box_is_full(client, account):
+    account.unit_max = len(account.units)
+
+    drain = client.drain_present_box(open_all=False)
+    opened = list(drain)
+
+    assert all(present['add_type'] != UNIT_ADD_TYPE for present in opened)
+    assert drain.stats.error is not None
+
+
+def test_async_drain(async_client_class, server):
+    async def drain():
+        client = async_client_class()
+        await client.startapp(*client.gen_new_credentials())
+        account = server.accounts[client.session['loginkey']]
+        presents = list(account.presents)
+        opened = [present async for present in
+                  client.drain_present_box(open_all=False)]
+        return presents, opened, account
+
+    presents, opened, account = asyncio.run(drain())
+
+    assert sorted(present['incentive_id'] for present in opened) == \
+        sorted(presents)
+    assert not account.presents
+
+
+def test_stats_start_with_the_first_request(client):
+    drain = client.drain_present_box()
+    assert drain.stats.started is None
+    assert drain.stats.elapsed == 0.0
+
+    list(drain)
+
+    assert drain.stats.started is not None
+    assert drain.stats.finished >= drain.stats.started
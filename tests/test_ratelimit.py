@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+
+from llsifclient.ratelimit import (Cancelled, RequestScheduler, TokenBucket,
+                                   get_host_bucket)
+
+
+def test_burst():
+    bucket = TokenBucket(10, burst=3)
+    now = time.monotonic()
+
+    slots = [bucket.reserve(now) for _ in range(5)]
+
+    assert slots[:3] == pytest.approx([now] * 3)
+    assert slots[3] == pytest.approx(now + 0.1)
+    assert slots[4] == pytest.approx(now + 0.2)
+
+
+def test_refill():
+    bucket = TokenBucket(10, burst=3)
+    now = time.monotonic()
+    for _ in range(3):
+        bucket.reserve(now)
+
+    assert bucket.reserve(now + 0.1) == pytest.approx(now + 0.1)
+    assert bucket.reserve(now + 0.1) == pytest.approx(now + 0.2)
+    later = now + 1.0
+    assert [bucket.reserve(later) for _ in range(3)] == \
+        pytest.approx([later] * 3)
+
+
+def test_host_bucket_is_shared():
+    bucket = get_host_bucket('shared.example:80', 5, 2)
+
+    assert get_host_bucket('shared.example:80', 5, 2) is bucket
+    assert get_host_bucket('other.example:80', 5, 2) is not bucket
+    assert get_host_bucket('shared.example:80', 5, 3) is not bucket
+
+
+def test_host_rate_limits_all_sessions():
+    host = 'limited.example:80'
+    first = RequestScheduler(host_rate=10, host_burst=2)
+    second = RequestScheduler(host_rate=10, host_burst=2)
+
+    assert first.delay(host) == pytest.approx(0.0, abs=0.01)
+    assert second.delay(host) == pytest.approx(0.0, abs=0.01)
+    assert first.delay(host) == pytest.approx(0.1, abs=0.02)
+    assert second.delay(host) == pytest.approx(0.2, abs=0.02)
+
+
+def test_session_rate():
+    scheduler = RequestScheduler(session_rate=20)
+
+    assert scheduler.delay('host') == pytest.approx(0.0, abs=0.01)
+    assert scheduler.delay('host') == pytest.approx(0.05, abs=0.02)
+
+
+def test_think_time_is_not_booked():
+    host = 'thinking.example:80'
+    thinking = RequestScheduler(host_rate=10)
+    other = RequestScheduler(host_rate=10)
+    thinking.think(0.5, 0.5)
+
+    assert thinking.delay(host) == pytest.approx(0.5, abs=0.02)
+    assert other.delay(host) == pytest.approx(0.0, abs=0.01)
+
+
+def test_deadline():
+    scheduler = RequestScheduler()
+    scheduler.defer(0.3)
+
+    assert scheduler.deadline('host') == \
+        pytest.approx(time.monotonic() + 0.3, abs=0.02)
+
+
+def test_wait():
+    scheduler = RequestScheduler()
+    scheduler.defer(0.1)
+    started = time.monotonic()
+
+    scheduler.wait('host')
+
+    assert time.monotonic() - started >= 0.1
+    assert scheduler.delay('host') == 0.0
+
+
+def test_cancel_interrupts_wait():
+    scheduler = RequestScheduler()
+    scheduler.defer(60)
+    threading.Timer(0.05, scheduler.cancel).start()
+    started = time.monotonic()
+
+    with pytest.raises(Cancelled):
+        scheduler.wait('host')
+
+    assert time.monotonic() - started < 5
+    with pytest.raises(Cancelled):
+        scheduler.wait('host')
+
+
+def test_timed_out_job_is_cancelled_at_its_next_request(client_class):
+    from llsifclient.orchestrator import JobTimeout, SessionOrchestrator
+
+    finished = threading.Event()
+    errors = []
+
+    def job(client, login_key, login_passwd):
+        client.scheduler.defer(60)
+        try:
+            client.startapp(*client.gen_new_credentials())
+        except Cancelled as exc:
+            errors.append(exc)
+        finally:
+            finished.set()
+
+    orchestrator = SessionOrchestrator(max_workers=1, timeout=0.1,
+                                       client_factory=client_class)
+    results = list(orchestrator.run([('key', 'passwd')], job))
+
+    assert isinstance(results[0].error, JobTimeout)
+    assert finished.wait(5)
+    assert len(errors) == 1
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+import pytest
+
+from llsifclient.decoding import ResponseTooLarge
+from llsifclient.replay import (AsyncReplayPool, CaptureWriter, Exchange,
+                                ReplayPool, read_capture)
+
+
+@pytest.fixture
+def capture(tmp_path, server, client_class):
+    '''Path of a capture of startapp() and unit_and_deck(), and their
+    responses.'''
+
+    path = str(tmp_path / 'capture.bin')
+    with CaptureWriter(path) as writer:
+        client_class.RECORDER = writer
+        client = client_class()
+        credentials = client.gen_new_credentials()
+        client.startapp(*credentials)
+        units = client.unit_and_deck()
+    client_class.RECORDER = None
+    return path, credentials, units
+
+
+def test_round_trip(server, capture, client_class):
+    path, credentials, units = capture
+    client_class.REPLAY = ReplayPool(path)
+    requests = sum(server.requests.values())
+
+    client = client_class()
+    client.startapp(*credentials)
+
+    assert client.unit_and_deck() == units
+    assert sum(server.requests.values()) == requests
+    assert client_class.REPLAY.replayed == len(client_class.REPLAY)
+
+
+def test_async_round_trip(capture, async_client_class):
+    path, credentials, units = capture
+    async_client_class.REPLAY = AsyncReplayPool(path)
+
+    async def replay():
+        client = async_client_class()
+        await client.startapp(*credentials)
+        return await client.unit_and_deck()
+
+    assert asyncio.run(replay()) == units
+
+
+def test_failed_read_closes_the_replayed_connection(capture, client_class):
+    path, credentials, _ = capture
+    client_class.REPLAY = ReplayPool(path)
+    client_class.MAX_RESPONSE_SIZE = 16
+
+    with pytest.raises(ResponseTooLarge):
+        client_class().startapp(*credentials)
+
+
+def test_runs_out_of_responses(capture, client_class):
+    path, credentials, _ = capture
+    client_class.REPLAY = ReplayPool(path)
+    client = client_class()
+    client.startapp(*credentials)
+    client.unit_and_deck()
+
+    with pytest.raises(RuntimeError):
+        client.unit_and_deck()
+
+
+def _write_capture(path, times, elapsed):
+    with CaptureWriter(path) as writer:
+        for started in times:
+            writer.write(Exchange(started, elapsed, 'POST', '/main.php/a', 200,
+                                  [], b'{}', [('Content-Length', '2')],
+                                  b'{}'))
+
+
+def test_realtime_keeps_the_recorded_gaps(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    _write_capture(path, [1000.0, 1000.2, 1000.25], 0.01)
+    assert [exchange.time for exchange in read_capture(path)] == \
+        [1000.0, 1000.2, 1000.25]
+    pool = ReplayPool(path, realtime=True)
+
+    started = time.monotonic()
+    answered = []
+    for _ in range(3):
+        pool.urlopen('POST', '/main.php/a', {})
+        answered.append(time.monotonic() - started)
+
+    assert 0.01 <= answered[0] < 0.1
+    assert 0.21 <= answered[1] < 0.3
+    assert 0.26 <= answered[2] < 0.35
+
+
+def test_realtime_does_not_catch_up(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    _write_capture(path, [1000.0, 1000.01], 0.05)
+    pool = ReplayPool(path, realtime=True)
+    pool.urlopen('POST', '/main.php/a', {})
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    conn, _ = pool.urlopen('POST', '/main.php/a', {})
+
+    assert time.monotonic() - started >= 0.05
+    conn.close()
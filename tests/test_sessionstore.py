@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+
+import pytest
+
+from llsifclient.sessionstore import SessionStore
+
+
+@pytest.fixture
+def store(tmp_path, client_class):
+    with SessionStore(str(tmp_path / 'sessions.db')) as store:
+        client_class.SESSION_STORE = store
+        yield store
+
+
+def _session(loginkey, nonce=1):
+    return {'loginkey': loginkey, 'userid': 1, 'token': 'token',
+            'nonce': nonce, 'commandnum': nonce, 'last_login': None}
+
+
+def test_counters_are_staged_after_each_request(store, client_class):
+    client = client_class()
+    client.resume(*client.gen_new_credentials())
+    client.userinfo()
+
+    saved = store.load(client.SERVER_HOST, client.session['loginkey'])
+
+    assert saved['token'] == client.session['token']
+    assert saved['nonce'] == client.session['nonce']
+    assert saved['commandnum'] == client.session['commandnum']
+
+
+def test_staged_sessions_are_written_by_flush(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    with SessionStore(path, flush_interval=3600) as store:
+        assert not store.stage('host', _session('a'))
+        store.stage('host', _session('b'))
+        store.stage('host', _session('a', nonce=2))
+        assert len(store) == 0
+
+        store.flush()
+
+        assert len(store) == 2
+        with SessionStore(path) as other:
+            assert other.load('host', 'a')['nonce'] == 2
+
+
+def test_close_flushes(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    with SessionStore(path, flush_interval=3600) as store:
+        store.stage('host', _session('a'))
+
+    with SessionStore(path) as store:
+        assert store.load('host', 'a')['nonce'] == 1
+
+
+def test_unchanged_sessions_are_not_staged(store, client_class):
+    client = client_class()
+    client.resume(*client.gen_new_credentials())
+
+    assert client.stage_session() is False
+
+
+def test_resume_after_requests(server, store, client_class):
+    client = client_class()
+    credentials = client.gen_new_credentials()
+    assert not client.resume(*credentials)
+    client.unit_and_deck()
+    client.userinfo()
+
+    resumed = client_class()
+    assert resumed.resume(*credentials)
+
+    assert resumed.session['token'] == client.session['token']
+    assert resumed.userinfo()['status_code'] == 200
+    assert server.bad_tokens == 0
+
+
+def test_async_client_flushes_off_the_event_loop(store, async_client_class):
+    async_client_class.SESSION_STORE = store
+    store.flush_interval = 0
+    flushed_in = []
+    flush = store.flush
+
+    def record_flush():
+        flushed_in.append(threading.current_thread())
+        flush()
+
+    store.flush = record_flush
+
+    async def run():
+        client = async_client_class()
+        await client.resume(*client.gen_new_credentials())
+        await client.userinfo()
+        return client
+
+    client = asyncio.run(run())
+
+    assert flushed_in
+    assert threading.main_thread() not in flushed_in
+    saved = store.load(client.SERVER_HOST, client.session['loginkey'])
+    assert saved['nonce'] == client.session['nonce']
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import hmac
+import logging
+
+import pytest
+
+from llsifclient import signing
+
+KEY = b'0123456789abcdef0123456789abcdef'
+BODY = b'{"response_data":{"user":{"name":"\\u5b66\\u9662"}},"status_code":200}'
+
+
+def reference(key, body):
+    return hmac.new(key, body, hashlib.sha1).hexdigest()
+
+
+@pytest.mark.parametrize('body', [b'', b'x', BODY, BODY * 1000])
+def test_sign_matches_hmac(body):
+    assert signing.MessageSigner(KEY).sign(body) == reference(KEY, body)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1 << 16])
+def test_verifier_streams_chunks(chunk_size):
+    body = BODY * 100
+    verifier = signing.MessageSigner(KEY).verifier()
+    for i in range(0, len(body), chunk_size):
+        verifier.update(memoryview(body)[i:i + chunk_size])
+
+    assert verifier.hexdigest() == reference(KEY, body)
+
+
+def test_signing_does_not_change_the_signer():
+    signer = signing.MessageSigner(KEY)
+    signer.sign(b'first')
+    verifier = signer.verifier()
+    verifier.update(b'second')
+
+    assert signer.sign(BODY) == reference(KEY, BODY)
+
+
+def test_buffered_verifier():
+    verifier = signing.BufferedVerifier(
+        lambda data: reference(b'other key', data))
+    for i in range(0, len(BODY), 5):
+        verifier.update(BODY[i:i + 5])
+
+    assert verifier.hexdigest() == reference(b'other key', BODY)
+
+
+def test_matches():
+    digest = reference(KEY, BODY)
+
+    assert signing.MessageSigner.matches(digest, digest)
+    assert not signing.MessageSigner.matches(digest, reference(KEY, b'x'))
+
+
+def test_signers_are_shared_per_key():
+    assert signing.get_signer(KEY) is signing.get_signer(KEY)
+    assert signing.get_signer(KEY) is not signing.get_signer(b'other key')
+
+
+class _Response(object):
+
+    def __init__(self, headers):
+        self._headers = headers
+
+    def getheader(self, name, default=None):
+        return self._headers.get(name, default)
+
+
+def test_overridden_signing_verifies_responses(client_class):
+    class Client(client_class):
+        def gen_xmessagecode(self, data):
+            return reference(b'other key', data)
+
+    verifier = Client().response_verifier(_Response({'X-Message-Code': 'x'}))
+    verifier.update(BODY)
+
+    assert verifier.hexdigest() == reference(b'other key', BODY)
+
+
+def test_responses_verify_against_the_server(client, caplog):
+    with caplog.at_level(logging.WARNING, logger='llsifclient'):
+        client.userinfo()
+
+    assert 'X-Message-Code incorrect' not in caplog.text
+
+
+def test_overridden_signing_is_used_both_ways(client_class, server, caplog):
+    signed = []
+
+    class Client(client_class):
+        def gen_xmessagecode(self, data):
+            signed.append(bytes(data))
+            return super().gen_xmessagecode(data)
+
+    client = Client()
+    with caplog.at_level(logging.WARNING, logger='llsifclient'):
+        client.startapp(*client.gen_new_credentials())
+
+    assert server.bad_signatures == 0
+    assert 'X-Message-Code incorrect' not in caplog.text
+    assert any(b'"response_data"' in data for data in signed)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from llsifclient import aioconn, connpool, transport
+from llsifclient.aioclient import AsyncLLSIFClient
+from llsifclient.client import LLSIFClient
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    '''Lets tests register engines without leaving them behind.'''
+
+    monkeypatch.setattr(transport, 'TRANSPORTS', dict(transport.TRANSPORTS))
+    monkeypatch.setattr(transport, 'ASYNC_TRANSPORTS',
+                        set(transport.ASYNC_TRANSPORTS))
+
+
+@pytest.mark.parametrize('name, pool_class', [
+    ('stdlib', connpool.HTTPConnectionPool),
+    ('socket', transport.TunedConnectionPool),
+])
+def test_sync_engines(name, pool_class):
+    pool = transport.get_pool(name, 'engines.example:80')
+
+    assert type(pool) is pool_class
+    assert transport.get_pool(name, 'engines.example:80') is pool
+
+
+def test_async_engine():
+    async def get_pool():
+        return transport.get_pool('async', 'engines.example:80',
+                                  asynchronous=True)
+
+    assert isinstance(asyncio.run(get_pool()),
+                      aioconn.AsyncHTTPConnectionPool)
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError, match='Unknown transport'):
+        transport.get_pool('carrier-pigeon', 'engines.example:80')
+
+
+@pytest.mark.parametrize('name, asynchronous', [
+    ('async', False),
+    ('stdlib', True),
+    ('socket', True),
+])
+def test_engine_of_the_wrong_kind(name, asynchronous):
+    with pytest.raises(ValueError, match='can not be used'):
+        transport.get_pool(name, 'engines.example:80',
+                           asynchronous=asynchronous)
+
+
+def test_register_transport(registry):
+    pools = []
+
+    def get_pool(host, connect_timeout, read_timeout, maxsize, adaptive):
+        pools.append((host, connect_timeout, read_timeout, maxsize, adaptive))
+        return pools
+
+    transport.register_transport('custom', get_pool)
+
+    assert transport.get_pool('custom', 'h:1', 1, 2, 3, True) is pools
+    assert pools == [('h:1', 1, 2, 3, True)]
+    with pytest.raises(ValueError):
+        transport.get_pool('custom', 'h:1', asynchronous=True)
+
+    transport.register_transport('custom', get_pool, asynchronous=True)
+
+    assert transport.get_pool('custom', 'h:1', asynchronous=True) is pools
+    with pytest.raises(ValueError):
+        transport.get_pool('custom', 'h:1')
+
+
+def test_clients_check_their_engine():
+    class SyncClient(LLSIFClient):
+        TRANSPORT = 'async'
+
+    class AsyncClient(AsyncLLSIFClient):
+        TRANSPORT = 'socket'
+
+    class UnknownClient(LLSIFClient):
+        TRANSPORT = 'carrier-pigeon'
+
+    for client_class in (SyncClient, AsyncClient, UnknownClient):
+        with pytest.raises(ValueError):
+            client_class()
+
+
+def test_engine_changed_after_creation(client):
+    type(client).TRANSPORT = 'async'
+
+    with pytest.raises(ValueError):
+        client.userinfo()
+
+
+def test_socket_engine(client_class, server):
+    client_class.TRANSPORT = 'socket'
+    client = client_class()
+    client.startapp(*client.gen_new_credentials())
+
+    assert client.userinfo()['status_code'] == 200